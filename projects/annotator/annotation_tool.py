@@ -2,22 +2,39 @@
 Annotator Tool
 This script provides an annotator tool for labeling data in a given input file.
 Usage:
-	python annotation_tool.py <input> [--output <output>] [--values <values>] [--start_idx <start_idx>]
+	python annotation_tool.py <input> [--output <output>] [--values <value> ...] [--start_idx <start_idx>]
 Arguments:
 	<input>                 Path to the input file.
 Options:
 	--output <output>       Path to save the annotated results. Default is 'validation_multi-label.jsonl'.
-	--values <values>       List of values to choose from for annotations. Default is ['nb', 'nn', 'da', 'sv', 'other'].
+	--values <value> ...    Values to choose from for annotations. Default is ['nb', 'nn', 'da', 'sv', 'other'].
+	--schema <path>         JSON label schema with groups, keys and aliases, see `schema.py`. Replaces --values.
 	--start_idx <start_idx> Index of the start instance. Default is 0.
+	--resume                Continue after the last instance in the output file, instead of --start_idx.
+	--batch_size <n>        Number of results saved to the output file at a time. Default is 20.
+	--shard <i/n>           Only annotate shard i of n, e.g. one per annotator, see `shards.py`.
+	--overlap <fraction>    Fraction of instances in every shard, to measure agreement. Default is 0.
+	--order <order>         'sequential' or 'uncertainty', see `ordering.py`. Default is 'sequential'.
+	--rerank_every <n>      Number of results between two re-rankings of the uncertainty order. Default is 20.
+	--auto_accept <conf>    Accept suggestions from `prelabel.py` with at least this confidence without showing them.
+	--no_telemetry          Do not log the time spent on every item to <output>.telemetry.jsonl, see `telemetry.py`.
 """
 
-import json
-import pandas as pd
-
 from argparse import ArgumentParser
 from annotator import Annotator
+from dataset import JsonlDataset
+from ordering import UncertaintyOrder, get_labeled
+from prelabel import Suggestions
+from schema import LabelSchema
+from shards import ShardDataset, parse_shard
+from telemetry import SessionTelemetry, get_telemetry_path
+from writer import get_resume_index
 
-if __name__ == "__main__":
+
+def main(argv: list[str] = None) -> None:
+    """
+    Parses the command line and runs the Annotator until its window is closed.
+    """
     parser = ArgumentParser()
     parser.add_argument("input", type=str, help="Path to input file.")
     parser.add_argument(
@@ -28,16 +45,114 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--values",
-        type=list,
+        type=str,
+        nargs="+",
         default=["nb", "nn", "da", "sv", "other"],
         help="What to choose from for annotations",
     )
+    parser.add_argument(
+        "--schema",
+        type=str,
+        default=None,
+        help="JSON label schema with groups and keys, see schema.py, instead of --values.",
+    )
     parser.add_argument(
         "--start_idx", "-i", type=int, default=0, help="Index of the start instance."
     )
+    parser.add_argument(
+        "--resume",
+        "-r",
+        action="store_true",
+        help="Continue after the last instance in the output file, instead of --start_idx.",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=20,
+        help="Number of results saved to the output file at a time.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        help="Only annotate shard i of n, given as i/n, e.g. one per annotator.",
+    )
+    parser.add_argument(
+        "--overlap",
+        type=float,
+        default=0.0,
+        help="Fraction of instances in every shard, to measure agreement.",
+    )
+    parser.add_argument(
+        "--order",
+        type=str,
+        choices=["sequential", "uncertainty"],
+        default="sequential",
+        help="Show the instances in file order, or the ones the model is least certain about first.",
+    )
+    parser.add_argument(
+        "--rerank_every",
+        type=int,
+        default=20,
+        help="Number of results between two re-rankings of the uncertainty order.",
+    )
+    parser.add_argument(
+        "--auto_accept",
+        type=float,
+        default=None,
+        help="Accept suggestions from prelabel.py with at least this confidence without showing them.",
+    )
+    parser.add_argument(
+        "--no_telemetry",
+        action="store_true",
+        help="Do not log the time spent on every item, see telemetry.py.",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.schema is not None:
+        schema = LabelSchema.from_file(args.schema)
+    else:
+        schema = LabelSchema.from_values(args.values)
+
+    # The input is memory-mapped and only decoded one record at a time
+    data = JsonlDataset(args.input)
 
-    args = parser.parse_args()
-    df = pd.DataFrame([json.loads(line) for line in open(args.input, "r")])
+    # Pre-checked if the input has been pre-labeled and not changed since, see `prelabel.py`
+    suggestions = Suggestions.for_input(data, schema.values)
 
-    a = Annotator(df, args.values, args.output, start_idx=args.start_idx)
+    if args.shard is not None:
+        data = ShardDataset(data, *args.shard, overlap=args.overlap)
+
+    if args.resume:
+        args.start_idx = get_resume_index(args.output)
+        if args.shard is not None:
+            args.start_idx = data.get_position(args.start_idx)
+
+    telemetry = None
+    if not args.no_telemetry:
+        telemetry = SessionTelemetry(get_telemetry_path(args.output))
+
+    order = None
+    if args.order == "uncertainty":
+        # Starts from the results so far, which are not shown again
+        labeled = get_labeled(args.output)
+        order = UncertaintyOrder(data, schema.values, args.rerank_every, labeled)
+        args.start_idx = 0
+
+    a = Annotator(
+        data,
+        schema,
+        args.output,
+        start_idx=args.start_idx,
+        batch_size=args.batch_size,
+        order=order,
+        suggestions=suggestions,
+        auto_accept=args.auto_accept,
+        telemetry=telemetry,
+    )
     a.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,116 +7,359 @@ Class Attributes:
 	annotator_width (int): The width of the annotator.
 	annotator_wraplength (int): The wrap length of the annotator.
 	annotator_side_pad (int): The side padding of the annotator.
+	annotator_columns (int): The largest number of checkboxes in a row.
 Instance Variables:
-	df (pd.DataFrame): The input DataFrame containing the text data to be annotated.
-	values (list[str]): The list of values to choose from for annotations.
+	data (JsonlDataset | DataFrameDataset): The input data containing the text to be annotated, see `dataset.py`.
+	schema (LabelSchema): The labels to choose from and their key sequences, see `schema.py`.
+	values (list[str]): The list of values to choose from for annotations, the leaves of the schema.
 	output (str): The path to save the annotated results.
+	writer (AnnotationWriter): The buffered writer for the annotated results, see `writer.py`.
+	pipeline (Prefetcher): Prepares the next instances in the background, see `pipeline.py`.
+	order (SequentialOrder | UncertaintyOrder | None): The order the instances are shown in, see `ordering.py`. File order if None.
+	suggestions (Suggestions | None): The suggested labels which are pre-checked, see `prelabel.py`.
+	auto_accept (float | None): The confidence above which suggestions are accepted without showing the instance.
+	telemetry (SessionTelemetry | None): Logs the dwell time, keystrokes and render latency of every item, see `telemetry.py`.
+	record (dict): The instance at the current index.
 	title (str): The title of the annotator GUI window.
 	display_data (list[str]): The list of columns to display as metadata.
 	start_idx (int): The index of the start instance.
 	labels (dict[str, Label]): A dictionary mapping feature names to Label objects for displaying metadata.
 	selected (list[str]): The list of selected annotations.
-	checkboxes (list[Checkbutton]): The list of Checkbutton objects for selecting annotations.
+	checkboxes (list[Checkbutton]): The Checkbutton objects for selecting annotations, reused for every group of labels.
+	group (LabelNode): The group of labels shown, the root of the schema for the top level.
+	shown (list[LabelNode]): The labels or groups of labels shown by the checkboxes.
+	pending (str): The keys typed so far of a key sequence.
 	submit (Button): The Button object for submitting the annotations.
+	search (Entry): The Entry for searching labels by name, opened with "/".
+	status (Label): Shows the selected annotations and the pending keys.
 Methods:
-	__init__(self, df, values, output, title, display_data, start_idx)
+	__init__(self, data, values, output, title, display_data, start_idx)
 		Initializes the Annotator object.
 	_get_input_row(self)
 		Creates the input row of checkboxes and submit button.
+	_get_search_row(self)
+		Creates the search entry and the status label.
 	_get_labels(self)
 		Creates the labels for displaying text and metadata.
-	on_checkbox_click(self, val)
+	on_checkbox_click(self, i)
 		Handles the checkbox click event.
+	on_key(self, key)
+		Handles a keystroke of a key sequence.
+	show_group(self, group)
+		Shows the labels of a group in the checkboxes.
 	on_submit(self)
 		Handles the submit button click event including saving results, resetting the annotation checkboxes, and updating labels with the next instance.
+	show_instance(self)
+		Shows the instance at the current index with its suggestion pre-checked, or accepts the suggestion.
 	update_labels(self)
 		Updates the labels with new data.
+	on_close(self)
+		Saves the buffered results and closes the window.
+
+AnnotationSession holds the submit cycle, which HeadlessAnnotator runs without Tk, e.g. to test or benchmark on a server.
   
 TODOs:
 - Make `on_submit` more robust to handle different outputs
-- Fix the keybinding for checkboxes in `__init__`, currently set to 5 bindings and done manually 
 - TODO: Add save state button and log
 """
 
-import json
+import time
 import pandas as pd
 
-from argparse import ArgumentParser
+from abc import ABC, abstractmethod
 from tkinter import *
 
+from dataset import DataFrameDataset, JsonlDataset, get_dataset
+from ordering import OrderedDataset, SequentialOrder, UncertaintyOrder
+from pipeline import Prefetcher
+from prelabel import Suggestions
+from schema import LabelNode, LabelSchema, get_schema
+from telemetry import SessionTelemetry
+from writer import AnnotationWriter
+
+
+class AnnotationSession(ABC):
+    """
+    The annotation session shared by the `Annotator` and the `HeadlessAnnotator`:
+    the data, output, order, suggestions and telemetry, and the cycle of showing
+    an instance, saving its labels and moving on to the next.
+
+    Subclasses show the instance in `_render_labels` and the selected labels in
+    `_sync_checkboxes`, and set up `labels`, `selected` and `pipeline`.
+    """
+
+    def _init_session(
+        self,
+        data: pd.DataFrame | JsonlDataset | DataFrameDataset | str,
+        values: list[str] | LabelSchema,
+        output: str,
+        display_data: list[str],
+        start_idx: int,
+        batch_size: int,
+        flush_interval: float,
+        order: SequentialOrder | UncertaintyOrder,
+        suggestions: Suggestions,
+        auto_accept: float,
+        telemetry: SessionTelemetry,
+    ) -> None:
+        """
+        Sets up the data and output.
+        """
+        # Records are only decoded when they are shown, see `dataset.py`
+        data = get_dataset(data)
+        if order is not None:
+            # Positions in the queue instead of the file, see `ordering.py`
+            data = OrderedDataset(data, order)
+
+        if display_data is None:
+            display_data = data.columns
+
+        assert "text" in display_data, "Annotator requires 'text' column"
+
+        self.data = data
+        self.output = output
+        self.writer = AnnotationWriter(output, batch_size, flush_interval)
+
+        self.display_data = display_data
+        self.schema = get_schema(values)
+        self.values = self.schema.values
+        self.order = order
+        self.suggestions = suggestions
+        self.auto_accept = auto_accept
+        self.telemetry = telemetry
+        self.start_idx = self.current_idx = start_idx
+
+    @abstractmethod
+    def _render_labels(self, texts: dict[str, str]) -> None:
+        """
+        Shows the formatted text of every feature of the current instance.
+        """
+
+    @abstractmethod
+    def _sync_checkboxes(self) -> None:
+        """
+        Shows the selected labels.
+        """
 
-class Annotator(Tk):
+    def on_submit(self) -> None:
+        """
+        Handles the submission of the annotator checkboxes.
+                - Saves the selected labels, languages, and the original language to a JSON file.
+                - Resets the selected list and unchecks the checkboxes.
+                - Updates the current index and updates the labels with
+                        information about the next instance.
+
+        NOTE: Currently only supports the specific setup for my purpose
+        """
+        if self.record is None:
+            return  # Every instance has been annotated
+
+        self._save_result()
+
+        # Update labels
+        self.current_idx += 1
+        self.show_instance()
+
+    def _save_result(self, auto: bool = False) -> None:
+        """
+        Saves the selected labels for the current instance and resets the selection.
+        """
+        # Save to res file
+        # TODO: Make this more robust to handle different outputs
+        res = {
+            "working_index": self.record["working_index"],
+            "text": self.record["text"],
+            "languages": self.selected,
+            "original": self.record.get("languages"),
+        }
+        if auto:
+            res["auto"] = True
+
+        self.writer.write(res)
+        if self.telemetry is not None:
+            self.telemetry.end_item(len(self.selected), auto)
+        if self.order is not None:
+            self.order.observe(res["working_index"], self.selected)
+
+        # Reset selected list
+        self.selected = []
+
+        # Uncheck the check boxes
+        self._sync_checkboxes()
+
+    def show_instance(self) -> None:
+        """
+        Shows the instance at the current index with its suggestion pre-checked,
+        after accepting the suggestions with a confidence of at least `auto_accept`.
+        """
+        while self.current_idx < len(self.data):
+            self.update_labels()
+            if not self._apply_suggestion():
+                return
+            self._save_result(auto=True)
+            self.current_idx += 1
+
+        self._show_end()
+
+    def _show_end(self) -> None:
+        """
+        Shows that every instance has been annotated, and saves the results so far.
+        """
+        self.record = None
+        texts = {feature: "" for feature in self.labels}
+        texts["text"] = "All instances have been annotated."
+        self._render_labels(texts)
+
+        self.writer.flush()
+        if self.telemetry is not None:
+            self.telemetry.writer.flush()
+
+    def _apply_suggestion(self) -> bool:
+        """
+        Pre-checks the suggested labels of the current instance, see `prelabel.py`.
+
+        Returns:
+                bool: Whether the suggestion should be accepted without showing the instance.
+        """
+        if self.suggestions is None:
+            return False
+
+        labels, confidence = self.suggestions.get(self.record["working_index"])
+        self.selected = [value for value in self.values if value in labels]
+        self._sync_checkboxes()
+
+        return self.auto_accept is not None and confidence >= self.auto_accept
+
+    def update_labels(self) -> None:
+        """
+        Update the labels with the corresponding values from the data for the instance at the current index.
+        """
+        start = time.perf_counter()
+        self.record, texts = self.pipeline.get(self.current_idx)
+        self._render_labels(texts)
+
+        if self.telemetry is not None:
+            self.telemetry.start_item(
+                self.record["working_index"], time.perf_counter() - start
+            )
+
+    def _close_session(self) -> None:
+        """
+        Stops the background work and saves the buffered results.
+        """
+        self.pipeline.close()
+        if self.order is not None:
+            self.order.close()
+        self.writer.close()
+        if self.telemetry is not None:
+            self.telemetry.close()
+
+
+class Annotator(AnnotationSession, Tk):
     annotator_font: tuple = ("Helvetica", 18, "")
     annotator_width: int = 50
     annotator_wraplength: int = 500
     annotator_side_pad: int = 5
     annotator_background: str = "gray70"
+    annotator_columns: int = 8
 
     def __init__(
         self,
-        df: pd.DataFrame,
-        values: list[str],
+        data: pd.DataFrame | JsonlDataset | DataFrameDataset | str,
+        values: list[str] | LabelSchema,
         output: str,
         title: str = "Annotator",
         display_data: list[str] = None,
         start_idx: int = 0,
+        batch_size: int = 20,
+        flush_interval: float = 30.0,
+        prefetch: int = 8,
+        order: SequentialOrder | UncertaintyOrder = None,
+        suggestions: Suggestions = None,
+        auto_accept: float = None,
+        telemetry: SessionTelemetry = None,
     ) -> None:
         super().__init__()
         self.title(title)
         self.configure(background=self.annotator_background)
 
-        df["working_index"] = [i for i in range(len(df))]
-
-        if display_data is None:
-            display_data = df.columns
-
-        assert "text" in display_data, "Annotator requires 'text' column"
-
-        self.df = df
-        self.output = output
-
-        self.display_data = display_data
-        self.values = values
-        self.start_idx = self.current_idx = start_idx
+        self._init_session(
+            data,
+            values,
+            output,
+            display_data,
+            start_idx,
+            batch_size,
+            flush_interval,
+            order,
+            suggestions,
+            auto_accept,
+            telemetry,
+        )
         self.labels = self._get_labels()
         self.selected = []
         self.checkboxes, self.submit = self._get_input_row()
+        self.search, self.status = self._get_search_row()
+        self.show_group(self.schema.root)
+
+        # Decoding and formatting the next instances happens in the background
+        self.pipeline = Prefetcher(self.data, list(self.labels), start_idx, prefetch)
 
         # Bind keystrokes
         self.bind("<Return>", lambda _: self.submit.invoke())
         self.bind("<KP_Enter>", lambda _: self.submit.invoke())
 
-        # NOTE: something weird happens when I try to bind in a loop,
-        # so doing this manually for now
-        self.bind("1", lambda _: self.checkboxes[0].invoke())
-        self.bind("2", lambda _: self.checkboxes[1].invoke())
-        self.bind("3", lambda _: self.checkboxes[2].invoke())
-        self.bind("4", lambda _: self.checkboxes[3].invoke())
-        self.bind("5", lambda _: self.checkboxes[4].invoke())
+        # The key is a default argument, since a lambda in a loop otherwise
+        # sees the key of the last iteration when it is called
+        keys = {key for sequence in self.schema.sequences for key in sequence}
+        for key in sorted(keys):
+            self.bind(key, lambda _, key=key: self.on_key(key))
+        self.bind("<Escape>", lambda _: self.show_group(self.schema.root))
+        self.bind("<BackSpace>", lambda _: self.on_back())
+        self.bind("<slash>", lambda _: self.open_search())
+
+        # Keystrokes are counted before the window bindings, which may submit the item
+        for widget in [self, self.search]:
+            widget.bindtags(("telemetry",) + widget.bindtags())
+        self.bind_class("telemetry", "<Key>", lambda _: self._on_keystroke())
+
+        # Save the buffered results when the window is closed, and flush them
+        # periodically in case the session is left open
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self._flush_periodically()
 
-        self.update_labels()
+        self.show_instance()
+
+    def _get_n_columns(self) -> int:
+        return max(min(self.schema.width, self.annotator_columns), 1)
 
     def _get_input_row(self) -> tuple[list[Checkbutton], Button]:
         """
-        Instantiates the checkbox `Checkbutton`s and submit `Button` for annotation input row.
+        Instantiates the checkbox `Checkbutton`s and submit `Button` for annotation input rows.
+
+        There is one checkbox per label of the largest group in the schema,
+        and they are relabeled for the group shown, so the number of widgets
+        does not grow with the number of labels.
 
         Returns:
                 tuple[list[Checkbutton], Button]: A tuple containing:
-                        - a list of Checkbutton objects, one for each annotation value
+                        - a list of Checkbutton objects, `annotator_columns` per row
                 - a Button object for submitting annotations
         """
 
         input_row = self.grid_size()[1]
+        n_columns = self._get_n_columns()
         checkboxes = []
-        for i, val in enumerate(self.values):
+        for i in range(self.schema.width):
             var = IntVar()
             checkbox = Checkbutton(
                 self,
-                text=val,
                 variable=var,
-                command=lambda val=val: self.on_checkbox_click(val),
+                command=lambda i=i: self.on_checkbox_click(i),
+            )
+            checkbox.grid(
+                row=input_row + i // n_columns, column=i % n_columns, sticky=E
             )
-            checkbox.grid(row=input_row, column=i, sticky=E)
             checkbox.configure(
                 background=self.annotator_background, highlightthickness=0, bd=0
             )
@@ -127,13 +370,37 @@ class Annotator(Tk):
             command=self.on_submit,
             width=self.annotator_width // 5,
         )
-        submit.grid(row=input_row, column=len(self.values))
+        submit.grid(row=input_row, column=n_columns)
         submit.configure()
 
+        return checkboxes, submit
+
+    def _get_search_row(self) -> tuple[Entry, Label]:
+        """
+        Instantiates the search `Entry` and the status `Label` below the checkboxes.
+
+        Returns:
+                tuple[Entry, Label]: A tuple containing:
+                        - an Entry object for searching labels by name
+                - a Label object showing the selected annotations
+        """
+
+        search_row = self.grid_size()[1]
+        search = Entry(self, width=self.annotator_width // 5)
+        search.grid(row=search_row, column=0, sticky=W)
+        search.bind("<KeyRelease>", lambda _: self.on_search())
+        search.bind("<Return>", lambda _: self.on_search_submit())
+        search.bind("<KP_Enter>", lambda _: self.on_search_submit())
+        search.bind("<Escape>", lambda _: self.close_search())
+
+        status = Label(self, text="")
+        status.grid(row=search_row, column=1, columnspan=self._get_n_columns())
+        status.configure(background=self.annotator_background)
+
         # Add a buffer row between inputs and the edge of the window
-        self.grid_rowconfigure(input_row + 1, minsize=10)
+        self.grid_rowconfigure(search_row + 1, minsize=10)
 
-        return checkboxes, submit
+        return search, status
 
     def _get_labels(self) -> dict[str:Label]:
         """
@@ -170,7 +437,7 @@ class Annotator(Tk):
 
         # Setup Text Label
         main_label = Label(self, text="")
-        main_label.grid(row=2, column=0, columnspan=len(self.values) + 1)
+        main_label.grid(row=2, column=0, columnspan=self._get_n_columns() + 1)
         main_label.configure(
             font=self.annotator_font,
             width=self.annotator_width,
@@ -190,7 +457,7 @@ class Annotator(Tk):
 
             label_value = Label(self, text="")
             label_value.grid(
-                row=i + _exisiting_n_rows, column=1, columnspan=len(self.values)
+                row=i + _exisiting_n_rows, column=1, columnspan=self._get_n_columns()
             )
             label_value.configure(
                 font=self.annotator_font,
@@ -204,82 +471,214 @@ class Annotator(Tk):
 
         return labels
 
-    def on_checkbox_click(self, val: str) -> None:
+    def on_checkbox_click(self, i: int) -> None:
+        """
+        Handles the click event of a checkbox, which selects its label or shows its group.
+        Parameters:
+                i (int): The index of the checkbox.
+        """
+
+        if self.telemetry is not None:
+            self.telemetry.click()
+
+        node = self.shown[i]
+        if node.is_leaf:
+            self.toggle(node.name)
+        else:
+            self.show_group(node)
+
+    def toggle(self, val: str) -> None:
         """
-        Handles the click event of a checkbox and updates the selected features for the annotation, `self.selected`.
+        Updates the selected features for the annotation, `self.selected`.
         Parameters:
-                val (str): The value of the checkbox.
+                val (str): The value selected or deselected.
         """
 
         if val in self.selected:
             self.selected.remove(val)
         else:
             self.selected.append(val)
-        print(self.selected)
+        self._sync_checkboxes()
 
-    def on_submit(self) -> None:
+    def _on_keystroke(self) -> None:
+        if self.telemetry is not None:
+            self.telemetry.keystroke()
+
+    def on_key(self, key: str) -> None:
         """
-        Handles the submission of the annotator checkboxes.
-                - Saves the selected labels, languages, and the original language to a JSON file.
-                - Resets the selected list and unchecks the checkboxes.
-                - Updates the current index and updates the labels with
-                        information about the next instance.
+        Handles a keystroke of a key sequence, see `schema.py`. A complete
+        sequence selects its label, and the prefix of a group shows the group.
+        """
+        if self.searching:
+            return  # Typed into the search
+
+        node = self.schema.sequences.get(self.pending + key)
+        if node is None:
+            # Not a continuation of the pending keys, so it starts a new sequence
+            node = self.schema.sequences.get(key)
+
+        if node is None:
+            self.show_group(self.schema.root)
+        elif node.is_leaf:
+            self.toggle(node.name)
+            self.show_group(self.schema.root)
+        else:
+            self.show_group(node)
 
-        NOTE: Currently only supports the specific setup for my purpose
+    def on_back(self) -> None:
+        if not self.searching:
+            self.show_group(self.schema.get_parent(self.group))
+
+    def show_group(self, group: LabelNode) -> None:
         """
-        # Save to res file
-        # TODO: Make this more robust to handle different outputs
-        res = {
-            "text": self.labels["text"]["text"],
-            "languages": self.selected,
-            "original": self.df.iloc[self.current_idx]["languages"],
-        }
+        Shows the labels of a group, or of the top level for the root of the schema.
+        """
+        self.group = group
+        self.pending = group.sequence
+        self._show_nodes(group.children)
 
-        with open(self.output, "a") as f:
-            json.dump(res, f)
-            f.write("\n")
+    def _show_nodes(self, nodes: list[LabelNode]) -> None:
+        """
+        Relabels the checkboxes for the labels, and hides the ones left over.
+        """
+        self.shown = nodes[: len(self.checkboxes)]
+        for i, checkbox in enumerate(self.checkboxes):
+            if i < len(self.shown):
+                node = self.shown[i]
+                text = f"{node.sequence} {node.name}" + ("" if node.is_leaf else " ▸")
+                checkbox.configure(text=text)
+                checkbox.grid()
+            else:
+                checkbox.grid_remove()
+        self._sync_checkboxes()
+
+    def _sync_checkboxes(self) -> None:
+        """
+        Checks the checkboxes of the selected labels, and of groups with a selected label.
+        """
+        for node, checkbox in zip(self.shown, self.checkboxes):
+            if any(value in node.values for value in self.selected):
+                checkbox.select()
+            else:
+                checkbox.deselect()
+        self.status["text"] = " ".join(
+            [", ".join(self.selected)] + ([f"[{self.pending}]"] if self.pending else [])
+        )
 
-        # Reset selected list
-        self.selected = []
+    def _render_labels(self, texts: dict[str, str]) -> None:
+        for feature, label in self.labels.items():
+            label["text"] = texts[feature]
+        # Redraws the window now instead of when idle, so the render latency
+        # logged by the telemetry includes drawing the instance
+        self.update_idletasks()
 
-        # Uncheck the check boxes
-        for checkbox in self.checkboxes:
-            checkbox.deselect()
+    @property
+    def searching(self) -> bool:
+        return self.focus_get() is self.search
 
-        # Update labels
-        self.current_idx += 1
-        self.update_labels()
+    def open_search(self) -> None:
+        if not self.searching:
+            self.search.delete(0, END)
+            self.search.focus_set()
 
-    def update_labels(self) -> None:
+    def on_search(self) -> None:
+        """
+        Shows the labels matching the search.
+        """
+        query = self.search.get()
+        if query.strip():
+            self._show_nodes(self.schema.search(query, len(self.checkboxes)))
+        else:
+            self.show_group(self.schema.root)
+
+    def on_search_submit(self) -> str:
         """
-        Update the labels with the corresponding values from the dataframe for the instance at the current index.
+        Selects the best match of the search and closes it.
         """
-        i = self.current_idx
+        matches = self.schema.search(self.search.get(), 1)
+        if matches:
+            self.toggle(matches[0].name)
+        return self.close_search()
+
+    def close_search(self) -> str:
+        self.search.delete(0, END)
+        self.focus_set()
+        self.show_group(self.schema.root)
+        # Keeps the window bindings, e.g. submitting on Return, from handling the key too
+        return "break"
+
+    def _flush_periodically(self) -> None:
+        self.writer.flush_if_due()
+        if self.telemetry is not None:
+            self.telemetry.writer.flush_if_due()
+        self.after(int(self.writer.flush_interval * 1000), self._flush_periodically)
+
+    def on_close(self) -> None:
+        """
+        Saves the buffered results before the window is closed.
+        """
+        self._close_session()
+        self.destroy()
+
+
+class HeadlessAnnotator(AnnotationSession):
+    """
+    The submit cycle of the `Annotator` without Tk, so it runs without a display.
+
+    The labels are dicts with the formatted "text" of each feature, and the
+    annotations are chosen with `select` instead of checkboxes.
+    """
+
+    def __init__(
+        self,
+        data: pd.DataFrame | JsonlDataset | DataFrameDataset | str,
+        values: list[str] | LabelSchema,
+        output: str,
+        display_data: list[str] = None,
+        start_idx: int = 0,
+        batch_size: int = 20,
+        flush_interval: float = 30.0,
+        prefetch: int = 8,
+        order: SequentialOrder | UncertaintyOrder = None,
+        suggestions: Suggestions = None,
+        auto_accept: float = None,
+        telemetry: SessionTelemetry = None,
+    ) -> None:
+        self._init_session(
+            data,
+            values,
+            output,
+            display_data,
+            start_idx,
+            batch_size,
+            flush_interval,
+            order,
+            suggestions,
+            auto_accept,
+            telemetry,
+        )
+        self.labels = {feature: {"text": ""} for feature in self.display_data}
+        self.selected = []
+        self.pipeline = Prefetcher(self.data, list(self.labels), start_idx, prefetch)
+
+        self.show_instance()
+
+    def select(self, values: list[str]) -> None:
+        self.selected = list(values)
+
+    def _render_labels(self, texts: dict[str, str]) -> None:
         for feature, label in self.labels.items():
-            label["text"] = self.df.iloc[i][feature]
+            label["text"] = texts[feature]
+
+    def _sync_checkboxes(self) -> None:
+        pass  # There are no checkboxes without Tk
+
+    def close(self) -> None:
+        self._close_session()
 
 
 if __name__ == "__main__":
-    parser = ArgumentParser()
-    parser.add_argument("input", type=str, help="Path to input file.")
-    parser.add_argument(
-        "--output",
-        type=str,
-        default="validation_multi-label.jsonl",
-        help="Where to save the results.",
-    )
-    parser.add_argument(
-        "--values",
-        type=list,
-        default=["nb", "nn", "da", "sv", "other"],
-        help="What to choose from for annotations",
-    )
-    parser.add_argument(
-        "--start_idx", "-i", type=int, default=0, help="Index of the start instance."
-    )
-
-    args = parser.parse_args()
-    df = pd.DataFrame([json.loads(line) for line in open(args.input, "r")])
-
-    a = Annotator(df, args.values, args.output, start_idx=args.start_idx)
-    a.mainloop()
+    # The command line is in annotation_tool.py, so there is only one to keep up to date
+    from annotation_tool import main
+
+    main()
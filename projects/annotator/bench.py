@@ -0,0 +1,343 @@
+"""
+Benchmarks for the annotator, run headless on synthetic data.
+
+Usage:
+    python bench.py navigation [--items 2000] [--columns 10 200]
+    python bench.py pipeline [--items 500] [--columns 200] [--think 0.002]
+    python bench.py ordering [--labeled data.jsonl] [--budget 600] [--step 50]
+    python bench.py prelabel [--lines 200000] [--noise 0.05] [--workers 1 4]
+"""
+
+import json
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from argparse import ArgumentParser
+from pathlib import Path
+
+from annotator import HeadlessAnnotator
+from dataset import DataFrameDataset, JsonlDataset
+from model import NgramNaiveBayes, get_ngram_features, take_rows
+from ordering import UncertaintyOrder
+from prelabel import Suggestions, prelabel
+
+VALUES = ["nb", "nn", "da", "sv", "other"]
+
+# Small vocabularies with the overlap between the languages which makes them hard to tell apart
+_WORDS = {
+    "nb": "jeg ikke hva hvordan noe skal hun de er vi hvem hvorfor også bare mye hjem etter kanskje".split(),
+    "nn": "eg ikkje kva korleis noko skal ho dei er vi kven kvifor òg berre mykje heim etter kanskje".split(),
+    "da": "jeg ikke hvad hvordan noget skal hun de er vi hvem hvorfor også bare meget hjem efter måske".split(),
+    "sv": "jag inte vad hur något ska hon de är vi vem varför också bara mycket hem efter kanske".split(),
+    "other": "i not what how something shall she they are we who why also just much home after maybe".split(),
+}
+_SHARED = "oslo 2024 bergen per kari ok".split()
+
+
+class _IlocDataset(DataFrameDataset):
+    """The previous access path, one `iloc` row lookup per read."""
+
+    def get(self, i: int, feature: str):
+        if feature == "working_index":
+            return i
+        return self.df.iloc[i][feature]
+
+    def __getitem__(self, i: int) -> dict:
+        return _IlocRecord(self, i)
+
+
+class _IlocRecord:
+    def __init__(self, data: _IlocDataset, i: int) -> None:
+        self.data = data
+        self.i = i
+
+    def get(self, feature: str):
+        return self.data.get(self.i, feature)
+
+    def __getitem__(self, feature: str):
+        return self.get(feature)
+
+
+def _get_synthetic_df(
+    n_items: int, n_columns: int, text_length: int = 30
+) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    sentence = "Dette er setning nummer {}. "
+    columns = {
+        "text": [
+            (sentence.format(i) * (text_length // len(sentence) + 1))[:text_length]
+            for i in range(n_items)
+        ],
+        "languages": [[VALUES[j]] for j in rng.integers(0, 5, size=n_items)],
+    }
+    for c in range(n_columns - len(columns)):
+        columns[f"meta_{c}"] = (
+            rng.random(n_items) if c % 2 else rng.integers(0, 100, n_items)
+        )
+    return pd.DataFrame(columns)
+
+
+def _get_synthetic_labeled(n_items: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Texts drawn from the vocabulary of one language, or two for every tenth text.
+    """
+    rng = np.random.default_rng(seed)
+    languages = rng.choice(VALUES, size=n_items, p=[0.5, 0.2, 0.12, 0.12, 0.06])
+    texts, labels = [], []
+    for language in languages:
+        chosen = [language]
+        if rng.random() < 0.1:
+            chosen.append(rng.choice([v for v in VALUES if v != language]))
+        words = [
+            rng.choice(_WORDS[chosen[k % len(chosen)]] + _SHARED)
+            for k in range(rng.integers(3, 10))
+        ]
+        texts.append(" ".join(words))
+        labels.append(sorted(chosen))
+    return pd.DataFrame({"text": texts, "languages": labels})
+
+
+def _get_scores(
+    train: tuple[np.ndarray, np.ndarray],
+    y_train: np.ndarray,
+    test: tuple[np.ndarray, np.ndarray],
+    y_test: np.ndarray,
+) -> tuple[float, float]:
+    """
+    Trains a fresh model and returns its exact match accuracy and macro F1 on the test set.
+    """
+    model = NgramNaiveBayes(VALUES)
+    model.partial_fit(*train, y_train)
+    predicted = model.predict_proba(*test) > 0.5
+
+    exact = (predicted == y_test).all(axis=1).mean()
+    tp = (predicted & y_test).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f1 = np.nan_to_num(2 * tp / (predicted.sum(axis=0) + y_test.sum(axis=0)))
+    return exact, f1.mean()
+
+
+def _time_navigation(a: HeadlessAnnotator, n_items: int) -> float:
+    """
+    Runs the reads of the submit-and-show-next loop for `n_items` items.
+
+    Returns:
+            float: Items per second.
+    """
+    start = time.perf_counter()
+    for i in range(n_items):
+        a.current_idx = i
+        a.update_labels()
+        a.record.get("languages")  # The "original" of the result
+    return n_items / (time.perf_counter() - start)
+
+
+def bench_navigation(n_items: int, columns: list[int]) -> None:
+    """
+    Compares per-row `iloc` reads to the columnar `DataFrameDataset` and the
+    memory-mapped `JsonlDataset` for the navigation loop.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_columns in columns:
+            df = _get_synthetic_df(n_items, n_columns)
+            path = Path(tmp) / f"items_{n_columns}.jsonl"
+            df.to_json(path, orient="records", lines=True)
+
+            datasets = {
+                "iloc": _IlocDataset(df),
+                "columnar DataFrame": DataFrameDataset(df),
+                "memory-mapped JSONL": JsonlDataset(path),
+            }
+            for name, data in datasets.items():
+                # Items are prepared on access, to time only the reads
+                a = HeadlessAnnotator(data, VALUES, Path(tmp) / "out.jsonl", prefetch=0)
+                # The old path is too slow to run through every item on wide frames
+                rate = _time_navigation(
+                    a, n_items if name != "iloc" else min(n_items, 200)
+                )
+                print(f"{n_columns:>4} columns  {name:<22} {rate:>10.1f} items/s")
+                a.close()
+                data.close()
+
+
+def bench_pipeline(n_items: int, n_columns: int, think: float) -> None:
+    """
+    Compares the time from submit until the next item is shown, with items
+    prepared on demand and by the background `Prefetcher`. The annotator
+    spends `think` seconds on every item.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        df = _get_synthetic_df(n_items, n_columns, text_length=1500)
+        path = Path(tmp) / "items.jsonl"
+        df.to_json(path, orient="records", lines=True)
+
+        for depth in [0, 8]:
+            a = HeadlessAnnotator(
+                JsonlDataset(path),
+                VALUES,
+                Path(tmp) / f"out_{depth}.jsonl",
+                prefetch=depth,
+                batch_size=n_items,  # Keeps fsyncs out of the timings
+            )
+            latencies = []
+            for _ in range(n_items - 1):
+                time.sleep(think)
+                a.select(["nb"])
+                start = time.perf_counter()
+                a.on_submit()
+                latencies.append(time.perf_counter() - start)
+            a.close()
+
+            latencies.sort()
+            p50 = statistics.median(latencies)
+            p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+            name = "on demand" if depth == 0 else f"prefetch {depth}"
+            print(
+                f"{name:<12} submit to next item  p50 {p50 * 1000:>6.3f} ms  p99 {p99 * 1000:>6.3f} ms"
+            )
+
+
+def bench_ordering(labeled: str, budget: int, step: int, rerank_every: int) -> None:
+    """
+    Simulates annotation sessions on a labeled file, where the annotator picks
+    the true labels, and compares how well a model trained on the results so
+    far does on held out instances with the sequential and uncertainty orders.
+    """
+    if labeled is None:
+        df = _get_synthetic_labeled(5000)
+    else:
+        df = pd.read_json(labeled, lines=True)
+    df = df.sample(frac=1.0, random_state=0).reset_index(drop=True)
+
+    n_test = len(df) // 5
+    test, pool = df.iloc[:n_test], df.iloc[n_test:].reset_index(drop=True)
+    model = NgramNaiveBayes(VALUES)
+    test_features = get_ngram_features(test["text"].tolist())
+    y_test = model.get_label_matrix(test["languages"].tolist())
+    pool_features = get_ngram_features(pool["text"].tolist())
+    y_pool = model.get_label_matrix(pool["languages"].tolist())
+    budget = min(budget, len(pool) - 1)
+
+    print(f"{'labels':>8}  {'sequential':>22}  {'uncertainty':>22}")
+    curves = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ["sequential", "uncertainty"]:
+            data = DataFrameDataset(pool)
+            order = None
+            if name == "uncertainty":
+                order = UncertaintyOrder(data, VALUES, rerank_every, background=False)
+            a = HeadlessAnnotator(
+                data, VALUES, Path(tmp) / f"{name}.jsonl", prefetch=0, order=order
+            )
+            shown, curves[name] = [], []
+            for n in range(1, budget + 1):
+                shown.append(a.record["working_index"])
+                a.select(pool["languages"][shown[-1]])
+                a.on_submit()
+                if n % step == 0:
+                    train = take_rows(*pool_features, np.array(shown))
+                    curves[name].append(
+                        _get_scores(train, y_pool[shown], test_features, y_test)
+                    )
+            a.close()
+
+    for k, n in enumerate(range(step, budget + 1, step)):
+        row = "  ".join(
+            f"acc {curves[name][k][0]:.3f} F1 {curves[name][k][1]:.3f}"
+            for name in ["sequential", "uncertainty"]
+        )
+        print(f"{n:>8}  {row}")
+
+
+def bench_prelabel(n_lines: int, noise: float, workers: list[int]) -> None:
+    """
+    Pre-labels a synthetic input whose original languages are wrong for a
+    fraction `noise` of the lines, and reports the speed and how many
+    suggestions could be accepted without showing them, and how often those
+    are right.
+    """
+    df = _get_synthetic_labeled(n_lines, seed=1)
+    rng = np.random.default_rng(2)
+    wrong = rng.random(n_lines) < noise
+    original = [
+        [VALUES[rng.integers(0, len(VALUES))]] if w else languages
+        for w, languages in zip(wrong, df["languages"])
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "input.jsonl"
+        with open(path, "w") as f:
+            for text, languages in zip(df["text"], original):
+                f.write(json.dumps({"text": text, "languages": languages}) + "\n")
+
+        for n_workers in workers:
+            start = time.perf_counter()
+            suggestions = Suggestions(prelabel(path, VALUES, workers=n_workers))
+            total = time.perf_counter() - start
+            print(f"{n_workers:>3} workers  {n_lines / total:>10.0f} lines/s")
+
+    gold = [sorted(languages) for languages in df["languages"]]
+    correct = np.array(
+        [sorted(suggestions.get(i)[0]) == gold[i] for i in range(n_lines)]
+    )
+    print(f"Suggestions right: {correct.mean():.1%}")
+    for threshold in [0.9, 0.95, 0.99]:
+        accepted = suggestions.confidence >= threshold
+        print(
+            f"Confidence >= {threshold}: {accepted.mean():>6.1%} accepted, "
+            f"{correct[accepted].mean() if accepted.any() else float('nan'):.2%} of them right"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    navigation_parser = subparsers.add_parser(
+        "navigation", help="Reads per submitted item."
+    )
+    navigation_parser.add_argument("--items", type=int, default=2000)
+    navigation_parser.add_argument("--columns", type=int, nargs="+", default=[10, 200])
+
+    pipeline_parser = subparsers.add_parser(
+        "pipeline", help="Latency of showing the next item."
+    )
+    pipeline_parser.add_argument("--items", type=int, default=500)
+    pipeline_parser.add_argument("--columns", type=int, default=200)
+    pipeline_parser.add_argument(
+        "--think", type=float, default=0.002, help="Seconds spent on every item."
+    )
+
+    ordering_parser = subparsers.add_parser(
+        "ordering", help="Simulated sessions with each order."
+    )
+    ordering_parser.add_argument(
+        "--labeled",
+        type=str,
+        default=None,
+        help="JSONL file with 'text' and true 'languages', synthetic if not given.",
+    )
+    ordering_parser.add_argument("--budget", type=int, default=600)
+    ordering_parser.add_argument("--step", type=int, default=50)
+    ordering_parser.add_argument("--rerank_every", type=int, default=20)
+
+    prelabel_parser = subparsers.add_parser(
+        "prelabel", help="Pre-labeling speed and auto-accept rate."
+    )
+    prelabel_parser.add_argument("--lines", type=int, default=200_000)
+    prelabel_parser.add_argument("--noise", type=float, default=0.05)
+    prelabel_parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+
+    args = parser.parse_args()
+    if args.benchmark == "navigation":
+        bench_navigation(args.items, args.columns)
+    elif args.benchmark == "pipeline":
+        bench_pipeline(args.items, args.columns, args.think)
+    elif args.benchmark == "ordering":
+        bench_ordering(args.labeled, args.budget, args.step, args.rerank_every)
+    elif args.benchmark == "prelabel":
+        bench_prelabel(args.lines, args.noise, args.workers)
@@ -0,0 +1,207 @@
+"""
+Dataset backends for the Annotator.
+
+The Annotator only ever needs one instance at a time, so the input does not
+have to be parsed into a DataFrame up front.
+
+JsonlDataset:
+    Memory-maps a JSONL file and builds an index of where every line starts,
+    which is cached next to the input (`<input>.offsets.npz`) and reused as
+    long as the input has not changed. Other arrays computed from the whole
+    input, e.g. the record hashes of `shards.py`, are cached the same way.
+    Records are decoded on access, together with a small window of the
+    following records.
+DataFrameDataset:
+    Wraps an already loaded DataFrame in the same interface.
+
+Both return records as dicts which include the position of the record as
+`working_index`.
+"""
+
+import json
+import mmap
+import os
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+
+
+class JsonlDataset:
+    """
+    Lazily decoded JSONL file.
+
+    Instance Variables:
+            path (Path): The path to the JSONL file.
+            offsets (np.ndarray): The byte offset of the start of every line, plus the size of the file at the end.
+            columns (list[str]): The keys of the first record, followed by "working_index".
+            prefetch (int): The number of records decoded ahead of the requested one.
+    """
+
+    # Size of the blocks scanned for newlines when building the index
+    index_block_size: int = 1 << 26
+
+    def __init__(self, path: str, prefetch: int = 8, cache_index: bool = True) -> None:
+        self.path = Path(path)
+        self.prefetch = prefetch
+        self._file = open(self.path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap can't map empty files
+        self._mm = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        )
+
+        self.cache_index = cache_index
+        self.offsets = self.load_cached("offsets") if cache_index else None
+        if self.offsets is None:
+            self.offsets = self._build_index()
+            if cache_index:
+                self.save_cached("offsets", self.offsets)
+
+        self._window = {}
+        self.columns = list(self[0].keys()) if len(self) else ["working_index"]
+
+    @property
+    def index_path(self) -> Path:
+        return self.get_cache_path("offsets")
+
+    def get_cache_path(self, name: str) -> Path:
+        return self.path.with_name(f"{self.path.name}.{name}.npz")
+
+    def get_stamp(self) -> np.ndarray:
+        """
+        The size and modification time of the input, which change whenever it is edited.
+        """
+        stat = os.stat(self.path)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    def load_cached(self, name: str) -> np.ndarray | None:
+        """
+        Loads an array cached next to the input, if it was computed for the current version of the file.
+        """
+        if not self.cache_index:
+            return None
+        try:
+            with np.load(self.get_cache_path(name)) as cached:
+                if np.array_equal(cached["stamp"], self.get_stamp()):
+                    return cached[name]
+        except (OSError, KeyError, ValueError):
+            pass
+        return None
+
+    def save_cached(self, name: str, array: np.ndarray) -> None:
+        if not self.cache_index:
+            return
+        try:
+            np.savez(self.get_cache_path(name), **{name: array}, stamp=self.get_stamp())
+        except OSError:
+            pass  # E.g. a read-only input directory, the array is just recomputed next time
+
+    def _build_index(self) -> np.ndarray:
+        """
+        Finds the start of every non-empty line by scanning the file in blocks for newlines.
+        """
+        size = len(self._mm)
+        starts = [np.zeros(1, dtype=np.int64)]
+        for block_start in range(0, size, self.index_block_size):
+            block = np.frombuffer(
+                self._mm,
+                dtype=np.uint8,
+                count=min(self.index_block_size, size - block_start),
+                offset=block_start,
+            )
+            starts.append(np.flatnonzero(block == ord("\n")) + block_start + 1)
+        starts = np.concatenate(starts)
+
+        # Drop empty lines, including the "line" after a trailing newline
+        ends = np.append(starts[1:] - 1, size)
+        starts = starts[(starts < size) & (ends > starts)]
+
+        return np.append(starts, size).astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _decode(self, i: int) -> dict:
+        record = json.loads(self._mm[self.offsets[i] : self.offsets[i + 1]])
+        record["working_index"] = i
+        return record
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Index {i} out of range for {len(self)} records")
+
+        record = self._window.get(i)
+        if record is None:
+            # Decode the requested record and the ones likely to be asked for next
+            end = min(i + self.prefetch + 1, len(self))
+            self._window = {j: self._decode(j) for j in range(i, end)}
+            record = self._window[i]
+
+        return record
+
+    def get(self, i: int, feature: str):
+        return self[i].get(feature)
+
+    def close(self) -> None:
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+
+class DataFrameDataset:
+    """
+    Dataset interface for an already loaded DataFrame.
+
+    The columns are converted to lists once, since indexing a row with `iloc`
+    builds a whole Series and is slow for wide DataFrames.
+
+    Instance Variables:
+            df (pd.DataFrame): The wrapped DataFrame.
+            columns (list[str]): The columns of the DataFrame, followed by "working_index".
+    """
+
+    def __init__(self, df: pd.DataFrame) -> None:
+        self.df = df
+        self.columns = [c for c in df.columns if c != "working_index"] + [
+            "working_index"
+        ]
+        self._columns = {c: df[c].tolist() for c in self.columns[:-1]}
+        self._len = len(df)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError(f"Index {i} out of range for {self._len} records")
+
+        record = {c: column[i] for c, column in self._columns.items()}
+        record["working_index"] = i
+        return record
+
+    def get(self, i: int, feature: str):
+        if feature == "working_index":
+            return i
+        column = self._columns.get(feature)
+        return None if column is None else column[i]
+
+    def close(self) -> None:
+        pass
+
+
+def get_dataset(
+    data: "pd.DataFrame | JsonlDataset | DataFrameDataset | str",
+) -> "JsonlDataset | DataFrameDataset":
+    """
+    Returns a dataset for the given input, where strings are treated as paths to JSONL files.
+    """
+    if isinstance(data, pd.DataFrame):
+        return DataFrameDataset(data)
+    if isinstance(data, (str, Path)):
+        return JsonlDataset(data)
+    return data
@@ -0,0 +1,295 @@
+"""
+Export of the annotation results to a columnar format.
+
+The results are appended to JSONL files while annotating, which is slow to
+load for training. `export` compacts one or more outputs into columns:
+
+    working_index (int64)   The instance.
+    annotator (uint16)      Index into the annotators, the resolved paths of the
+                            output files or the names given with --annotator.
+    labels (uint32)         Bitmask of the chosen values.
+    original (uint32)       Bitmask of the original values.
+    auto (bool)             Whether the result is an accepted suggestion, see `prelabel.py`.
+    seq (int64)             Order of the results, later results replace earlier ones.
+
+Only the latest result of every annotator for every instance is kept, and
+the texts are left in the input, where `JsonlDataset` reads them by working
+index. The columns are written as Parquet or Arrow IPC if pyarrow is installed, and
+otherwise as a structured NumPy array (`.npy`) which is memory-mapped when
+loaded. The values, the annotators and how far every output has been read are
+kept in `<dest>.json`, so exporting again only parses the new results.
+
+Usage:
+    python export.py validation_multi-label.jsonl --dest labels.npy
+    python export.py alice/results.jsonl bob/results.jsonl --annotator alice bob
+    labels, meta = load_export("labels.npy")
+    y = get_label_matrix(labels["labels"], len(meta["values"]))
+"""
+
+import json
+import os
+import numpy as np
+
+from argparse import ArgumentParser
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EXPORT_DTYPE = np.dtype(
+    [
+        ("working_index", np.int64),
+        ("annotator", np.uint16),
+        ("labels", np.uint32),
+        ("original", np.uint32),
+        ("auto", np.bool_),
+        ("seq", np.int64),
+    ]
+)
+
+FORMATS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow", ".npy": "npy"}
+
+
+def get_meta_path(dest: str | Path) -> Path:
+    dest = Path(dest)
+    return dest.with_name(dest.name + ".json")
+
+
+def get_format(dest: str | Path) -> str:
+    """
+    Returns the format of an export from its suffix.
+    """
+    format = FORMATS.get(Path(dest).suffix)
+    assert (
+        format is not None
+    ), f"Unknown export format for '{dest}', use one of {list(FORMATS)}"
+    assert format == "npy" or pa is not None, f"Exporting to {format} requires pyarrow"
+    return format
+
+
+def get_default_dest(name: str = "labels") -> str:
+    return f"{name}.parquet" if pa is not None else f"{name}.npy"
+
+
+def to_bitmask(labels: list[str] | None, value_index: dict[str, int]) -> int:
+    bitmask = 0
+    for value in labels or []:
+        if value in value_index:
+            bitmask |= 1 << value_index[value]
+    return bitmask
+
+
+def get_label_matrix(bitmasks: np.ndarray, n_values: int) -> np.ndarray:
+    """
+    Expands label bitmasks into a boolean matrix of shape (results, values).
+    """
+    bitmasks = np.asarray(bitmasks, dtype=np.uint32)
+    return (bitmasks[:, None] >> np.arange(n_values, dtype=np.uint32) & 1).astype(bool)
+
+
+def _read_new_results(
+    path: Path,
+    start: int,
+    n_lines: int,
+    annotator: int,
+    value_index: dict[str, int],
+    seq: int,
+) -> tuple[np.ndarray, int]:
+    """
+    Parses the complete lines of an output from byte `start`, after `n_lines` lines.
+
+    Returns:
+            tuple[np.ndarray, int]: The new results, and the byte offset after the last complete line.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read()
+    # A partially written last line is read next time
+    end = data.rfind(b"\n") + 1
+    lines = [line for line in data[:end].split(b"\n") if line.strip()]
+
+    records = [json.loads(line) for line in lines]
+    rows = np.zeros(len(records), dtype=EXPORT_DTYPE)
+    # Older outputs without working_index were annotated in order from the first instance
+    rows["working_index"] = [
+        r.get("working_index", n_lines + i) for i, r in enumerate(records)
+    ]
+    rows["annotator"] = annotator
+    rows["labels"] = [to_bitmask(r.get("languages"), value_index) for r in records]
+    rows["original"] = [to_bitmask(r.get("original"), value_index) for r in records]
+    rows["auto"] = [r.get("auto", False) for r in records]
+    rows["seq"] = np.arange(seq, seq + len(records))
+
+    return rows, start + end
+
+
+def deduplicate(rows: np.ndarray) -> np.ndarray:
+    """
+    Keeps the latest result of every annotator for every instance, sorted by instance and annotator.
+    """
+    order = np.lexsort((rows["seq"], rows["annotator"], rows["working_index"]))
+    rows = rows[order]
+    key = np.stack([rows["working_index"], rows["annotator"].astype(np.int64)])
+    # The last row of every run of equal keys
+    last = np.ones(len(rows), dtype=bool)
+    last[:-1] = (key[:, 1:] != key[:, :-1]).any(axis=0)
+    return rows[last]
+
+
+def _write(rows: np.ndarray, dest: Path, format: str) -> None:
+    tmp = dest.with_name(dest.name + ".tmp")
+    if format == "npy":
+        np.save(tmp, rows, allow_pickle=False)
+        # np.save adds .npy to names without it
+        if not tmp.exists():
+            tmp = tmp.with_name(tmp.name + ".npy")
+    else:
+        table = pa.table({name: rows[name] for name in EXPORT_DTYPE.names})
+        if format == "parquet":
+            pq.write_table(table, tmp)
+        else:
+            feather.write_feather(table, tmp, compression="uncompressed")
+    os.replace(tmp, dest)
+
+
+def load_export(dest: str | Path) -> tuple[np.ndarray | dict, dict]:
+    """
+    Loads an export, memory-mapped for `.npy` and Arrow files.
+
+    Returns:
+            tuple[np.ndarray | dict, dict]: A tuple containing:
+                    - the results, indexable by column name
+                    - the values, annotators and read offsets of the outputs
+    """
+    dest = Path(dest)
+    format = get_format(dest)
+    with open(get_meta_path(dest)) as f:
+        meta = json.load(f)
+
+    if format == "npy":
+        rows = np.load(dest, mmap_mode="r", allow_pickle=False)
+    elif format == "arrow":
+        table = feather.read_table(dest, memory_map=True)
+        rows = {name: table[name].to_numpy() for name in EXPORT_DTYPE.names}
+    else:
+        table = pq.read_table(dest)
+        rows = {name: table[name].to_numpy() for name in EXPORT_DTYPE.names}
+
+    return rows, meta
+
+
+def _to_structured(rows) -> np.ndarray:
+    if isinstance(rows, np.ndarray):
+        return np.array(rows)
+    structured = np.zeros(len(rows["working_index"]), dtype=EXPORT_DTYPE)
+    for name in EXPORT_DTYPE.names:
+        structured[name] = rows[name]
+    return structured
+
+
+def export(
+    outputs: list[str | Path],
+    dest: str | Path,
+    values: list[str],
+    annotators: list[str] = None,
+) -> tuple[int, int]:
+    """
+    Adds the new results in the outputs to an export, or creates it.
+
+    Parameters:
+            outputs (list[str | Path]): The JSONL outputs of the annotators.
+            dest (str | Path): The export, see `get_format`.
+            values (list[str]): The values annotated.
+            annotators (list[str]): The name of the annotator of every output.
+                    Defaults to the resolved paths of the outputs, since e.g.
+                    alice/results.jsonl and bob/results.jsonl share a file name.
+    Returns:
+            tuple[int, int]: The number of new results read, and the number of results in the export.
+    """
+    assert len(values) <= 32, "The bitmask holds at most 32 values"
+    if annotators is None:
+        annotators = [str(Path(output).resolve()) for output in outputs]
+    assert len(annotators) == len(
+        outputs
+    ), f"{len(annotators)} annotators given for {len(outputs)} outputs"
+
+    dest = Path(dest)
+    format = get_format(dest)
+
+    rows = np.zeros(0, dtype=EXPORT_DTYPE)
+    meta = {"values": list(values), "annotators": [], "offsets": {}, "seq": 0}
+    if dest.exists() and get_meta_path(dest).exists():
+        existing, meta = load_export(dest)
+        assert meta["values"] == list(
+            values
+        ), f"The export has the values {meta['values']}, export to a new file for {values}"
+        rows = _to_structured(existing)
+
+    value_index = {value: j for j, value in enumerate(values)}
+    new = []
+    for output, name in zip(outputs, annotators):
+        output = Path(output)
+        if name not in meta["annotators"]:
+            meta["annotators"].append(name)
+        key = str(output.resolve())
+        start, n_lines = meta["offsets"].get(key, (0, 0))
+        if output.stat().st_size < start:
+            start, n_lines = 0, 0  # The output was replaced, read it again
+
+        results, end = _read_new_results(
+            output,
+            start,
+            n_lines,
+            meta["annotators"].index(name),
+            value_index,
+            meta["seq"],
+        )
+        meta["offsets"][key] = (end, n_lines + len(results))
+        meta["seq"] += len(results)
+        new.append(results)
+
+    n_new = sum(len(results) for results in new)
+    if n_new or not dest.exists():
+        rows = deduplicate(np.concatenate([rows] + new))
+        _write(rows, dest, format)
+
+    tmp = get_meta_path(dest).with_name(get_meta_path(dest).name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, get_meta_path(dest))
+
+    return n_new, len(rows)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("outputs", type=str, nargs="+", help="Results to export.")
+    parser.add_argument(
+        "--dest",
+        type=str,
+        default=get_default_dest(),
+        help="Where to export to, .parquet or .arrow with pyarrow and .npy otherwise.",
+    )
+    parser.add_argument(
+        "--values",
+        type=str,
+        nargs="+",
+        default=["nb", "nn", "da", "sv", "other"],
+        help="The values annotated.",
+    )
+    parser.add_argument(
+        "--annotator",
+        type=str,
+        nargs="+",
+        default=None,
+        help="The name of the annotator of every output, instead of its path.",
+    )
+
+    args = parser.parse_args()
+
+    n_new, n_rows = export(args.outputs, args.dest, args.values, args.annotator)
+    print(f"Exported {n_new} new results, {n_rows} results in {args.dest}")
@@ -0,0 +1,188 @@
+"""
+Lightweight character n-gram classifier for the annotation values.
+
+Texts are turned into hashed byte n-gram features in one vectorized pass over
+the whole corpus, stored as a sparse matrix in CSR form (`indptr`, `indices`)
+without scipy. The byte hashes do not depend on the process, so features can
+be computed in worker processes and combined.
+
+`NgramNaiveBayes` is a one-vs-rest multinomial naive Bayes over those features
+with one binary classifier per value, e.g. `nb/nn/da/sv/other`. It is trained
+incrementally with `partial_fit`, so it can learn from the results as they are
+submitted.
+"""
+
+import numpy as np
+
+_PRIME = np.uint64(0x100000001B3)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def get_ngram_features(
+    texts: list[str], ngram_range: tuple[int, int] = (1, 4), bits: int = 18
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Hashes the byte n-grams of every (lowercased) text into `2**bits` features.
+
+    Parameters:
+            texts (list[str]): The texts.
+            ngram_range (tuple[int, int]): The smallest and largest n-gram length.
+            bits (int): The number of bits of the feature index.
+    Returns:
+            tuple[np.ndarray, np.ndarray]: A tuple containing:
+                    - indptr, where the features of text i are `indices[indptr[i]:indptr[i + 1]]`
+                    - indices, the feature index of every n-gram, repeated n-grams included
+    """
+    encoded = [("" if t is None else str(t)).lower().encode("utf-8") for t in texts]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+
+    # Offset of every byte from the end of its text, to drop n-grams crossing texts
+    ends = np.cumsum(lengths)
+    to_end = np.repeat(ends, lengths) - np.arange(len(data))
+    doc = np.repeat(np.arange(len(texts)), lengths)
+
+    docs, features = [], []
+    h = np.zeros(len(data), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for n in range(1, ngram_range[1] + 1):
+            # h[p] is the hash of the n bytes from position p
+            h[: len(data) - n + 1] = h[: len(data) - n + 1] * _PRIME + data[n - 1 :]
+            if n < ngram_range[0]:
+                continue
+            valid = np.flatnonzero(to_end >= n)
+            mixed = (h[valid] + np.uint64(n)) * _GOLDEN
+            docs.append(doc[valid])
+            features.append((mixed >> np.uint64(64 - bits)).astype(np.int32))
+
+    docs = np.concatenate(docs) if docs else np.zeros(0, dtype=np.int64)
+    features = np.concatenate(features) if features else np.zeros(0, dtype=np.int32)
+    order = np.argsort(docs, kind="stable")
+    indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(docs, minlength=len(texts)), out=indptr[1:])
+
+    return indptr, features[order]
+
+
+def take_rows(
+    indptr: np.ndarray, indices: np.ndarray, rows: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the rows of a CSR matrix as a new CSR matrix.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    lengths = indptr[rows + 1] - indptr[rows]
+    new_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_indptr[1:])
+    # Position of every kept entry in the original indices
+    offsets = np.repeat(indptr[rows] - new_indptr[:-1], lengths)
+    return new_indptr, indices[np.arange(new_indptr[-1]) + offsets]
+
+
+def get_log_odds(
+    indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray, bias: np.ndarray
+) -> np.ndarray:
+    """
+    Sums the feature weights of every instance, of shape (instances, values).
+
+    Parameters:
+            indptr, indices (np.ndarray): The features of the instances, see `get_ngram_features`.
+            weights (np.ndarray): The weight of every feature for every value, of shape (values, features).
+            bias (np.ndarray): The weight of every value without any features.
+    """
+    n = len(indptr) - 1
+    doc = np.repeat(np.arange(n), np.diff(indptr))
+    scores = np.empty((n, len(bias)))
+    for j in range(len(bias)):
+        scores[:, j] = np.bincount(doc, weights=weights[j, indices], minlength=n)
+    return scores + bias
+
+
+class NgramNaiveBayes:
+    """
+    One-vs-rest multinomial naive Bayes over hashed n-gram features.
+
+    Instance Variables:
+            values (list[str]): The values predicted, one binary classifier each.
+            bits (int): The number of bits of the feature index, see `get_ngram_features`.
+            alpha (float): The additive smoothing of the feature counts.
+            counts (np.ndarray): Feature counts of shape (values, 2, features), for instances without and with the value.
+            n_docs (np.ndarray): Instance counts of shape (values, 2).
+    """
+
+    def __init__(self, values: list[str], bits: int = 18, alpha: float = 0.1) -> None:
+        self.values = list(values)
+        self.bits = bits
+        self.alpha = alpha
+        self.counts = np.zeros((len(values), 2, 1 << bits), dtype=np.float32)
+        self.n_docs = np.zeros((len(values), 2), dtype=np.int64)
+        self._weights = None
+
+    @property
+    def n_seen(self) -> int:
+        return int(self.n_docs[0].sum()) if len(self.values) else 0
+
+    def get_label_matrix(self, labels: list[list[str]]) -> np.ndarray:
+        """
+        Returns a boolean matrix with one row per list of labels and one column per value.
+        """
+        value_index = {value: j for j, value in enumerate(self.values)}
+        y = np.zeros((len(labels), len(self.values)), dtype=bool)
+        for i, row in enumerate(labels):
+            for value in row:
+                if value in value_index:
+                    y[i, value_index[value]] = True
+        return y
+
+    def partial_fit(
+        self,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        y: np.ndarray,
+        weight: float = 1.0,
+    ) -> None:
+        """
+        Adds instances to the counts.
+
+        Parameters:
+                indptr, indices (np.ndarray): The features of the instances, see `get_ngram_features`.
+                y (np.ndarray): Boolean matrix of shape (instances, values), see `get_label_matrix`.
+                weight (float): How many times each instance counts.
+        """
+        dim = 1 << self.bits
+        doc = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        for j in range(len(self.values)):
+            has_value = y[doc, j].astype(np.int64)
+            self.counts[j] += weight * np.bincount(
+                has_value * dim + indices, minlength=2 * dim
+            ).reshape(2, dim)
+            self.n_docs[j] += np.bincount(y[:, j].astype(np.int64), minlength=2)
+        self._weights = None
+
+    def get_weights(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The log likelihood ratio of every feature and the log prior ratio, per value.
+        """
+        if self._weights is None:
+            dim = 1 << self.bits
+            smoothed = self.counts + self.alpha
+            log_p = np.log(smoothed) - np.log(
+                self.counts.sum(axis=2, keepdims=True) + self.alpha * dim
+            )
+            weights = log_p[:, 1] - log_p[:, 0]
+            bias = np.log(self.n_docs[:, 1] + 1.0) - np.log(self.n_docs[:, 0] + 1.0)
+            self._weights = weights, bias
+        return self._weights
+
+    def decision_function(self, indptr: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        """
+        Returns the log odds of every value for every instance, of shape (instances, values).
+        """
+        return get_log_odds(indptr, indices, *self.get_weights())
+
+    def predict_proba(self, indptr: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        """
+        Returns the probability of every value for every instance, of shape (instances, values).
+        """
+        scores = np.clip(self.decision_function(indptr, indices), -30, 30)
+        return 1.0 / (1.0 + np.exp(-scores))
@@ -0,0 +1,295 @@
+"""
+Orderings of the Annotator queue.
+
+An ordering decides which instance is shown at each position of the queue.
+`SequentialOrder` shows the instances in file order, like the Annotator does
+without an ordering. `UncertaintyOrder` shows the instances the model of
+`model.py` is the least certain about first: the model learns from every
+submitted result, and a sample of the remaining instances is re-ranked every
+`rerank_every` submissions in a background thread.
+
+Positions are assigned when the instance is first asked for, also by the
+`Prefetcher`, so a new ranking applies from the first position which is not
+prepared yet.
+
+Usage:
+    order = UncertaintyOrder(data, ["nb", "nn", "da", "sv", "other"])
+    Annotator(data, values, output, order=order)
+"""
+
+import threading
+
+import numpy as np
+
+from pathlib import Path
+
+from model import NgramNaiveBayes, get_ngram_features
+from shards import read_output
+
+
+def get_labeled(output: str | Path) -> dict[int, list[str]]:
+    """
+    Returns the results in an output file by working index, e.g. to start an `UncertaintyOrder` from.
+    """
+    if not Path(output).exists() or Path(output).stat().st_size == 0:
+        return {}
+    return read_output(output)["languages"].to_dict()
+
+
+class SequentialOrder:
+    """
+    Shows the instances in file order.
+    """
+
+    def __init__(self, data) -> None:
+        self.n = len(data)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def index_at(self, position: int) -> int:
+        """
+        Returns the index in the data of the instance at a position of the queue.
+        """
+        if not 0 <= position < self.n:
+            raise IndexError(f"Position {position} out of range for {self.n} records")
+        return position
+
+    def observe(self, working_index: int, labels: list[str]) -> None:
+        """
+        Called with the result of every submitted instance, by its `working_index`.
+        """
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class UncertaintyOrder:
+    """
+    Shows the instances the model is the least certain about first.
+
+    The uncertainty of an instance is the smallest margin of the log odds of
+    any value, per square root of the number of n-grams so long texts are not
+    always deemed certain. Until the model has seen `warmup` results, and both
+    outcomes of a value, the instances are shown in file order, since the
+    rankings of a model trained on a handful of results are mostly noise.
+
+    Only a random sample of `window` remaining instances is decoded and ranked
+    at every re-ranking, so the memory and time of a re-ranking do not grow
+    with the input. Per instance, only whether it has been shown is kept.
+
+    Instance Variables:
+            model (NgramNaiveBayes): The model learning from the submitted results.
+            rerank_every (int): The number of submissions between two re-rankings.
+            warmup (int): The number of results before the first ranking.
+            window (int): The number of instances ranked at every re-ranking.
+            background (bool): Whether the re-ranking runs in a background thread.
+            n_reranks (int): The number of re-rankings so far.
+    """
+
+    # Number of texts turned into features at a time when training
+    chunk_size: int = 10_000
+
+    def __init__(
+        self,
+        data,
+        values: list[str],
+        rerank_every: int = 20,
+        warmup: int = 100,
+        labeled: dict[int, list[str]] = None,
+        background: bool = True,
+        bits: int = 18,
+        window: int = 2000,
+        seed: int = 0,
+    ) -> None:
+        """
+        Parameters:
+                data (JsonlDataset | DataFrameDataset | ShardDataset): The data to annotate, see `dataset.py`.
+                values (list[str]): The values annotated.
+                rerank_every (int): The number of submissions between two re-rankings.
+                warmup (int): The number of results before the first ranking.
+                labeled (dict[int, list[str]]): Results from earlier sessions by working index, which the model starts from and which are not shown again.
+                background (bool): Whether the re-ranking runs in a background thread.
+                bits (int): The number of bits of the hashed n-gram features.
+                window (int): The number of instances ranked at every re-ranking.
+                seed (int): The seed of the sample of instances ranked.
+        """
+        assert rerank_every > 0, "rerank_every must be positive"
+        assert window > 0, "window must be positive"
+
+        self.model = NgramNaiveBayes(values, bits=bits)
+        self.data = data
+        self.rerank_every = rerank_every
+        self.warmup = warmup
+        self.window = window
+        self.background = background
+        self.bits = bits
+        self.n_reranks = 0
+        self._rng = np.random.default_rng(seed)
+
+        # Working indices differ from the index in the data for shards, whose
+        # sorted working indices are kept in `indices`
+        self._working_indices = getattr(data, "indices", None)
+        self._n_data = len(data)
+        labeled = {
+            i: labels
+            for i, labels in (
+                (self._get_index(w), labels) for w, labels in (labeled or {}).items()
+            )
+            if i is not None
+        }
+        self._done = np.zeros(self._n_data, dtype=bool)  # Shown or labeled
+        self._done[list(labeled)] = True
+        self.n = self._n_data - int(self._done.sum())
+
+        self._lock = threading.Lock()
+        self._assigned = []  # Index in the data at every position
+        self._ranking = []
+        self._rank_pos = 0
+        self._next = 0  # The next instance in file order, after the ranking
+        self._pending = list(labeled.items())
+        self._thread = None
+
+        if self._pending:
+            self._rerank()
+
+    def _get_index(self, working_index: int) -> int | None:
+        """
+        Returns the index in the data of a working index, or None if it is not in the data.
+        """
+        if self._working_indices is None:
+            return working_index if 0 <= working_index < self._n_data else None
+        i = int(np.searchsorted(self._working_indices, working_index))
+        if i < len(self._working_indices) and self._working_indices[i] == working_index:
+            return i
+        return None
+
+    def __len__(self) -> int:
+        return self.n
+
+    def index_at(self, position: int) -> int:
+        if not 0 <= position < self.n:
+            raise IndexError(f"Position {position} out of range for {self.n} records")
+
+        with self._lock:
+            while len(self._assigned) <= position:
+                # Instances in the ranking may have been shown since it was made
+                if self._rank_pos < len(self._ranking):
+                    i = self._ranking[self._rank_pos]
+                    self._rank_pos += 1
+                else:
+                    i = self._next
+                    self._next += 1
+                if not self._done[i]:
+                    self._done[i] = True
+                    self._assigned.append(i)
+            return self._assigned[position]
+
+    def observe(self, working_index: int, labels: list[str]) -> None:
+        with self._lock:
+            self._pending.append((self._get_index(working_index), labels))
+            if len(self._pending) < self.rerank_every:
+                return
+            if self._thread is not None and self._thread.is_alive():
+                return  # Picked up by the next re-ranking
+
+        if self.background:
+            self._thread = threading.Thread(target=self._rerank, daemon=True)
+            self._thread.start()
+        else:
+            self._rerank()
+
+    def get_features(self, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Decodes the texts of the instances and returns their n-gram features, see `model.py`.
+        """
+        return get_ngram_features(
+            [self.data.get(int(i), "text") for i in rows], bits=self.bits
+        )
+
+    def get_uncertainty(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Returns the uncertainty of the instances, higher is less certain.
+        """
+        indptr, indices = self.get_features(rows)
+        scores = self.model.decision_function(indptr, indices)
+        n_features = np.maximum(np.diff(indptr), 1)
+        return -np.abs(scores).min(axis=1) / np.sqrt(n_features)
+
+    def _sample_remaining(self) -> np.ndarray:
+        """
+        Returns up to `window` instances which have not been shown, in file order.
+        """
+        with self._lock:
+            done = self._done.copy()
+        n_remaining = len(done) - int(done.sum())
+        if n_remaining <= self.window:
+            return np.flatnonzero(~done)
+
+        # Draws until there are enough, without listing every remaining instance
+        sample = np.zeros(0, dtype=np.int64)
+        while len(sample) < self.window:
+            n_draws = 2 * self.window * len(done) // n_remaining
+            draws = self._rng.integers(0, len(done), n_draws)
+            sample = np.union1d(sample, draws[~done[draws]])
+        return np.sort(self._rng.choice(sample, self.window, replace=False))
+
+    def _rerank(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        pending = [(i, labels) for i, labels in pending if i is not None]
+        if not pending:
+            return
+
+        for start in range(0, len(pending), self.chunk_size):
+            chunk = pending[start : start + self.chunk_size]
+            rows = np.array([i for i, _ in chunk])
+            y = self.model.get_label_matrix([labels for _, labels in chunk])
+            self.model.partial_fit(*self.get_features(rows), y)
+
+        if (
+            self.model.n_seen < self.warmup
+            or not (self.model.n_docs > 0).all(axis=1).any()
+        ):
+            return  # Not enough to rank by yet, keep the file order
+
+        candidates = self._sample_remaining()
+        uncertainty = self.get_uncertainty(candidates)
+        # Stable, so ties stay in file order
+        ranking = candidates[np.argsort(-uncertainty, kind="stable")]
+
+        with self._lock:
+            self._ranking = ranking.tolist()
+            self._rank_pos = 0
+            self.n_reranks += 1
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._thread.join()
+
+
+class OrderedDataset:
+    """
+    The instances of a dataset in the order of an ordering, by position in the queue.
+
+    Records keep the `working_index` of the full dataset.
+    """
+
+    def __init__(self, data, order: SequentialOrder | UncertaintyOrder) -> None:
+        self.data = data
+        self.order = order
+        self.columns = data.columns
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __getitem__(self, position: int) -> dict:
+        return self.data[self.order.index_at(position)]
+
+    def get(self, position: int, feature: str):
+        return self.data.get(self.order.index_at(position), feature)
+
+    def close(self) -> None:
+        self.order.close()
+        self.data.close()
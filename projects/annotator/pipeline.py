@@ -0,0 +1,155 @@
+"""
+Background preparation of the items shown by the Annotator.
+
+Fetching a record and formatting its labels used to happen in the Tk mainloop,
+between the submit and the next item being shown. `Prefetcher` instead runs a
+producer thread which decodes and formats the next `depth` items into a
+bounded queue, so showing the next item only swaps the label texts.
+
+Usage:
+    pipeline = Prefetcher(data, ["text", "working_index"], start_idx=0)
+    record, item = pipeline.get(0)
+    item["text"]  # The formatted text label
+"""
+
+import queue
+import threading
+
+
+def format_value(value, max_chars: int = 2000) -> str:
+    """
+    Formats a record value as the text of a label.
+        - Missing values are shown as empty labels.
+        - Lists are joined with commas.
+        - Floats are rounded to 4 significant digits.
+        - Texts longer than `max_chars` are truncated.
+    """
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    if isinstance(value, (list, tuple)):
+        text = ", ".join(str(v) for v in value)
+    elif isinstance(value, float):
+        text = f"{value:.4g}"
+    else:
+        text = str(value)
+
+    if len(text) > max_chars:
+        text = text[: max_chars - 1] + "…"
+    return text
+
+
+def format_item(record: dict, features: list[str], max_chars: int = 2000) -> dict:
+    """
+    Returns the formatted label text of every feature of the record.
+    """
+    return {
+        feature: format_value(record.get(feature), max_chars) for feature in features
+    }
+
+
+class Prefetcher:
+    """
+    Prepares the items following the current one in a background thread.
+
+    Items are produced in order from `start_idx`. Asking for any other item than
+    the next one restarts the producer from there.
+
+    Instance Variables:
+            data (JsonlDataset | DataFrameDataset): The data to annotate, see `dataset.py`.
+            features (list[str]): The features to format for every item.
+            depth (int): The number of items prepared ahead, 0 prepares them on `get` without a thread.
+            max_chars (int): The length texts are truncated to.
+    """
+
+    def __init__(
+        self,
+        data,
+        features: list[str],
+        start_idx: int = 0,
+        depth: int = 8,
+        max_chars: int = 2000,
+    ) -> None:
+        self.data = data
+        self.features = list(features)
+        self.depth = depth
+        self.max_chars = max_chars
+
+        self._expected = start_idx  # The index the consumer will ask for next
+        self._next = start_idx  # The index the producer prepares next
+        self._generation = 0  # Bumped on every restart, to drop stale items
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._thread = None
+        if depth > 0:
+            self._queue = queue.Queue(maxsize=depth)
+            self._thread = threading.Thread(target=self._produce, daemon=True)
+            self._thread.start()
+
+    def _prepare(self, i: int) -> tuple[dict, dict]:
+        record = self.data[i]
+        return record, format_item(record, self.features, self.max_chars)
+
+    def _produce(self) -> None:
+        n = len(self.data)
+        while True:
+            with self._cond:
+                while not self._closed and self._next >= n:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                generation, i = self._generation, self._next
+                self._next += 1
+
+            try:
+                entry = (generation, i, self._prepare(i), None)
+            except Exception as e:
+                # Raised in the consumer, where the item is asked for
+                entry = (generation, i, None, e)
+
+            while not self._closed and generation == self._generation:
+                try:
+                    self._queue.put(entry, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def _restart(self, i: int) -> None:
+        with self._cond:
+            self._generation += 1
+            self._next = i
+            self._cond.notify()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def get(self, i: int) -> tuple[dict, dict]:
+        """
+        Returns the record at index `i` and its formatted label texts, waiting for the producer if they are not ready yet.
+        """
+        if not 0 <= i < len(self.data):
+            raise IndexError(f"Index {i} out of range for {len(self.data)} records")
+
+        if self._thread is None:
+            return self._prepare(i)
+
+        if i != self._expected:
+            self._restart(i)
+        self._expected = i + 1
+
+        while True:
+            generation, _, prepared, error = self._queue.get()
+            if generation != self._generation:
+                continue
+            if error is not None:
+                raise error
+            return prepared
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,319 @@
+"""
+Pre-labeling of the input before annotation.
+
+The `original` languages of the input are almost always right, so instead of
+ticking every checkbox by hand the annotators can start from a suggestion.
+A model (see `model.py`) is trained on a sample of the input's own languages,
+plus any earlier results, and then scores the whole input in chunks of lines
+in a pool of worker processes. Every instance gets its original languages as
+suggestion, or the predicted ones if it has none, with the confidence of the
+model in that suggestion.
+
+The suggestions are stored next to the input (`<input>.suggestions.npz`) as a
+bitmask over the values and a confidence per line, with the size and
+modification time of the input, so suggestions for an input that has changed
+since are not used (like the cached line offsets). The Annotator pre-checks
+the suggestions, and accepts them without showing the instance if the
+confidence is at least `auto_accept`.
+
+Usage:
+    python prelabel.py data.jsonl [--results validation_multi-label.jsonl]
+    python annotation_tool.py data.jsonl --auto_accept 0.99
+"""
+
+import json
+import logging
+import os
+import numpy as np
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from dataset import JsonlDataset
+from model import NgramNaiveBayes, get_log_odds, get_ngram_features
+from ordering import get_labeled
+
+# Set in every worker process by `_init_worker`
+_worker = {}
+
+logger = logging.getLogger(__name__)
+
+
+def get_suggestions_path(input: str | Path) -> Path:
+    input = Path(input)
+    return input.with_name(input.name + ".suggestions.npz")
+
+
+def get_confidence(
+    log_odds: np.ndarray, n_features: np.ndarray, y: np.ndarray
+) -> np.ndarray:
+    """
+    The probability of exactly the labels in `y` for every instance.
+
+    The log odds are divided by the square root of the number of n-grams,
+    since naive Bayes counts every overlapping n-gram as independent evidence
+    and is far too certain otherwise.
+    """
+    scaled = log_odds / np.sqrt(np.maximum(n_features, 1))[:, None]
+    # log sigmoid of the log odds of the label, or of its absence
+    signed = np.where(y, scaled, -scaled)
+    return np.exp(-np.logaddexp(0, -signed).sum(axis=1))
+
+
+def _init_worker(values, weights, bias, ngram_bits) -> None:
+    _worker.update(values=values, weights=weights, bias=bias, bits=ngram_bits)
+
+
+def _score_lines(lines: list[bytes]) -> tuple[np.ndarray, np.ndarray]:
+    values, bits = _worker["values"], _worker["bits"]
+    records = [json.loads(line) for line in lines]
+    indptr, indices = get_ngram_features([r.get("text") for r in records], bits=bits)
+    log_odds = get_log_odds(indptr, indices, _worker["weights"], _worker["bias"])
+
+    # The original languages where there are any, the predicted ones otherwise
+    value_index = {value: j for j, value in enumerate(values)}
+    y = log_odds > 0
+    for i, record in enumerate(records):
+        original = record.get("languages")
+        if original:
+            y[i] = False
+            for value in original:
+                if value in value_index:
+                    y[i, value_index[value]] = True
+
+    confidence = get_confidence(log_odds, np.diff(indptr), y)
+    bitmask = (y * (1 << np.arange(len(values)))).sum(axis=1).astype(np.uint32)
+    return bitmask, confidence.astype(np.float32)
+
+
+def _score_chunk(path: str, start: int, end: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Scores the lines in bytes `start` to `end` of the input.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        lines = [line for line in f.read(end - start).split(b"\n") if line]
+    return _score_lines(lines)
+
+
+def train_model(
+    data: JsonlDataset,
+    values: list[str],
+    train_size: int = 200_000,
+    results: list[str | Path] = (),
+    results_weight: float = 5.0,
+    bits: int = 18,
+    seed: int = 0,
+) -> NgramNaiveBayes:
+    """
+    Trains a model on the original languages of a sample of the input, and on earlier results.
+    """
+    model = NgramNaiveBayes(values, bits=bits)
+    rng = np.random.default_rng(seed)
+    sample = np.sort(
+        rng.choice(len(data), size=min(train_size, len(data)), replace=False)
+    )
+    records = [data[i] for i in sample.tolist()]
+    records = [r for r in records if r.get("languages")]
+    if records:
+        model.partial_fit(
+            *get_ngram_features([r.get("text") for r in records], bits=bits),
+            model.get_label_matrix([r["languages"] for r in records]),
+        )
+
+    for path in results:
+        labeled = get_labeled(path)
+        texts = [data.get(i, "text") for i in labeled if 0 <= i < len(data)]
+        labels = [labels for i, labels in labeled.items() if 0 <= i < len(data)]
+        if texts:
+            # Checked by a human, so they count more than the original languages
+            model.partial_fit(
+                *get_ngram_features(texts, bits=bits),
+                model.get_label_matrix(labels),
+                weight=results_weight,
+            )
+
+    return model
+
+
+def prelabel(
+    input: str | Path,
+    values: list[str],
+    results: list[str | Path] = (),
+    train_size: int = 200_000,
+    chunk_size: int = 50_000,
+    workers: int = None,
+    bits: int = 18,
+) -> Path:
+    """
+    Scores every line of the input and saves the suggestions next to it.
+
+    Parameters:
+            input (str | Path): The JSONL input.
+            values (list[str]): The values annotated.
+            results (list[str | Path]): Earlier results to train on as well.
+            train_size (int): The number of lines of the input to train on.
+            chunk_size (int): The number of lines scored by a worker at a time.
+            workers (int): The number of worker processes, defaults to one per CPU.
+            bits (int): The number of bits of the hashed n-gram features.
+    Returns:
+            Path: The path of the suggestions.
+    """
+    assert len(values) <= 32, "The bitmask holds at most 32 values"
+
+    # Only the sampled lines are decoded for training
+    data = JsonlDataset(input, prefetch=0)
+    model = train_model(data, values, train_size, results, bits=bits)
+    weights, bias = model.get_weights()
+
+    # Chunks of whole lines, by the line offsets of the dataset
+    bounds = data.offsets[:: max(chunk_size, 1)].tolist()
+    if bounds[-1] != data.offsets[-1]:
+        bounds.append(int(data.offsets[-1]))
+    chunks = list(zip(bounds[:-1], bounds[1:]))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(values, weights.astype(np.float32), bias, bits)
+        scored = [_score_chunk(str(data.path), start, end) for start, end in chunks]
+    else:
+        with ProcessPoolExecutor(
+            workers,
+            initializer=_init_worker,
+            initargs=(values, weights.astype(np.float32), bias, bits),
+        ) as pool:
+            scored = list(
+                pool.map(
+                    _score_chunk,
+                    [str(data.path)] * len(chunks),
+                    [start for start, _ in chunks],
+                    [end for _, end in chunks],
+                )
+            )
+
+    labels = np.concatenate([s[0] for s in scored] or [np.zeros(0, np.uint32)])
+    confidence = np.concatenate([s[1] for s in scored] or [np.zeros(0, np.float32)])
+    assert len(labels) == len(data), "Every line of the input must be scored"
+    stamp = data.get_stamp()
+    data.close()
+
+    path = get_suggestions_path(input)
+    np.savez(
+        path,
+        labels=labels,
+        confidence=confidence,
+        values=np.array(values),
+        stamp=stamp,
+    )
+    return path
+
+
+class Suggestions:
+    """
+    The suggested labels of every instance, see `prelabel`.
+
+    Instance Variables:
+            values (list[str]): The values of the bitmask.
+            labels (np.ndarray): The bitmask of the suggested values of every instance.
+            confidence (np.ndarray): The confidence of the model in every suggestion.
+            stamp (np.ndarray | None): The size and modification time of the input when it was pre-labeled.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        with np.load(path) as suggestions:
+            self.values = suggestions["values"].tolist()
+            self.labels = suggestions["labels"]
+            self.confidence = suggestions["confidence"]
+            # Suggestions saved before the stamp was added are never current
+            self.stamp = suggestions["stamp"] if "stamp" in suggestions else None
+
+    @classmethod
+    def for_input(
+        cls, data: JsonlDataset, values: list[str] = None
+    ) -> "Suggestions | None":
+        """
+        Loads the suggestions of an input, if it has been pre-labeled and has not changed since.
+
+        Parameters:
+                data (JsonlDataset): The input, not a shard of it, since the suggestions are by line.
+                values (list[str]): The values annotated in the session, to warn if they were pre-labeled with others.
+        Returns:
+                Suggestions | None: The suggestions, or None if there are none for the current input.
+        """
+        path = get_suggestions_path(data.path)
+        if not path.exists():
+            return None
+
+        suggestions = cls(path)
+        if suggestions.stamp is None or not np.array_equal(
+            suggestions.stamp, data.get_stamp()
+        ):
+            logger.warning(
+                f"Ignoring {path}, {data.path} has changed since it was pre-labeled. "
+                "Run prelabel.py again to use suggestions."
+            )
+            return None
+        if len(suggestions) != len(data):
+            logger.warning(
+                f"Ignoring {path}, it has {len(suggestions)} suggestions "
+                f"for {len(data)} instances."
+            )
+            return None
+        if values is not None and list(values) != suggestions.values:
+            logger.warning(
+                f"{path} was pre-labeled with the values {suggestions.values}, "
+                f"not {list(values)}. Only the values in both are suggested."
+            )
+        return suggestions
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def get(self, working_index: int) -> tuple[list[str], float]:
+        """
+        Returns the suggested values and the confidence in them.
+        """
+        bitmask = int(self.labels[working_index])
+        labels = [v for j, v in enumerate(self.values) if bitmask >> j & 1]
+        return labels, float(self.confidence[working_index])
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("input", type=str, help="Path to input file.")
+    parser.add_argument(
+        "--values",
+        type=str,
+        nargs="+",
+        default=["nb", "nn", "da", "sv", "other"],
+        help="What to choose from for annotations",
+    )
+    parser.add_argument(
+        "--results",
+        type=str,
+        nargs="*",
+        default=[],
+        help="Earlier results to train on as well.",
+    )
+    parser.add_argument("--train_size", type=int, default=200_000)
+    parser.add_argument("--chunk_size", type=int, default=50_000)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Defaults to one per CPU."
+    )
+
+    args = parser.parse_args()
+
+    path = prelabel(
+        args.input,
+        args.values,
+        args.results,
+        args.train_size,
+        args.chunk_size,
+        args.workers,
+    )
+    suggestions = Suggestions(path)
+    print(f"Saved suggestions for {len(suggestions)} instances to {path}")
+    for threshold in [0.9, 0.95, 0.99]:
+        share = (suggestions.confidence >= threshold).mean() if len(suggestions) else 0
+        print(f"Confidence >= {threshold}: {share:.1%}")
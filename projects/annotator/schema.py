@@ -0,0 +1,232 @@
+"""
+Label schemas for the Annotator.
+
+A schema is a tree of labels: the leaves are the values annotated, and the
+groups only help finding them. It is declared as a list, where every item is
+a label name or a dict with a "name" and optionally a "key", "aliases" and
+"children", e.g. in a JSON file:
+
+    [
+        {"name": "nordic", "key": "n", "children": ["nb", "nn", "da", "sv"]},
+        {"name": "other", "aliases": ["unknown"]}
+    ]
+
+Every label is chosen by a sequence of keys, its own key after the keys of
+its groups. Labels without a key get the first free one of `KEYS`, so a flat
+list of five values is chosen with "1" to "5" as before. Groups with more
+labels than keys are split into groups of their own, so even hundreds of
+labels take two or three keystrokes. Labels can also be found by name or
+alias with `search`.
+
+Usage:
+    schema = LabelSchema.from_file("labels.json")
+    Annotator(data, schema, output)
+    python schema.py labels.json
+"""
+
+import json
+import math
+
+from argparse import ArgumentParser
+from pathlib import Path
+
+KEYS = "1234567890abcdefghijklmnopqrstuvwxyz"
+
+
+class LabelNode:
+    """
+    A label, or a group of labels, in a `LabelSchema`.
+
+    Instance Variables:
+            name (str): The name, the value saved for leaves.
+            key (str): The key choosing the label in its group.
+            aliases (list[str]): Other names to search by.
+            children (list[LabelNode]): The labels in the group, empty for leaves.
+            sequence (str): The keys choosing the label from the top of the schema.
+            values (set[str]): The values of the leaves under the label.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        key: str = None,
+        aliases: list[str] = (),
+        children: list["LabelNode"] = (),
+    ) -> None:
+        self.name = name
+        self.key = key
+        self.aliases = list(aliases)
+        self.children = list(children)
+        self.sequence = ""
+        self.values = set()
+
+    @property
+    def is_leaf(self) -> bool:
+        return not self.children
+
+    def __repr__(self) -> str:
+        return f"LabelNode({self.name!r}, key={self.key!r})"
+
+
+def parse_node(item: str | dict) -> LabelNode:
+    """
+    Parses an item of a schema declaration, see the module docstring.
+    """
+    if isinstance(item, str):
+        return LabelNode(item)
+    if not isinstance(item, dict) or "name" not in item:
+        raise ValueError(f"A label must be a name or a dict with a 'name', got {item}")
+    return LabelNode(
+        item["name"],
+        item.get("key"),
+        item.get("aliases", ()),
+        [parse_node(child) for child in item.get("children", ())],
+    )
+
+
+class LabelSchema:
+    """
+    A tree of labels with key sequences to choose them, see the module docstring.
+
+    Instance Variables:
+            root (LabelNode): The group of the top level labels.
+            keys (str): The keys assigned to labels without a key.
+            values (list[str]): The names of the leaves, in order.
+            sequences (dict[str, LabelNode]): The label or group chosen by every key sequence.
+            width (int): The largest number of labels in a group.
+    """
+
+    def __init__(self, spec: list[str | dict], keys: str = KEYS) -> None:
+        """
+        Parameters:
+                spec (list[str | dict]): The labels, see the module docstring.
+                keys (str): The keys assigned to labels without a key.
+        """
+        assert len(keys) > 1, "At least two keys are required"
+
+        self.root = LabelNode("", children=[parse_node(item) for item in spec])
+        self.keys = keys
+        self.values = []
+        self.sequences = {}
+        self.width = 0
+        self._assign(self.root)
+        self._leaves = {
+            node.name: node for node in self.sequences.values() if node.is_leaf
+        }
+
+        if len(set(self.values)) != len(self.values):
+            duplicates = sorted({v for v in self.values if self.values.count(v) > 1})
+            raise ValueError(f"Label names must be unique, got {duplicates} twice")
+
+    @classmethod
+    def from_values(cls, values: list[str]) -> "LabelSchema":
+        return cls(list(values))
+
+    @classmethod
+    def from_file(cls, path: str | Path) -> "LabelSchema":
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def _assign(self, group: LabelNode) -> None:
+        """
+        Assigns the keys and sequences of the labels in a group, and of their children.
+        """
+        taken = [child.key for child in group.children if child.key is not None]
+        for key in taken:
+            if len(key) != 1 or not key.isalnum():
+                raise ValueError(f"Keys must be a single letter or digit, got '{key}'")
+        if len(set(taken)) != len(taken):
+            raise ValueError(f"The labels in '{group.name}' must have different keys")
+        free = [key for key in self.keys if key not in taken]
+
+        unassigned = [child for child in group.children if child.key is None]
+        if len(unassigned) > len(free):
+            # Too many labels for one keystroke, so they are split into groups
+            # which take a key each, and the labels another key in their group
+            assert free, f"No keys left for the labels in '{group.name}'"
+            size = max(
+                math.ceil(len(unassigned) / len(free)),
+                math.ceil(math.sqrt(len(unassigned))),
+            )
+            chunks = [unassigned[i : i + size] for i in range(0, len(unassigned), size)]
+            pages = {
+                id(chunk[0]): LabelNode(
+                    f"{chunk[0].name} … {chunk[-1].name}", children=chunk
+                )
+                for chunk in chunks
+            }
+            unassigned = list(pages.values())
+            group.children = [
+                pages.get(id(child), child)
+                for child in group.children
+                if child.key is not None or id(child) in pages
+            ]
+
+        for child, key in zip(unassigned, free):
+            child.key = key
+
+        if len(group.children) > self.width:
+            self.width = len(group.children)
+        for child in group.children:
+            child.sequence = group.sequence + child.key
+            self.sequences[child.sequence] = child
+            if child.is_leaf:
+                child.values = {child.name}
+                self.values.append(child.name)
+            else:
+                self._assign(child)
+                child.values = set().union(*(c.values for c in child.children))
+
+    def get_parent(self, node: LabelNode) -> LabelNode:
+        return self.sequences.get(node.sequence[:-1], self.root)
+
+    def search(self, query: str, limit: int = None) -> list[LabelNode]:
+        """
+        Finds the leaves whose name or an alias contains the query, ignoring case.
+
+        The leaves named exactly the query come first, then the ones starting
+        with it, each in schema order.
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        ranked = []
+        for position, value in enumerate(self.values):
+            node = self._leaves[value]
+            names = [name.lower() for name in [node.name] + node.aliases]
+            if any(name == query for name in names):
+                ranked.append((0, position, node))
+            elif any(name.startswith(query) for name in names):
+                ranked.append((1, position, node))
+            elif any(query in name for name in names):
+                ranked.append((2, position, node))
+
+        ranked.sort(key=lambda match: match[:2])
+        return [node for _, _, node in ranked[:limit]]
+
+    def get_leaf(self, value: str) -> LabelNode:
+        return self._leaves[value]
+
+
+def get_schema(values: list[str] | LabelSchema) -> LabelSchema:
+    """
+    Returns the schema of a list of values, or the schema itself.
+    """
+    if isinstance(values, LabelSchema):
+        return values
+    return LabelSchema.from_values(values)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("schema", type=str, help="Path to a JSON label schema.")
+
+    args = parser.parse_args()
+
+    # Prints the keys of every label, e.g. as a cheat sheet
+    schema = LabelSchema.from_file(args.schema)
+    for sequence, node in schema.sequences.items():
+        indent = "  " * (len(sequence) - 1)
+        print(f"{indent}{sequence:<4} {node.name}{'' if node.is_leaf else ' ▸'}")
+    print(f"{len(schema.values)} labels")
@@ -0,0 +1,294 @@
+"""
+Sharded annotation sessions for several annotators.
+
+The input is split into `n` shards by a hash of the record id, so every
+annotator can run their own session against the same input without any
+coordination and without annotating the same instances twice. A fraction
+of the instances (`overlap`) can be put in every shard, to measure how much
+the annotators agree.
+
+The per-annotator outputs are merged into one dataset, and the agreement is
+computed per label from `values` as Cohen's kappa for every pair of
+annotators and Fleiss' kappa for all of them.
+
+Usage:
+    python annotation_tool.py data.jsonl --shard 0/3 --output annotator_0.jsonl
+    ...
+    python shards.py annotator_0.jsonl annotator_1.jsonl annotator_2.jsonl --output merged.jsonl
+"""
+
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+
+from argparse import ArgumentParser, ArgumentTypeError
+from itertools import combinations
+from pathlib import Path
+
+
+def get_record_hash(value) -> int:
+    """
+    Returns a 64 bit hash of the record id, which is stable across sessions and machines.
+    """
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """
+    Parses a shard given as "i/n" for the argument parser.
+    """
+    try:
+        i, n = (int(x) for x in shard.split("/"))
+    except ValueError:
+        raise ArgumentTypeError(f"Shard must be given as i/n, got '{shard}'")
+    if not 0 <= i < n:
+        raise ArgumentTypeError(f"Shard must satisfy 0 <= i < n, got '{shard}'")
+    return i, n
+
+
+def get_record_hashes(data, key: str) -> np.ndarray:
+    """
+    Returns the hash of `key` of every record. For a `JsonlDataset` the hashes are
+    cached next to the input like its line offsets, so the records are only decoded
+    the first time the input is sharded.
+    """
+    name = f"{key}.hashes"
+    load_cached = getattr(data, "load_cached", None)
+    hashes = load_cached(name) if load_cached is not None else None
+    if hashes is None:
+        hashes = np.fromiter(
+            (get_record_hash(data.get(i, key)) for i in range(len(data))),
+            dtype=np.uint64,
+            count=len(data),
+        )
+        if load_cached is not None:
+            data.save_cached(name, hashes)
+    return hashes
+
+
+def get_shard_indices(
+    data, shard: int, n_shards: int, key: str = None, overlap: float = 0.0
+) -> np.ndarray:
+    """
+    Finds the instances assigned to a shard.
+
+    Parameters:
+            data (JsonlDataset | DataFrameDataset): The full input, see `dataset.py`.
+            shard (int): The shard, from 0 to `n_shards` - 1.
+            n_shards (int): The number of shards.
+            key (str): The feature identifying a record, defaults to "id" if there is one and "text" otherwise.
+            overlap (float): The fraction of instances which are assigned to every shard.
+    Returns:
+            np.ndarray: The sorted working indices of the instances in the shard.
+    """
+    assert 0 <= shard < n_shards, "Shard must satisfy 0 <= shard < n_shards"
+    assert 0.0 <= overlap <= 1.0, "Overlap must be between 0 and 1"
+
+    if key is None:
+        key = "id" if "id" in data.columns else "text"
+
+    hashes = get_record_hashes(data, key)
+    # The low bits pick the shard, and the high bits the shared instances
+    in_shard = hashes % np.uint64(n_shards) == shard
+    shared = (hashes >> np.uint64(32)) < np.uint64(overlap * (1 << 32))
+
+    return np.flatnonzero(in_shard | shared)
+
+
+class ShardDataset:
+    """
+    The instances of one shard of a dataset.
+
+    Records keep the `working_index` of the full dataset, so the outputs of all
+    shards can be merged.
+
+    Instance Variables:
+            data (JsonlDataset | DataFrameDataset): The full input.
+            indices (np.ndarray): The working indices of the instances in the shard.
+            columns (list[str]): The columns of the full input.
+    """
+
+    def __init__(
+        self, data, shard: int, n_shards: int, key: str = None, overlap: float = 0.0
+    ) -> None:
+        self.data = data
+        self.columns = data.columns
+        self.indices = get_shard_indices(data, shard, n_shards, key, overlap)
+        self._indices = self.indices.tolist()
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __getitem__(self, i: int) -> dict:
+        return self.data[self._indices[i]]
+
+    def get(self, i: int, feature: str):
+        return self.data.get(self._indices[i], feature)
+
+    def get_position(self, working_index: int) -> int:
+        """
+        Returns the position in the shard of the first instance at or after `working_index`.
+        """
+        return int(np.searchsorted(self.indices, working_index))
+
+    def close(self) -> None:
+        self.data.close()
+
+
+def read_output(path: str | Path) -> pd.DataFrame:
+    """
+    Reads the results of one annotator, where the last result for an instance replaces any earlier ones.
+    """
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    df = pd.DataFrame(records)
+    if "working_index" not in df.columns:
+        # Older outputs were annotated in order from the first instance
+        df["working_index"] = range(len(df))
+
+    return df.drop_duplicates("working_index", keep="last").set_index("working_index")
+
+
+def get_label_matrix(df: pd.DataFrame, values: list[str]) -> np.ndarray:
+    """
+    Returns a boolean matrix with one row per result and one column per value.
+    """
+    value_index = {value: j for j, value in enumerate(values)}
+    matrix = np.zeros((len(df), len(values)), dtype=bool)
+    for i, languages in enumerate(df["languages"]):
+        for language in languages:
+            if language in value_index:
+                matrix[i, value_index[language]] = True
+    return matrix
+
+
+def cohen_kappa(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Cohen's kappa of two annotators for every label.
+
+    Parameters:
+            a, b (np.ndarray): Boolean matrices of shape (instances, labels).
+    Returns:
+            np.ndarray: The kappa of every label, NaN where it is undefined.
+    """
+    observed = (a == b).mean(axis=0)
+    pa, pb = a.mean(axis=0), b.mean(axis=0)
+    expected = pa * pb + (1 - pa) * (1 - pb)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (observed - expected) / (1 - expected)
+
+
+def fleiss_kappa(ratings: np.ndarray) -> np.ndarray:
+    """
+    Fleiss' kappa of all annotators for every label.
+
+    Parameters:
+            ratings (np.ndarray): Boolean array of shape (annotators, instances, labels).
+    Returns:
+            np.ndarray: The kappa of every label, NaN where it is undefined.
+    """
+    m = ratings.shape[0]
+    yes = ratings.sum(axis=0)  # (instances, labels)
+    no = m - yes
+    agreement = (yes * (yes - 1) + no * (no - 1)) / (m * (m - 1))
+    p_yes = yes.mean(axis=0) / m
+    expected = p_yes**2 + (1 - p_yes) ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (agreement.mean(axis=0) - expected) / (1 - expected)
+
+
+def merge_outputs(
+    paths: list[str | Path], values: list[str]
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Merges the results of several annotators, named after their output files.
+
+    Returns:
+            tuple[pd.DataFrame, pd.DataFrame]: A tuple containing:
+                    - the merged dataset with one row per instance, the labels chosen
+                      by a majority of its annotators as "languages" and the results
+                      of every annotator in "annotations"
+                    - the agreement per label, with Cohen's kappa for every pair of
+                      annotators and Fleiss' kappa for instances annotated by all of them
+    """
+    assert len(paths) > 0, "At least one output is required"
+    outputs = {Path(path).stem: read_output(path) for path in paths}
+    names = list(outputs)
+
+    index = sorted(set().union(*(df.index for df in outputs.values())))
+    # (annotators, instances, labels) and whether each annotator has each instance
+    ratings = np.zeros((len(names), len(index), len(values)), dtype=bool)
+    annotated = np.zeros((len(names), len(index)), dtype=bool)
+    position = pd.Index(index)
+    for k, name in enumerate(names):
+        rows = position.get_indexer(outputs[name].index)
+        ratings[k, rows] = get_label_matrix(outputs[name], values)
+        annotated[k, rows] = True
+
+    # First text and original label found for every instance
+    first = pd.concat(outputs.values()).groupby(level=0).first()
+    merged = pd.DataFrame(index=pd.Index(index, name="working_index"))
+    merged["text"] = first["text"]
+    if "original" in first.columns:
+        merged["original"] = first["original"]
+
+    n_annotators = annotated.sum(axis=0)
+    majority = ratings.sum(axis=0) * 2 > n_annotators[:, None]
+    merged["languages"] = [
+        [value for value, chosen in zip(values, row) if chosen] for row in majority
+    ]
+    merged["annotations"] = [
+        {
+            name: [value for value, chosen in zip(values, ratings[k, i]) if chosen]
+            for k, name in enumerate(names)
+            if annotated[k, i]
+        }
+        for i in range(len(index))
+    ]
+    merged["n_annotators"] = n_annotators
+
+    agreement = pd.DataFrame(index=pd.Index(values, name="label"))
+    for (k, a), (l, b) in combinations(enumerate(names), 2):
+        both = annotated[k] & annotated[l]
+        agreement[f"cohen {a}/{b}"] = (
+            cohen_kappa(ratings[k, both], ratings[l, both]) if both.any() else np.nan
+        )
+    if len(names) > 1:
+        everyone = annotated.all(axis=0)
+        agreement["fleiss"] = (
+            fleiss_kappa(ratings[:, everyone]) if everyone.any() else np.nan
+        )
+        agreement["n_shared"] = everyone.sum()
+
+    return merged.reset_index(), agreement
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument(
+        "outputs", type=str, nargs="+", help="Results of every annotator."
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="merged_multi-label.jsonl",
+        help="Where to save the merged results.",
+    )
+    parser.add_argument(
+        "--values",
+        type=str,
+        nargs="+",
+        default=["nb", "nn", "da", "sv", "other"],
+        help="The values annotated.",
+    )
+
+    args = parser.parse_args()
+
+    merged, agreement = merge_outputs(args.outputs, args.values)
+    merged.to_json(args.output, orient="records", lines=True, force_ascii=False)
+
+    print(f"Merged {len(merged)} instances from {len(args.outputs)} annotators")
+    print(agreement.round(3).to_string())
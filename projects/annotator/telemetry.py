@@ -0,0 +1,206 @@
+"""
+Session telemetry of the Annotator.
+
+`SessionTelemetry` logs one record per item to `<output>.telemetry.jsonl`:
+how long the item was shown before it was submitted (`dwell`), the number of
+keystrokes and clicks, how long `update_labels` took to show it, including Tk
+redrawing the window (`render_ms`, without drawing for the `HeadlessAnnotator`),
+the number of labels chosen, and whether it was accepted from a suggestion
+without being shown (`auto`). The records are written in batches by an
+`AnnotationWriter`, see `writer.py`.
+
+`summarize` reports the throughput, the percentiles of the dwell and render
+latency, and the slowest items, per session and overall. The throughput is per
+hour of dwell on the items annotated by hand, separately for those items
+(`manual/hour`) and for the suggestions accepted without being shown
+(`auto/hour`). Dwell times longer than `idle` seconds are counted as breaks and
+capped, so a session left open over lunch does not ruin the throughput.
+
+Usage:
+    python annotation_tool.py data.jsonl  # Logs to validation_multi-label.jsonl.telemetry.jsonl
+    python telemetry.py validation_multi-label.jsonl.telemetry.jsonl
+"""
+
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from writer import AnnotationWriter
+
+# The fields of a telemetry record, for logs without any
+COLUMNS = {
+    "session": str,
+    "working_index": int,
+    "shown_at": float,
+    "render_ms": float,
+    "keystrokes": int,
+    "clicks": int,
+    "dwell": float,
+    "n_labels": int,
+    "auto": bool,
+}
+
+
+def get_telemetry_path(output: str | Path) -> Path:
+    output = Path(output)
+    return output.with_name(output.name + ".telemetry.jsonl")
+
+
+class SessionTelemetry:
+    """
+    Logs the dwell time, keystrokes and render latency of every item in a session.
+
+    Instance Variables:
+            path (Path): The path of the telemetry log.
+            session (str): The start time of the session, which identifies its records.
+            writer (AnnotationWriter): The buffered writer of the log.
+            n_items (int): The number of items logged in the session.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        batch_size: int = 50,
+        flush_interval: float = 30.0,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        self.path = Path(path)
+        self.session = datetime.now().isoformat(timespec="milliseconds")
+        self.writer = AnnotationWriter(path, batch_size, flush_interval)
+        self.clock = clock
+        self.n_items = 0
+        self._item = None
+        self._start = None
+
+    def start_item(self, working_index: int, render_seconds: float) -> None:
+        """
+        Called when an item is shown, with how long it took to show it.
+        """
+        self._item = {
+            "working_index": working_index,
+            "shown_at": time.time(),
+            "render_ms": render_seconds * 1000,
+            "keystrokes": 0,
+            "clicks": 0,
+        }
+        self._start = self.clock()
+
+    def keystroke(self) -> None:
+        if self._item is not None:
+            self._item["keystrokes"] += 1
+
+    def click(self) -> None:
+        if self._item is not None:
+            self._item["clicks"] += 1
+
+    def end_item(self, n_labels: int, auto: bool = False) -> None:
+        """
+        Called when the item shown is submitted, and logs it.
+        """
+        if self._item is None:
+            return
+
+        record = {"session": self.session, **self._item}
+        record["dwell"] = self.clock() - self._start
+        record["n_labels"] = n_labels
+        record["auto"] = auto
+        self.writer.write(record)
+        self.n_items += 1
+        self._item = None
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def read_telemetry(path: str | Path) -> pd.DataFrame:
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return pd.DataFrame(records)
+
+
+def _summarize_items(df: pd.DataFrame, idle: float) -> dict:
+    manual = df[~df["auto"]]
+    dwell = manual["dwell"].clip(upper=idle)
+    hours = dwell.sum() / 3600
+    render = df["render_ms"].to_numpy()
+
+    summary = {
+        "items": len(df),
+        "auto": int(df["auto"].sum()),
+        "manual/hour": len(manual) / hours if hours > 0 else np.nan,
+        "auto/hour": (len(df) - len(manual)) / hours if hours > 0 else np.nan,
+        "breaks": int((manual["dwell"] > idle).sum()),
+        "keystrokes/item": manual["keystrokes"].mean(),
+        "clicks/item": manual["clicks"].mean(),
+    }
+    for q in [50, 90, 99]:
+        summary[f"dwell p{q} (s)"] = np.percentile(dwell, q) if len(dwell) else np.nan
+    for q in [50, 95, 99]:
+        summary[f"render p{q} (ms)"] = np.percentile(render, q) if len(df) else np.nan
+    summary["render max (ms)"] = render.max() if len(df) else np.nan
+
+    return summary
+
+
+def summarize(
+    df: pd.DataFrame, idle: float = 300.0, n_slowest: int = 10
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Summarizes the telemetry per session and overall.
+
+    Parameters:
+            df (pd.DataFrame): The telemetry, see `read_telemetry`.
+            idle (float): The dwell in seconds above which an item counts as a break.
+            n_slowest (int): The number of slowest items to report.
+    Returns:
+            tuple[pd.DataFrame, pd.DataFrame]: A tuple containing:
+                    - the summary with one row per session, and one for all sessions
+                    - the items which were shown the longest, excluding breaks
+    """
+    if df.empty:
+        # E.g. an empty log, which gives a DataFrame without columns
+        df = pd.DataFrame(
+            {column: pd.Series(dtype=dtype) for column, dtype in COLUMNS.items()}
+        )
+
+    sessions = {
+        session: _summarize_items(items, idle)
+        for session, items in df.groupby("session", sort=True)
+    }
+    sessions["all"] = _summarize_items(df, idle)
+    summary = pd.DataFrame.from_dict(sessions, orient="index")
+    summary.index.name = "session"
+
+    manual = df[~df["auto"] & (df["dwell"] <= idle)]
+    slowest = manual.nlargest(n_slowest, "dwell")[
+        ["session", "working_index", "dwell", "keystrokes", "clicks", "render_ms"]
+    ]
+
+    return summary, slowest
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("telemetry", type=str, help="Path to a telemetry log.")
+    parser.add_argument(
+        "--idle",
+        type=float,
+        default=300.0,
+        help="Seconds on an item above which it counts as a break.",
+    )
+    parser.add_argument("--slowest", type=int, default=10)
+
+    args = parser.parse_args()
+
+    summary, slowest = summarize(
+        read_telemetry(args.telemetry), args.idle, args.slowest
+    )
+    print(summary.round(2).T.to_string())
+    print(f"\nSlowest {len(slowest)} items:")
+    print(slowest.round(2).to_string(index=False))
@@ -0,0 +1,115 @@
+"""
+Tests of the submit cycle of the annotator, driven through the `HeadlessAnnotator`.
+
+Usage:
+    python -m pytest test_annotator.py
+"""
+
+import json
+import numpy as np
+import pytest
+
+from annotator import AnnotationSession, HeadlessAnnotator
+from prelabel import Suggestions
+from writer import get_resume_index
+
+VALUES = ["nb", "nn", "da", "sv", "other"]
+END = "All instances have been annotated."
+
+
+@pytest.fixture
+def input(tmp_path):
+    path = tmp_path / "data.jsonl"
+    with open(path, "w") as f:
+        for i in range(5):
+            f.write(json.dumps({"text": f"Tekst {i}", "languages": ["nb"]}) + "\n")
+    return path
+
+
+def read_results(path) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_session_is_abstract():
+    with pytest.raises(TypeError):
+        AnnotationSession()
+
+
+def test_submit(input, tmp_path):
+    output = tmp_path / "results.jsonl"
+    a = HeadlessAnnotator(input, VALUES, output)
+    assert a.labels["text"]["text"] == "Tekst 0"
+
+    a.select(["nb", "da"])
+    a.on_submit()
+    assert a.labels["text"]["text"] == "Tekst 1"
+    assert a.selected == []
+    a.select(["nn"])
+    a.on_submit()
+    a.close()
+
+    results = read_results(output)
+    assert [r["working_index"] for r in results] == [0, 1]
+    assert [r["languages"] for r in results] == [["nb", "da"], ["nn"]]
+    assert results[0]["text"] == "Tekst 0"
+    assert results[0]["original"] == ["nb"]
+
+
+def test_resume(input, tmp_path):
+    output = tmp_path / "results.jsonl"
+    a = HeadlessAnnotator(input, VALUES, output, batch_size=1)
+    for _ in range(3):
+        a.select(["sv"])
+        a.on_submit()
+    a.close()
+
+    start_idx = get_resume_index(output)
+    assert start_idx == 3
+    a = HeadlessAnnotator(input, VALUES, output, start_idx=start_idx)
+    assert a.record["working_index"] == 3
+    a.on_submit()
+    a.close()
+    assert [r["working_index"] for r in read_results(output)] == [0, 1, 2, 3]
+
+
+def test_end_of_data(input, tmp_path):
+    output = tmp_path / "results.jsonl"
+    a = HeadlessAnnotator(input, VALUES, output, start_idx=3)
+    a.on_submit()
+    a.on_submit()
+    assert a.record is None
+    assert a.labels["text"]["text"] == END
+    # The results are saved at the end, before the session is closed
+    assert len(read_results(output)) == 2
+
+    a.on_submit()
+    a.close()
+    assert [r["working_index"] for r in read_results(output)] == [3, 4]
+
+
+def test_auto_accept_until_the_end(input, tmp_path):
+    path = tmp_path / "suggestions.npz"
+    confidence = np.array([0.5, 0.999, 0.999, 0.5, 0.999], dtype=np.float32)
+    np.savez(
+        path,
+        labels=np.full(5, 0b10, dtype=np.uint32),
+        confidence=confidence,
+        values=np.array(VALUES),
+    )
+    output = tmp_path / "results.jsonl"
+    a = HeadlessAnnotator(
+        input, VALUES, output, suggestions=Suggestions(path), auto_accept=0.99
+    )
+    # The suggestion is pre-checked, but not accepted
+    assert a.record["working_index"] == 0
+    assert a.selected == ["nn"]
+    a.on_submit()
+    assert a.record["working_index"] == 3
+    a.on_submit()
+    assert a.record is None
+    a.close()
+
+    results = read_results(output)
+    assert [r["working_index"] for r in results] == [0, 1, 2, 3, 4]
+    assert [r.get("auto", False) for r in results] == [False, True, True, False, True]
@@ -0,0 +1,224 @@
+"""
+Buffered writer for the annotations.
+
+Instead of opening the output file on every submit, `AnnotationWriter` keeps it
+open and appends the records in batches. A batch is written and fsynced once it
+has `batch_size` records or `flush_interval` seconds have passed since the last
+flush, so a crash loses at most one batch. After every flush a small checkpoint
+(`<output>.ckpt`) is written with the index of the last saved instance and the
+size of the output, which `get_resume_index` uses to continue where the
+previous session stopped without reading the whole output.
+
+Usage:
+    with AnnotationWriter("validation_multi-label.jsonl") as writer:
+        writer.write({"working_index": 0, "text": ..., "languages": ["nb"]})
+"""
+
+import json
+import os
+import time
+
+from pathlib import Path
+from typing import BinaryIO, Callable
+
+# Bytes read at a time when looking for the last newline of the output
+_BLOCK_SIZE = 1 << 16
+
+
+def get_checkpoint_path(output: str | Path) -> Path:
+    output = Path(output)
+    return output.with_name(output.name + ".ckpt")
+
+
+def _get_end(f: BinaryIO) -> int:
+    """
+    Finds the end of the last complete line, reading back from the end of the file in blocks.
+    """
+    end = f.seek(0, os.SEEK_END)
+    while end > 0:
+        start = max(end - _BLOCK_SIZE, 0)
+        f.seek(start)
+        newline = f.read(end - start).rfind(b"\n")
+        if newline != -1:
+            return start + newline + 1
+        end = start
+    return 0
+
+
+def _repair(path: Path) -> int:
+    """
+    Truncates a partially written last line, e.g. from a crash in the middle of a flush.
+
+    Returns:
+            int: The number of complete records in the file.
+    """
+    if not path.exists():
+        return 0
+
+    with open(path, "rb+") as f:
+        end = _get_end(f)
+        if end != f.seek(0, os.SEEK_END):
+            f.truncate(end)
+
+        # The file is only read if it does not match the checkpoint
+        checkpoint = read_checkpoint(path)
+        if checkpoint.get("size") == end and "n_records" in checkpoint:
+            return checkpoint["n_records"]
+        f.seek(0)
+        return sum(1 for line in f if line.strip())
+
+
+def read_checkpoint(output: str | Path) -> dict:
+    """
+    Returns the checkpoint of the output file, or an empty dict if there is none.
+    """
+    try:
+        with open(get_checkpoint_path(output)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class AnnotationWriter:
+    """
+    Appends annotation records to a JSONL file in fsynced batches.
+
+    Instance Variables:
+            path (Path): The path of the output file.
+            batch_size (int): The number of records which triggers a flush.
+            flush_interval (float): The number of seconds after which buffered records are flushed.
+            n_records (int): The number of records saved to the output file.
+            last_index (int | None): The working index of the last saved record.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        batch_size: int = 20,
+        flush_interval: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        assert batch_size > 0, "batch_size must be positive"
+
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.clock = clock
+
+        self.n_records = _repair(self.path)
+        checkpoint = read_checkpoint(self.path)
+        self.last_index = checkpoint.get("last_index")
+
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._buffer = []
+        self._buffer_index = self.last_index
+        self._last_flush = self.clock()
+
+    @property
+    def checkpoint_path(self) -> Path:
+        return get_checkpoint_path(self.path)
+
+    @property
+    def pending(self) -> int:
+        """The number of records which are not saved yet."""
+        return len(self._buffer)
+
+    def write(self, record: dict) -> None:
+        """
+        Buffers a record, and flushes the buffer if the batch is full or the flush interval has passed.
+        """
+        self._buffer.append(json.dumps(record) + "\n")
+        if "working_index" in record:
+            self._buffer_index = record["working_index"]
+
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self) -> None:
+        if self._buffer and self.clock() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes the buffered records to disk and updates the checkpoint.
+        """
+        self._last_flush = self.clock()
+        if not self._buffer:
+            return
+
+        self._file.write("".join(self._buffer))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        self.n_records += len(self._buffer)
+        self._buffer = []
+        self.last_index = self._buffer_index
+        self._write_checkpoint()
+
+    def _write_checkpoint(self) -> None:
+        # Written to a temporary file first so a crash never leaves a torn checkpoint
+        tmp = self.checkpoint_path.with_name(self.checkpoint_path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "last_index": self.last_index,
+                    "n_records": self.n_records,
+                    "size": os.fstat(self._file.fileno()).st_size,
+                },
+                f,
+            )
+        os.replace(tmp, self.checkpoint_path)
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self) -> "AnnotationWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def get_resume_index(output: str | Path) -> int:
+    """
+    Finds the index of the first instance which is not annotated in the output file yet.
+
+    The checkpoint is used if it matches the size of the output file. Otherwise
+    the output is scanned for the highest `working_index`, and older outputs
+    without it are assumed to have been annotated from the first instance.
+    """
+    output = Path(output)
+    if not output.exists():
+        return 0
+
+    checkpoint = read_checkpoint(output)
+    with open(output, "rb") as f:
+        if (
+            checkpoint.get("size") == _get_end(f)
+            and checkpoint.get("last_index") is not None
+        ):
+            return checkpoint["last_index"] + 1
+
+        f.seek(0)
+        n_lines = 0
+        last_index = None
+        for line in f:
+            if not line.strip():
+                continue
+            n_lines += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A torn last line, which the writer truncates
+            if "working_index" in record:
+                last_index = max(last_index or 0, record["working_index"])
+
+    if last_index is None:
+        return n_lines
+
+    return last_index + 1
@@ -0,0 +1,325 @@
+"""
+Benchmarks for the travel board, run against the local mock journey planner.
+
+Usage:
+	python bench.py client [--requests 200] [--latency 0.01]
+	python bench.py stops [--sizes 4 10000 500000]
+	python bench.py templates [--renders 100000]
+	python bench.py trips [--patterns 100000]
+	python bench.py board [--hours 2]
+	python bench.py offline [--stops 500] [--lines 50]
+	python bench.py metrics [--calls 100000]
+"""
+import asyncio
+import random
+import statistics
+import time
+import tracemalloc
+
+import pandas as pd
+import requests
+
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+
+from board import Board, FakeClock
+from client import JourneyPlannerClient
+from metrics import METRICS
+from mock_server import MockJourneyPlanner, get_mock_trip_patterns
+from offline import OfflinePlanner, get_synthetic_timetable
+from query_template import QueryTemplate, load_template
+from stop_index import StopIndex
+from trip import Trip, TripTable
+from utils import (
+	_get_stops_with_checks,
+	get_query_templates,
+	get_stop_index,
+	get_trip_query_body,
+)
+
+QUERY = '{ trip(numTripPatterns: 3) { tripPatterns { duration } } }'
+
+
+def _report(name: str, latencies: list[float], total: float) -> None:
+	latencies = sorted(latencies)
+	p50 = statistics.median(latencies)
+	p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+	print(f"{name:<28} {len(latencies) / total:>9.1f} req/s"
+       	  f"  p50 {p50 * 1000:>7.2f} ms  p99 {p99 * 1000:>7.2f} ms")
+
+
+def bench_client(n_requests: int, latency: float) -> None:
+	"""
+	Compares one `requests.post` per query (a new connection every time) to
+	the pooled `JourneyPlannerClient`, sequentially and concurrently.
+	"""
+	with MockJourneyPlanner(latency=latency) as server:
+		# Old path: one blocking request and connection per query
+		latencies = []
+		start = time.perf_counter()
+		for _ in range(n_requests):
+			t = time.perf_counter()
+			requests.post(url=server.url, json={"query": QUERY}).json()
+			latencies.append(time.perf_counter() - t)
+		_report("requests.post", latencies, time.perf_counter() - start)
+
+		for max_in_flight in (1, 8, 32):
+			with JourneyPlannerClient(server.url, max_in_flight) as client:
+				latencies = []
+
+				# One worker per connection, each posting queries back to back
+				async def worker(n: int) -> None:
+					for _ in range(n):
+						t = time.perf_counter()
+						await client.apost(QUERY)
+						latencies.append(time.perf_counter() - t)
+
+				async def run() -> None:
+					n = n_requests // max_in_flight
+					await asyncio.gather(*(worker(n) for _ in range(max_in_flight)))
+
+				start = time.perf_counter()
+				asyncio.run(run())
+				_report(f"client (max_in_flight={max_in_flight})",
+            			latencies, time.perf_counter() - start)
+
+
+def _get_synthetic_stops(n: int) -> pd.DataFrame:
+	names = [f"Stop {i}, Town {i % 356}" for i in range(n)]
+	return pd.DataFrame({
+		"name": names,
+		"id": [f"NSR:StopPlace:{i}" for i in range(n)],
+		"key": [name.split(",")[0].lower() for name in names],
+	})
+
+
+def _time_lookups(stops, keys: list[str]) -> float:
+	""" Seconds per `_get_stops_with_checks` call. """
+	start = time.perf_counter()
+	for key in keys:
+		_get_stops_with_checks(stops, key)
+	return (time.perf_counter() - start) / len(keys)
+
+
+def bench_stops(sizes: list[int], n_lookups: int) -> None:
+	"""
+	Compares stop lookups through a dataframe scan to the `StopIndex`, for
+	stop tables of different sizes.
+	"""
+	print(f"{'stops':>8} {'build':>10} {'dataframe':>12} {'index':>10}"
+          f" {'search':>10}")
+	for size in sizes:
+		df = _get_synthetic_stops(size)
+		keys = [f"stop {i * 7919 % size}" for i in range(n_lookups)]
+
+		start = time.perf_counter()
+		index = StopIndex(df)
+		build = time.perf_counter() - start
+
+		# Scanning is slow on big tables, so fewer lookups are timed there
+		scan = _time_lookups(df, keys[:max(10, n_lookups * 1000 // size)])
+		lookup = _time_lookups(index, keys)
+
+		index.search("stpo 1")    # Build the trigram index before timing
+		start = time.perf_counter()
+		for key in keys[:10]:
+			index.search(key[:-1] + "x")
+		search = (time.perf_counter() - start) / 10
+
+		print(f"{size:>8} {build * 1000:>8.1f}ms {scan * 1e6:>10.1f}us"
+        	  f" {lookup * 1e6:>8.2f}us {search * 1000:>8.2f}ms")
+
+
+def _render_with_replace(template: str, values: dict[str, str]) -> str:
+	""" The old way of filling in templates, one `str.replace` per value. """
+	for name, value in values.items():
+		template = template.replace("{" + name + "}", value)
+	return template
+
+
+def bench_templates(n_renders: int) -> None:
+	""" Render throughput of chained `str.replace` vs `QueryTemplate`. """
+	template = load_template(Path(__file__).parent / "query_templates/trip.txt")
+	values = {
+		"start_id": "NSR:StopPlace:62339",
+		"start_name": "Lillestrøm stasjon, Lillestrøm",
+		"end_id": "NSR:StopPlace:59600",
+		"end_name": "Forskningsparken, Oslo",
+		"n": "3",
+		"datetime": "2024-08-22T13:28:48.500+02:00",
+	}
+	assert _render_with_replace(template.source, values) \
+		== template.render(**values)
+
+	start = time.perf_counter()
+	for _ in range(n_renders):
+		_render_with_replace(template.source, values)
+	replace = n_renders / (time.perf_counter() - start)
+
+	start = time.perf_counter()
+	for _ in range(n_renders):
+		template.render(**values)
+	render = n_renders / (time.perf_counter() - start)
+
+	start = time.perf_counter()
+	for _ in range(n_renders // 100):
+		QueryTemplate(template.source)
+	compile_ = n_renders // 100 / (time.perf_counter() - start)
+
+	print(f"str.replace chain      {replace:>12,.0f} renders/s")
+	print(f"QueryTemplate.render   {render:>12,.0f} renders/s")
+	print(f"QueryTemplate compile  {compile_:>12,.0f} compiles/s")
+
+
+def _time_and_measure(f, *args) -> tuple[float, int]:
+	""" Seconds taken by `f(*args)` and the bytes still held by its result. """
+	start = time.perf_counter()
+	f(*args)
+	seconds = time.perf_counter() - start
+
+	# Tracing slows everything down, so memory is measured in a second run
+	tracemalloc.start()
+	res = f(*args)
+	size, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del res
+	return seconds, size
+
+
+def bench_trips(n_patterns: int) -> None:
+	""" Parse time and memory of `Trip` vs `TripTable` for a big response. """
+	res = {"trip": {"tripPatterns": get_mock_trip_patterns(n_patterns)}}
+
+	table = TripTable(res)
+	for name, f in [("Trip", Trip), ("TripTable", TripTable),
+                 	("TripTable.to_trip", lambda r: table.to_trip())]:
+		seconds, size = _time_and_measure(f, res)
+		print(f"{name:<18} {seconds * 1000:>9.1f} ms {size / 2**20:>9.1f} MiB")
+
+
+def bench_board(hours: float) -> None:
+	"""
+	Number of requests and rendered rows of the board with adaptive refreshes
+	vs polling every 15 seconds, on a fake clock, for different headways.
+	"""
+	dir = Path(__file__).parent
+	stops = get_stop_index(dir)
+	template = get_query_templates(dir / "query_templates")["trip"]
+	routes = [("Lillestrøm stasjon", "Forskningsparken"), ("Oslo S", "Åråsen"),
+           	  ("Åråsen", "Oslo S"), ("Oslo S", "Forskningsparken")]
+
+	print(f"{'headway':>8} {'schedule':>9} {'requests':>9} {'renders':>8}")
+	for headway in (300, 1200, 3600):
+		for name, bounds in [("adaptive", (15, 300)), ("fixed", (15, 15))]:
+			clock = FakeClock(1_800_000_000.0)
+			renders = []
+			with MockJourneyPlanner(clock=clock, headway=headway) as server, \
+				 JourneyPlannerClient(server.url) as client:
+				board = Board(routes, stops, template, client,
+                  			  min_refresh=bounds[0], max_refresh=bounds[1],
+                  			  clock=clock, sleep=clock.sleep,
+                  			  render=lambda route, row: renders.append(row))
+				board.run(duration=hours * 3600)
+			print(f"{headway:>7}s {name:>9} {board.n_requests:>9} {len(renders):>8}")
+
+
+def bench_offline(n_stops: int, n_lines: int, n_queries: int) -> None:
+	""" Query time of the offline planner on a synthetic timetable. """
+	df = _get_synthetic_stops(n_stops)
+	stops = StopIndex(df)
+	timetable = get_synthetic_timetable(df["id"].tolist(), n_lines=n_lines,
+                                     	stops_per_line=20)
+
+	start = time.perf_counter()
+	planner = OfflinePlanner(timetable)
+	print(f"Loaded {len(planner):,} connections in "
+       	  f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+	# Pairs of stops on the same line, like the common commute routes, and
+	# random pairs needing transfers
+	rng = random.Random(0)
+	line = timetable[timetable["trip_id"] == timetable["trip_id"].iloc[0]]
+	line_pairs = [(line["departure_stop"].iloc[0], line["arrival_stop"].iloc[-1])]
+	random_pairs = [tuple(rng.sample(df["id"].tolist(), 2))
+                 	for _ in range(n_queries)]
+	departure = datetime(2024, 8, 22, 7, 30).astimezone()
+
+	for name, pairs in [("same line", line_pairs * n_queries),
+                     	("random pairs", random_pairs)]:
+		latencies = []
+		for a, b in pairs:
+			t = time.perf_counter()
+			planner.get_trip(a, b, stops, n=1, time=departure)
+			latencies.append(time.perf_counter() - t)
+		_report(f"offline ({name})", latencies, sum(latencies))
+
+
+def bench_metrics(n_calls: int) -> None:
+	""" Overhead of the instrumentation on `get_trip_query_body`. """
+	dir = Path(__file__).parent
+	stops = get_stop_index(dir)
+	template = get_query_templates(dir / "query_templates")["trip"]
+	args = ("Lillestrøm stasjon", "Forskningsparken", stops, template)
+
+	for name, f, enabled in [("uninstrumented", get_trip_query_body.__wrapped__, False),
+                          	 ("disabled", get_trip_query_body, False),
+                          	 ("enabled", get_trip_query_body, True)]:
+		METRICS.enabled = enabled
+		start = time.perf_counter()
+		for _ in range(n_calls):
+			f(*args)
+		per_call = (time.perf_counter() - start) / n_calls
+		print(f"{name:<16} {per_call * 1e6:>8.2f} us/call")
+	METRICS.disable()
+
+
+if __name__ == "__main__":
+	parser = ArgumentParser()
+	subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+	client_parser = subparsers.add_parser("client",
+                                      	  help="HTTP client throughput.")
+	client_parser.add_argument("--requests", "-n", type=int, default=200)
+	client_parser.add_argument("--latency", type=float, default=0.01,
+                            	help="Seconds the mock server waits per query.")
+
+	stops_parser = subparsers.add_parser("stops", help="Stop lookup speed.")
+	stops_parser.add_argument("--sizes", type=int, nargs="+",
+                           	  default=[4, 10_000, 500_000])
+	stops_parser.add_argument("--lookups", type=int, default=1000)
+
+	templates_parser = subparsers.add_parser("templates",
+                                         	 help="Query template rendering.")
+	templates_parser.add_argument("--renders", type=int, default=100_000)
+
+	trips_parser = subparsers.add_parser("trips", help="Response parsing.")
+	trips_parser.add_argument("--patterns", type=int, default=100_000)
+
+	board_parser = subparsers.add_parser("board", help="Board refresh schedule.")
+	board_parser.add_argument("--hours", type=float, default=2)
+
+	offline_parser = subparsers.add_parser("offline", help="Offline planner.")
+	offline_parser.add_argument("--stops", type=int, default=500)
+	offline_parser.add_argument("--lines", type=int, default=50)
+	offline_parser.add_argument("--queries", type=int, default=200)
+
+	metrics_parser = subparsers.add_parser("metrics",
+                                       	   help="Instrumentation overhead.")
+	metrics_parser.add_argument("--calls", type=int, default=100_000)
+
+	args = parser.parse_args()
+	if args.benchmark == "client":
+		bench_client(args.requests, args.latency)
+	elif args.benchmark == "stops":
+		bench_stops(args.sizes, args.lookups)
+	elif args.benchmark == "templates":
+		bench_templates(args.renders)
+	elif args.benchmark == "trips":
+		bench_trips(args.patterns)
+	elif args.benchmark == "board":
+		bench_board(args.hours)
+	elif args.benchmark == "offline":
+		bench_offline(args.stops, args.lines, args.queries)
+	elif args.benchmark == "metrics":
+		bench_metrics(args.calls)
@@ -0,0 +1,218 @@
+"""
+Long-running departure board.
+
+Holds a set of routes and refreshes each of them on its own schedule instead
+of polling everything at a fixed interval: a route is refreshed after half of
+the time until its next departure (so sooner when a departure is imminent),
+clamped to [`min_refresh`, `max_refresh`], and only every `max_refresh`
+seconds when nothing leaves within `idle_after` seconds. Routes that are due
+at the same time are fetched in one batched query, and only rows that changed
+are rendered again. When the journey planner can't be reached, the due routes
+keep their last rows and are tried again after a backoff, starting at
+`min_refresh` seconds and doubling up to `max_refresh`.
+
+The clock and sleep function can be swapped out, e.g. for a `FakeClock` and
+the mock journey planner to run the board deterministically.
+
+Usage:
+	python board.py --route "Lillestrøm stasjon" "Forskningsparken" \
+		--route "Oslo S" "Åråsen"
+"""
+import heapq
+import requests
+import time
+
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Callable
+
+from cache import TripCache
+from client import JourneyPlannerClient
+from dashboard import get_trips
+from query_template import QueryTemplate
+from trip import Trip
+from utils import get_query_templates, get_stop_index
+
+Route = tuple[str, str]
+
+
+class FakeClock:
+	""" A clock that only moves when `sleep` is called. """
+	def __init__(self, start: float = 0.0) -> None:
+		self.now = start
+
+	def __call__(self) -> float:
+		return self.now
+
+	def sleep(self, seconds: float) -> None:
+		self.now += max(0.0, seconds)
+
+
+def _print_row(route: Route, row: str) -> None:
+	print(f"{route[0]} -> {route[1]}: {row}")
+
+
+class Board:
+	"""
+	Arguments:
+		routes (list[Route]): informal (start, end) stop names
+		stops (pd.DataFrame | StopIndex): all known stops
+		template (str | QueryTemplate): the `trip` query template
+		client (JourneyPlannerClient): client for the journey planner
+		n (int): number of departures per route
+		min_refresh, max_refresh (float): bounds for the seconds between two
+			refreshes of a route
+		idle_after (float): a route without departures in this many seconds
+			is refreshed every `max_refresh` seconds
+		clock (Callable[[], float]): returns the current time in seconds
+		sleep (Callable[[float], None]): waits the given number of seconds
+		render (Callable[[Route, str], None]): shows a changed row
+		cache (TripCache | Optional): passed on to `get_trips`
+
+	Attributes:
+		rows (dict[Route, str]): the rendered row of every route
+		n_refreshes (int): number of route refreshes so far
+		n_requests (int): number of requests sent so far
+		n_errors (int): number of failed refreshes so far
+	"""
+	def __init__(self,
+              	 routes: list[Route],
+              	 stops,
+              	 template: str | QueryTemplate,
+              	 client: JourneyPlannerClient,
+              	 n: int = 3,
+              	 min_refresh: float = 15.0,
+              	 max_refresh: float = 300.0,
+              	 idle_after: float = 1800.0,
+              	 clock: Callable[[], float] = time.time,
+              	 sleep: Callable[[float], None] = time.sleep,
+              	 render: Callable[[Route, str], None] = _print_row,
+              	 cache: TripCache = None
+              ) -> None:
+		assert 0 < min_refresh <= max_refresh, \
+			"Refresh bounds must be 0 < min_refresh <= max_refresh"
+		self.routes = list(dict.fromkeys(routes))
+		self.stops = stops
+		self.template = template
+		self.client = client
+		self.n = n
+		self.min_refresh = min_refresh
+		self.max_refresh = max_refresh
+		self.idle_after = idle_after
+		self.clock = clock
+		self.sleep = sleep
+		self.render = render
+		self.cache = cache
+
+		self.rows: dict[Route, str] = {}
+		self.n_refreshes = self.n_requests = self.n_errors = 0
+		self._failures = 0    # Failed refreshes in a row
+
+		# (due time, route), every route is due right away
+		now = self.clock()
+		self._schedule = [(now, route) for route in self.routes]
+		heapq.heapify(self._schedule)
+
+	def get_refresh_delay(self, trip: Trip, now: float) -> float:
+		""" Seconds until the route of `trip` should be refreshed again. """
+		upcoming = [tp.expected_start_time.timestamp() - now
+              		for tp in trip.trip_patterns]
+		upcoming = [t for t in upcoming if t >= 0]
+		if not upcoming or min(upcoming) >= self.idle_after:
+			return self.max_refresh
+
+		return min(max(min(upcoming) / 2, self.min_refresh), self.max_refresh)
+
+	@staticmethod
+	def format_row(trip: Trip) -> str:
+		departures = []
+		for tp in trip.trip_patterns:
+			lines = "/".join(leg.public_code for leg in tp.legs
+                    		 if leg.public_code is not None)
+			departures.append(f"{tp.expected_start_time:%H:%M} ({lines})")
+		return ", ".join(departures) if departures else "No departures"
+
+	def get_retry_delay(self) -> float:
+		""" Seconds until routes are tried again after a failed refresh. """
+		return min(self.min_refresh * 2 ** (self._failures - 1), self.max_refresh)
+
+	def next_due(self) -> float | None:
+		return self._schedule[0][0] if self._schedule else None
+
+	def step(self) -> list[Route]:
+		"""
+		Refreshes every route that is due, renders the rows that changed and
+		schedules the next refresh of each.
+
+		Returns:
+			list[Route]: the refreshed routes, empty if the refresh failed
+		"""
+		now = self.clock()
+		due = []
+		while self._schedule and self._schedule[0][0] <= now:
+			due.append(heapq.heappop(self._schedule)[1])
+		if not due:
+			return due
+
+		requests_before = self.client.n_requests
+		try:
+			trips = get_trips(due, self.stops, self.template, self.client,
+                     		  n=self.n, cache=self.cache)
+		except requests.RequestException:
+			# Keep the last rows and try the routes again later
+			self.n_requests += self.client.n_requests - requests_before
+			self.n_errors += 1
+			self._failures += 1
+			retry = self.clock() + self.get_retry_delay()
+			for route in due:
+				heapq.heappush(self._schedule, (retry, route))
+			return []
+		self.n_requests += self.client.n_requests - requests_before
+		self.n_refreshes += len(due)
+		self._failures = 0
+
+		now = self.clock()
+		for route, trip in zip(due, trips):
+			row = self.format_row(trip)
+			if self.rows.get(route) != row:
+				self.rows[route] = row
+				self.render(route, row)
+			heapq.heappush(self._schedule,
+                  		   (now + self.get_refresh_delay(trip, now), route))
+
+		return due
+
+	def run(self, duration: float = None) -> None:
+		""" Runs the board for `duration` seconds, or forever. """
+		end = None if duration is None else self.clock() + duration
+		while self._schedule:
+			self.step()
+			wait = self.next_due() - self.clock()
+			if end is not None and self.clock() + wait > end:
+				break
+			self.sleep(wait)
+
+
+if __name__ == "__main__":
+	parser = ArgumentParser()
+	parser.add_argument("--route", "-r", nargs=2, action="append",
+                     	metavar=("START", "END"), required=True,
+                     	help="Informal stop names of a route, can be repeated.")
+	parser.add_argument("--url", type=str,
+                     	default="https://api.entur.io/journey-planner/v3/graphql",
+                     	help="The journey planner endpoint.")
+	parser.add_argument("--n", type=int, default=3,
+                     	help="Number of departures per route.")
+	parser.add_argument("--min_refresh", type=float, default=15.0)
+	parser.add_argument("--max_refresh", type=float, default=300.0)
+
+	args = parser.parse_args()
+	dir = Path(__file__).parent
+	stops = get_stop_index(dir)
+	templates = get_query_templates(dir / "query_templates")
+
+	with JourneyPlannerClient(args.url) as client:
+		board = Board([tuple(route) for route in args.route], stops,
+                	  templates["trip"], client, n=args.n,
+                	  min_refresh=args.min_refresh, max_refresh=args.max_refresh)
+		board.run()
@@ -0,0 +1,144 @@
+"""
+TTL + LRU cache for trip query responses.
+
+Trip query bodies are never identical (they include the current time down to
+the microsecond), so responses are keyed on (start id, end id, n, time
+bucket) instead, where the time bucket is the current time divided into
+`ttl` second slots. Entries can optionally be backed by an SQLite database,
+so a restarted board starts with a warm cache.
+
+Usage:
+	cache = TripCache(ttl=60, max_entries=1024, path="data/trip_cache.db")
+	key = cache.get_key(start_id, end_id, n)
+	res = cache.get(key)
+	if res is None:
+		res = ...    # the `trip` part of the response
+		cache.put(key, res)
+	print(cache.stats())
+"""
+import json
+import sqlite3
+import time
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+CacheKey = tuple[str, str, int, int]
+
+
+class TripCache:
+	"""
+	Arguments:
+		ttl (float): seconds a response stays valid, also the bucket size
+		max_entries (int): max number of responses kept in memory before the
+			least recently used is evicted
+		path (str | Path | Optional): SQLite database to persist responses in
+		clock (Callable[[], float]): returns the current time in seconds
+
+	Attributes:
+		hits, misses, evictions (int): counters since the cache was created
+	"""
+	def __init__(self,
+              	 ttl: float = 60.0,
+              	 max_entries: int = 1024,
+              	 path: str | Path = None,
+              	 clock: Callable[[], float] = time.time
+              ) -> None:
+		assert ttl > 0, "ttl must be positive"
+		assert max_entries > 0, "max_entries must be positive"
+		self.ttl = ttl
+		self.max_entries = max_entries
+		self.clock = clock
+		self.hits = self.misses = self.evictions = 0
+
+		# key -> (stored_at, response), least recently used first
+		self._entries: OrderedDict[CacheKey, tuple[float, dict]] = OrderedDict()
+
+		self._connection = None
+		if path is not None:
+			self._connection = sqlite3.connect(path)
+			self._connection.execute(
+				"CREATE TABLE IF NOT EXISTS trip_cache ("
+				"start_id TEXT, end_id TEXT, n INTEGER, bucket INTEGER, "
+				"stored_at REAL, response TEXT, "
+				"PRIMARY KEY (start_id, end_id, n, bucket))"
+			)
+			self._load()
+
+	def _load(self) -> None:
+		""" Drops expired rows and loads the newest ones into memory. """
+		now = self.clock()
+		with self._connection:
+			self._connection.execute("DELETE FROM trip_cache WHERE stored_at < ?",
+                            		 (now - self.ttl,))
+		rows = self._connection.execute(
+			"SELECT start_id, end_id, n, bucket, stored_at, response "
+			"FROM trip_cache ORDER BY stored_at DESC LIMIT ?",
+			(self.max_entries,)
+		).fetchall()
+		for *key, stored_at, response in reversed(rows):
+			self._entries[tuple(key)] = (stored_at, json.loads(response))
+
+	def get_key(self,
+             	start_id: str,
+             	end_id: str,
+             	n: int,
+             	now: float = None
+             ) -> CacheKey:
+		if now is None: now = self.clock()
+		return (start_id, end_id, n, int(now // self.ttl))
+
+	def get(self, key: CacheKey) -> dict | None:
+		""" Returns the cached response for `key`, or None if missing/expired. """
+		entry = self._entries.get(key)
+		if entry is None or self.clock() - entry[0] >= self.ttl:
+			if entry is not None: self._remove(key)
+			self.misses += 1
+			return None
+
+		self._entries.move_to_end(key)
+		self.hits += 1
+		return entry[1]
+
+	def put(self, key: CacheKey, response: dict) -> None:
+		stored_at = self.clock()
+		self._entries[key] = (stored_at, response)
+		self._entries.move_to_end(key)
+
+		if self._connection is not None:
+			with self._connection:
+				self._connection.execute(
+					"INSERT OR REPLACE INTO trip_cache VALUES (?, ?, ?, ?, ?, ?)",
+					(*key, stored_at, json.dumps(response))
+				)
+
+		while len(self._entries) > self.max_entries:
+			oldest = next(iter(self._entries))
+			self._remove(oldest)
+			self.evictions += 1
+
+	def _remove(self, key: CacheKey) -> None:
+		del self._entries[key]
+		if self._connection is not None:
+			with self._connection:
+				self._connection.execute(
+					"DELETE FROM trip_cache "
+					"WHERE start_id = ? AND end_id = ? AND n = ? AND bucket = ?",
+					key
+				)
+
+	def stats(self) -> dict[str, int]:
+		return {
+			"entries": len(self._entries),
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+		}
+
+	def close(self) -> None:
+		if self._connection is not None:
+			self._connection.close()
+
+	def __len__(self) -> int:
+		return len(self._entries)
@@ -0,0 +1,153 @@
+"""
+Client for the Entur Journey Planner GraphQL API.
+
+Keeps a pooled keep-alive `requests.Session`, limits how many queries are in
+flight at once and retries with exponential backoff when the API answers with
+429 or 5xx. The async API runs the blocking session calls in a pool of worker
+threads, and `post`/`post_many` wrap it for synchronous code.
+
+Usage:
+	client = JourneyPlannerClient(url, max_in_flight=8)
+	data = client.post(query_body)               # sync
+	data = await client.apost(query_body)        # async
+	datas = await client.apost_many(query_bodies)
+	response = client.post_stream(query_body)    # unread body
+"""
+import asyncio
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class JourneyPlannerClient:
+	"""
+	Arguments:
+		url (str): the GraphQL endpoint
+		max_in_flight (int): max number of concurrent queries
+		retries (int): how many times to retry a query on 429/5xx
+		backoff (float): seconds to wait before the first retry, doubled for
+			every following retry
+		max_backoff (float): upper limit for the wait between retries
+		timeout (float): seconds before a single request times out
+		headers (dict): extra headers, e.g. `ET-Client-Name` for Entur
+
+	Attributes:
+		n_requests (int): number of requests sent so far, including retries
+	"""
+	def __init__(self,
+              	 url: str,
+              	 max_in_flight: int = 8,
+              	 retries: int = 3,
+              	 backoff: float = 0.5,
+              	 max_backoff: float = 8.0,
+              	 timeout: float = 10.0,
+              	 headers: dict = None
+              ) -> None:
+		self.url = url
+		self.max_in_flight = max_in_flight
+		self.retries = retries
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.timeout = timeout
+		self.n_requests = 0
+
+		# One connection per concurrent query, reused between queries
+		self.session = requests.Session()
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+		self.session.mount("http://", adapter)
+		self.session.mount("https://", adapter)
+		if headers: self.session.headers.update(headers)
+		self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+		self._semaphore = None
+		self._loop = None
+
+	def _get_semaphore(self) -> asyncio.Semaphore:
+		# Semaphores are bound to an event loop, and the sync wrappers start a
+		# new loop for every call
+		loop = asyncio.get_running_loop()
+		if self._loop is not loop:
+			self._loop = loop
+			self._semaphore = asyncio.Semaphore(self.max_in_flight)
+		return self._semaphore
+
+	def _get_backoff(self, attempt: int, response: requests.Response) -> float:
+		retry_after = response.headers.get("Retry-After")
+		if retry_after is not None and retry_after.isdigit():
+			return min(float(retry_after), self.max_backoff)
+		return min(self.backoff * 2 ** attempt, self.max_backoff)
+
+	@METRICS.timed("http")
+	def _send(self, query: str, stream: bool = False) -> requests.Response:
+		return self.session.post(url=self.url,
+                           		 json={"query": query},
+                           		 timeout=self.timeout,
+                           		 stream=stream)
+
+	async def apost_response(self,
+                          	 query: str,
+                          	 stream: bool = False
+                          ) -> requests.Response:
+		"""
+		Posts a query, retrying on 429/5xx, and returns the final response.
+		With `stream=True` the body is not read yet, see `post_stream`.
+
+		Raises:
+			requests.HTTPError: if the last attempt was not successful
+		"""
+		async with self._get_semaphore():
+			for attempt in range(self.retries + 1):
+				self.n_requests += 1
+				METRICS.inc("http_requests")
+				if attempt > 0: METRICS.inc("http_retries")
+				response = await asyncio.get_running_loop().run_in_executor(
+        			self._executor, self._send, query, stream)
+				if response.status_code not in RETRY_STATUSES \
+      					or attempt == self.retries:
+					break
+				response.close()    # Releases the connection when streaming
+				await asyncio.sleep(self._get_backoff(attempt, response))
+
+		response.raise_for_status()
+		return response
+
+	async def apost(self, query: str) -> dict:
+		""" Posts a query and returns the `data` of the response. """
+		response = await self.apost_response(query)
+		with METRICS.span("json_decode"):
+			return response.json()["data"]
+
+	async def apost_many(self, queries: list[str]) -> list[dict]:
+		""" Posts several queries concurrently, keeping their order. """
+		return await asyncio.gather(*(self.apost(q) for q in queries))
+
+	def post(self, query: str) -> dict:
+		""" Synchronous version of `apost`. """
+		return asyncio.run(self.apost(query))
+
+	def post_many(self, queries: list[str]) -> list[dict]:
+		""" Synchronous version of `apost_many`. """
+		return asyncio.run(self.apost_many(queries))
+
+	def post_stream(self, query: str) -> requests.Response:
+		"""
+		Posts a query without reading the response body, so it can be
+		consumed incrementally with `response.iter_content`, e.g. by
+		`stream.iter_trip_patterns`. Close the response when done.
+		"""
+		return asyncio.run(self.apost_response(query, stream=True))
+
+	def close(self) -> None:
+		self._executor.shutdown()
+		self.session.close()
+
+	def __enter__(self) -> "JourneyPlannerClient":
+		return self
+
+	def __exit__(self, *args) -> None:
+		self.close()
@@ -1,31 +1,169 @@
-import json
+import asyncio
 import requests
 
 from pathlib import Path
+from typing import Iterator
 
 from utils import (
+	get_batch_trip_query_body,
 	get_query_templates,
-	get_stop_dataframe,
+	get_stop_id,
+	get_stop_index,
+	get_trip_alias,
 	get_trip_query_body,
 )
-from trip import Trip
+from cache import TripCache
+from metrics import METRICS
+from client import JourneyPlannerClient
+from offline import OfflinePlanner
+from query_template import QueryTemplate
+from stream import iter_trip_patterns
+from trip import Trip, TripPattern, split_batch_response
 
 V = False    # For testing
+BATCH_SIZE = 20    # Max number of trip sub-queries per request
+
+
+def get_trips(pairs: list[tuple[str, str]],
+              stops,
+              template: str | QueryTemplate,
+              client: JourneyPlannerClient,
+              n: int = 3,
+              batch_size: int = BATCH_SIZE,
+              cache: TripCache = None,
+              fallback: OfflinePlanner = None
+    ) -> list[Trip]:
+	"""
+	Gets the trips for several (start, end) pairs, sending up to `batch_size`
+	pairs per request as one aliased GraphQL query. The batches are sent 
+	concurrently through `client`. Pairs found in `cache` are not queried.
+	If the API can't be reached in time, the pairs are planned with the 
+	`fallback` offline planner instead, when there is one.
+ 
+	Returns:
+		list[Trip]: one trip per pair, in the same order as `pairs`
+	"""
+	return asyncio.run(
+		aget_trips(pairs, stops, template, client, n, batch_size, cache, fallback)
+	)
+
+
+async def aget_trips(pairs: list[tuple[str, str]],
+                     stops,
+                     template: str | QueryTemplate,
+                     client: JourneyPlannerClient,
+                     n: int = 3,
+                     batch_size: int = BATCH_SIZE,
+                     cache: TripCache = None,
+                     fallback: OfflinePlanner = None
+    ) -> list[Trip]:
+	""" Async version of `get_trips`. """
+	trips = [None] * len(pairs)
+ 
+	# Indices of the pairs that need to be queried, by cache key (or by pair
+	# without a cache), so repeated pairs are only queried once
+	missing: dict = {}
+	for i, (start, end) in enumerate(pairs):
+		key = None
+		if cache is not None:
+			key = cache.get_key(get_stop_id(stops, start),
+                       			get_stop_id(stops, end), n)
+		group = key if cache is not None else (start, end)
+		if group in missing:
+			missing[group][1].append(i)
+			continue
+		if cache is not None:
+			res = cache.get(key)
+			if res is not None:
+				trips[i] = Trip({"trip": res})
+				continue
+		missing[group] = (key, [i])
+	missing = list(missing.values())
+  
+	batches = [missing[i:i + batch_size] 
+            	for i in range(0, len(missing), batch_size)]
+	queries = [
+		get_batch_trip_query_body([pairs[idx[0]] for _, idx in batch], 
+                            	  stops, template, n) 
+		for batch in batches
+	]
+	try:
+		responses = await client.apost_many(queries)
+	except requests.RequestException:
+		if fallback is None:
+			raise
+		# Slow or unavailable API, plan the missing pairs offline instead
+		for _, idx in missing:
+			trip = fallback.get_trip(*pairs[idx[0]], stops, n)
+			for i in idx: trips[i] = trip
+		return trips
+ 
+	for batch, response in zip(batches, responses):
+		batch_trips = split_batch_response(response)
+		for j, (key, idx) in enumerate(batch):
+			alias = get_trip_alias(j)
+			for i in idx: trips[i] = batch_trips[alias]
+			if cache is not None: cache.put(key, response[alias])
+  
+	return trips
+
+
+def stream_trip_patterns(pairs: list[tuple[str, str]],
+                       stops,
+                       template: str | QueryTemplate,
+                       client: JourneyPlannerClient,
+                       n: int = 3,
+                       chunk_size: int = 2**16
+    ) -> Iterator[tuple[tuple[str, str], TripPattern]]:
+	"""
+	Streams the trip patterns for several (start, end) pairs from one batched
+	query, yielding each pattern as soon as it has been received.
+ 
+	Yields:
+		tuple[tuple[str, str], TripPattern]: the pair and one of its patterns
+	"""
+	query_body = get_batch_trip_query_body(pairs, stops, template, n)
+	aliases = {get_trip_alias(i): pair for i, pair in enumerate(pairs)}
+ 
+	response = client.post_stream(query_body)
+	try:
+		chunks = response.iter_content(chunk_size)
+		for alias, trip_pattern in iter_trip_patterns(chunks):
+			yield aliases[alias], trip_pattern
+	finally:
+		response.close()
+
 
 def main(args) -> None:
+	# Timings of every step, printed in the Prometheus format at the end
+	if getattr(args, "METRICS", False): METRICS.enable()
+
 	if V:
 		print("Arguments\n---------")
 		for k, v in args.__dict__.items():
 			print(f"{k}: {v}")
 
-	# 1. Setup stop dataframe and templates
-	args.STOPS = get_stop_dataframe(args.DIR)	
+	# 1. Setup stop index and templates
+	args.STOPS = get_stop_index(args.DIR)
 	if V: print("\nStops:\n", args.STOPS)
 
 	args.TEMPLATES = get_query_templates(args.TEMPLATE_DIR)
 	if V: print("\nTrip Template:\n",
 				args.TEMPLATES["trip"])
 
+	# Batched boards with several (start, end) pairs
+	pairs = getattr(args, "PAIRS", None)
+	if pairs:
+		with JourneyPlannerClient(args.URL) as client:
+			trips = get_trips(pairs, args.STOPS, args.TEMPLATES["trip"], client,
+                     		  cache=getattr(args, "CACHE", None))
+		for (start, end), trip in zip(pairs, trips):
+			print(f"From {start} to {end}:")
+			print("=" * len(f"From {start} to {end}:"))
+			print(trip)
+		if METRICS.enabled: print(METRICS.to_prometheus())
+		return
+
 	# 2. Set up Query
 	# NOTE: Temporarily only doing Lillestrøm stasjon to Forskningsparken
 	query_body = get_trip_query_body(
@@ -36,9 +174,8 @@ def main(args) -> None:
 				)
 
 	# 3. Parse Response
-	response = requests.post(url=args.URL, json={"query": query_body})
-	if V: print(response.status_code)
-	response = json.loads(response.content.decode())["data"]
+	with JourneyPlannerClient(args.URL) as client:
+		response = client.post(query_body)
 
 	if response is not None:
 		trip = Trip(response)
@@ -49,6 +186,7 @@ def main(args) -> None:
 	print(query_body, "\n")
 	print("RESULT:")
 	print(trip)
+	if METRICS.enabled: print(METRICS.to_prometheus())
 	
 if __name__ == "__main__":
 	args = lambda: None
@@ -0,0 +1,186 @@
+"""
+Instrumentation for the travel board pipeline.
+
+Timed spans are aggregated into latency histograms (one per span name) and
+counters, which can be exported as JSON or in the Prometheus text format.
+Everything goes through the module level `METRICS`, which is disabled by
+default: a disabled `span` returns a shared no-op context manager, so the
+instrumented code pays about one method call per span.
+
+Usage:
+	METRICS.enable()
+	with METRICS.span("http"):
+		...
+	METRICS.inc("http_requests")
+	print(METRICS.to_prometheus())
+
+	@METRICS.timed("query_build")
+	def get_trip_query_body(...):
+		...
+"""
+import bisect
+import functools
+import json
+import threading
+import time
+
+from contextlib import nullcontext
+
+# Upper bounds of the histogram buckets in seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NO_SPAN = nullcontext()
+
+
+class Histogram:
+	""" Counts of observations per bucket, plus their sum and count. """
+	__slots__ = ("buckets", "counts", "sum", "count")
+
+	def __init__(self, buckets: tuple[float] = DEFAULT_BUCKETS) -> None:
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1)    # The last one is +Inf
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value: float) -> None:
+		self.counts[bisect.bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+	def quantile(self, q: float) -> float:
+		""" Upper bound of the bucket containing the q-quantile. """
+		if self.count == 0:
+			return 0.0
+		rank, seen = q * self.count, 0
+		for bound, count in zip(self.buckets, self.counts):
+			seen += count
+			if seen >= rank:
+				return bound
+		return float("inf")
+
+	def to_dict(self) -> dict:
+		return {
+			"buckets": {str(bound): count
+               			for bound, count in zip(self.buckets, self.counts)},
+			"inf": self.counts[-1],
+			"sum": self.sum,
+			"count": self.count,
+			"p50": self.quantile(0.5),
+			"p99": self.quantile(0.99),
+		}
+
+
+class _Span:
+	__slots__ = ("metrics", "name", "start")
+
+	def __init__(self, metrics: "Metrics", name: str) -> None:
+		self.metrics = metrics
+		self.name = name
+
+	def __enter__(self) -> "_Span":
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *args) -> None:
+		self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class Metrics:
+	"""
+	Arguments:
+		enabled (bool): whether spans and counters are recorded
+		prefix (str): prefix of the exported metric names
+		buckets (tuple[float]): histogram bucket upper bounds in seconds
+	"""
+	def __init__(self,
+              	 enabled: bool = False,
+              	 prefix: str = "travel_board",
+              	 buckets: tuple[float] = DEFAULT_BUCKETS
+              ) -> None:
+		self.enabled = enabled
+		self.prefix = prefix
+		self.buckets = buckets
+		self.histograms: dict[str, Histogram] = {}
+		self.counters: dict[str, float] = {}
+		self._lock = threading.Lock()    # Spans can end in worker threads
+
+	def enable(self) -> None:
+		self.enabled = True
+
+	def disable(self) -> None:
+		self.enabled = False
+
+	def reset(self) -> None:
+		with self._lock:
+			self.histograms.clear()
+			self.counters.clear()
+
+	def span(self, name: str):
+		""" Context manager timing its block into the `name` histogram. """
+		if not self.enabled:
+			return _NO_SPAN
+		return _Span(self, name)
+
+	def timed(self, name: str):
+		""" Decorator timing every call of the function as a `name` span. """
+		def decorator(f):
+			@functools.wraps(f)
+			def wrapper(*args, **kwargs):
+				if not self.enabled:
+					return f(*args, **kwargs)
+				with _Span(self, name):
+					return f(*args, **kwargs)
+			return wrapper
+		return decorator
+
+	def observe(self, name: str, seconds: float) -> None:
+		if not self.enabled:
+			return
+		with self._lock:
+			histogram = self.histograms.get(name)
+			if histogram is None:
+				histogram = self.histograms[name] = Histogram(self.buckets)
+			histogram.observe(seconds)
+
+	def inc(self, name: str, value: float = 1) -> None:
+		if not self.enabled:
+			return
+		with self._lock:
+			self.counters[name] = self.counters.get(name, 0) + value
+
+	def to_dict(self) -> dict:
+		with self._lock:
+			return {
+				"spans": {name: h.to_dict() for name, h in self.histograms.items()},
+				"counters": dict(self.counters),
+			}
+
+	def to_json(self, **kwargs) -> str:
+		return json.dumps(self.to_dict(), **kwargs)
+
+	def to_prometheus(self) -> str:
+		""" The metrics in the Prometheus text exposition format. """
+		lines = []
+		with self._lock:
+			if self.histograms:
+				name = f"{self.prefix}_span_seconds"
+				lines.append(f"# TYPE {name} histogram")
+			for span, h in sorted(self.histograms.items()):
+				seen = 0
+				for bound, count in zip(h.buckets, h.counts):
+					seen += count
+					lines.append(f'{name}_bucket{{span="{span}",le="{bound}"}} {seen}')
+				lines.append(f'{name}_bucket{{span="{span}",le="+Inf"}} {h.count}')
+				lines.append(f'{name}_sum{{span="{span}"}} {h.sum}')
+				lines.append(f'{name}_count{{span="{span}"}} {h.count}')
+
+			for counter, value in sorted(self.counters.items()):
+				name = f"{self.prefix}_{counter}_total"
+				lines.append(f"# TYPE {name} counter")
+				lines.append(f"{name} {value}")
+
+		return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
@@ -0,0 +1,163 @@
+"""
+A local stand-in for the Entur Journey Planner GraphQL endpoint.
+
+It understands just enough of the `trip.txt` query to answer single and
+aliased (batched) `trip(...)` queries with made up trip patterns, which makes
+it possible to run the dashboard without hitting `api.entur.io`.
+
+Usage:
+	with MockJourneyPlanner() as server:
+		main(args, url=server.url)
+"""
+import json
+import math
+import re
+import threading
+import time
+
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+# Matches `trip(` and `alias: trip(` and captures the alias if there is one
+_TRIP_FIELD = re.compile(r"(?:(\w+)\s*:\s*)?\btrip\s*\(")
+_N_PATTERNS = re.compile(r"numTripPatterns:\s*(\d+)")
+
+
+def get_mock_trip_patterns(n: int,
+                           start: datetime = None,
+                           headway: float = 600
+    ) -> list[dict]:
+	"""
+	Makes `n` trip patterns in the same shape as the journey planner response,
+	leaving every `headway` seconds from `start`.
+	"""
+	if start is None: start = datetime.now().astimezone()
+	patterns = []
+	for i in range(n):
+		leave = start + timedelta(seconds=headway * i)
+		patterns.append({
+			"expectedStartTime": leave.strftime('%Y-%m-%dT%H:%M:%S%z'),
+			"duration": 1710,
+			"walkDistance": 352.84,
+			"legs": [
+				{"mode": "rail", "distance": 17476.26,
+	 			 "line": {"id": "NSB:Line:L13", "publicCode": "R13"}},
+				{"mode": "foot", "distance": 352.84, "line": None},
+				{"mode": "metro", "distance": 4946.58,
+	 			 "line": {"id": "RUT:Line:5", "publicCode": "5"}},
+			]
+		})
+	return patterns
+
+
+def get_mock_response(query: str,
+                      start: datetime = None,
+                      headway: float = 600
+    ) -> dict:
+	""" Answers every `trip(...)` field in the query, keyed by its alias. """
+	data = {}
+	fields = list(_TRIP_FIELD.finditer(query))
+	for i, field in enumerate(fields):
+		# Only look for arguments belonging to this field
+		end = fields[i + 1].start() if i + 1 < len(fields) else len(query)
+		n = _N_PATTERNS.search(query, field.end(), end)
+		n = int(n.group(1)) if n is not None else 3
+		data[field.group(1) or "trip"] = {
+			"tripPatterns": get_mock_trip_patterns(n, start, headway)
+		}
+	return {"data": data}
+
+
+class _Handler(BaseHTTPRequestHandler):
+	server: "MockJourneyPlanner"
+	protocol_version = "HTTP/1.1"    # Keep connections alive
+	disable_nagle_algorithm = True
+
+	def do_POST(self) -> None:
+		length = int(self.headers.get("Content-Length", 0))
+		query = json.loads(self.rfile.read(length))["query"]
+		self.server.n_requests += 1
+		if self.server.latency: time.sleep(self.server.latency)
+
+		# Injected failures, e.g. to exercise retries
+		if self.server.statuses:
+			status = self.server.statuses.pop(0)
+			if status != 200:
+				self.send_response(status)
+				self.send_header("Content-Length", "0")
+				self.end_headers()
+				return
+
+		# Departures leave on the whole multiples of the headway
+		now = self.server.clock()
+		headway = self.server.headway
+		start = datetime.fromtimestamp(math.ceil(now / headway) * headway)
+		response = get_mock_response(query, start.astimezone(), headway)
+		body = json.dumps(response).encode()
+
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args) -> None:
+		pass
+
+
+class MockJourneyPlanner(ThreadingHTTPServer):
+	"""
+	Threaded HTTP server answering trip queries on `127.0.0.1`. Runs in a
+	background thread when used as a context manager.
+
+	Arguments:
+		port (int): the port to listen on, 0 picks a free one
+		latency (float): seconds to wait before answering each query
+		statuses (list[int]): status codes to answer the next queries with,
+			e.g. [429, 503] makes the first two queries fail
+		clock (Callable[[], float]): returns the current time in seconds
+		headway (float): seconds between departures, which leave on whole
+			multiples of the headway
+
+	Attributes:
+		url (str): the endpoint to post queries to
+		n_requests (int): number of queries received so far
+	"""
+	daemon_threads = True
+
+	def __init__(self,
+              	 port: int = 0,
+              	 latency: float = 0.0,
+              	 statuses: list[int] = None,
+              	 clock: Callable[[], float] = time.time,
+              	 headway: float = 600
+              ) -> None:
+		super().__init__(("127.0.0.1", port), _Handler)
+		self.latency = latency
+		self.statuses = list(statuses or [])
+		self.clock = clock
+		self.headway = headway
+		self.n_requests = 0
+		self._thread = None
+
+	@property
+	def url(self) -> str:
+		host, port = self.server_address[:2]
+		return f"http://{host}:{port}/graphql"
+
+	def __enter__(self) -> "MockJourneyPlanner":
+		self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+	def __exit__(self, *args) -> None:
+		self.shutdown()
+		self.server_close()
+		self._thread.join()
+
+
+if __name__ == "__main__":
+	with MockJourneyPlanner(port=8080) as server:
+		print(f"Serving mock journey planner at {server.url}")
+		server._thread.join()
@@ -0,0 +1,231 @@
+"""
+Offline journey planning from a local timetable.
+
+The timetable is a list of elementary connections (one vehicle going from one
+stop to the next), like the `stop_times` of a GTFS feed flattened into pairs
+of consecutive stops. Stops are identified by the same NSR ids as
+`data/stops.csv`. The connections are loaded into NumPy arrays sorted by
+departure time, and earliest arrival queries are answered in-process with the
+Connection Scan Algorithm (CSA), returning the same `Trip` objects as the
+journey planner API.
+
+Timetable columns (csv):
+	trip_id, departure_stop, arrival_stop, departure_time, arrival_time,
+	mode, line_id, public_code, distance
+where the times are seconds after midnight of the service day.
+
+Usage:
+	planner = OfflinePlanner(load_timetable("data/timetable.csv"))
+	trip = planner.get_trip("Lillestrøm stasjon", "Forskningsparken", stops)
+"""
+import numpy as np
+import pandas as pd
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from trip import Trip
+from utils import get_stop_id
+
+_INF = np.iinfo(np.int32).max
+
+TIMETABLE_COLUMNS = ["trip_id", "departure_stop", "arrival_stop",
+                     "departure_time", "arrival_time", "mode", "line_id",
+                     "public_code", "distance"]
+
+
+def load_timetable(path: str | Path) -> pd.DataFrame:
+	""" Reads a timetable csv with the `TIMETABLE_COLUMNS`. """
+	df = pd.read_csv(path, dtype={"trip_id": str, "line_id": str,
+                               	  "public_code": str})
+	missing = set(TIMETABLE_COLUMNS) - set(df.columns)
+	assert not missing, f"Timetable is missing the columns {sorted(missing)}"
+
+	return df
+
+
+def get_synthetic_timetable(stop_ids: list[str],
+                            n_lines: int = 10,
+                            stops_per_line: int = 10,
+                            headway: int = 600,
+                            first: int = 5 * 3600,
+                            last: int = 24 * 3600,
+                            seed: int = 0
+    ) -> pd.DataFrame:
+	"""
+	Makes a random timetable where each line runs back and forth over
+	`stops_per_line` of the given stops every `headway` seconds.
+	"""
+	rng = np.random.default_rng(seed)
+	modes = ["bus", "rail", "metro", "tram"]
+	rows = []
+	for line in range(n_lines):
+		line_stops = rng.choice(len(stop_ids),
+                          		size=min(stops_per_line, len(stop_ids)),
+                          		replace=False)
+		hops = rng.integers(60, 600, size=len(line_stops) - 1)
+		mode = modes[line % len(modes)]
+		offset = int(rng.integers(0, headway))
+		for direction, order in enumerate([line_stops, line_stops[::-1]]):
+			hop_times = hops if direction == 0 else hops[::-1]
+			for k, start in enumerate(range(first + offset, last, headway)):
+				t = start
+				trip_id = f"L{line}:{direction}:{k}"
+				for a, b, hop in zip(order[:-1], order[1:], hop_times):
+					rows.append((trip_id, stop_ids[a], stop_ids[b], t, t + int(hop),
+                  				 mode, f"SYN:Line:{line}", str(line), float(hop) * 10))
+					t += int(hop) + 30    # Dwell time at the stop
+
+	return pd.DataFrame(rows, columns=TIMETABLE_COLUMNS)
+
+
+class OfflinePlanner:
+	"""
+	Arguments:
+		timetable (pd.DataFrame): connections with the `TIMETABLE_COLUMNS`
+		min_transfer (int): seconds needed to change vehicles at a stop
+	"""
+	def __init__(self, timetable: pd.DataFrame, min_transfer: int = 120) -> None:
+		self.min_transfer = min_transfer
+		df = timetable.sort_values(["departure_time", "arrival_time"],
+                             	   kind="stable", ignore_index=True)
+
+		# Stops, trips, modes and lines are stored as integer codes
+		stop_codes, self.stop_ids = pd.factorize(
+			pd.concat([df["departure_stop"], df["arrival_stop"]]))
+		self._stop_code = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+		self.dep_stop = stop_codes[:len(df)].astype(np.int32)
+		self.arr_stop = stop_codes[len(df):].astype(np.int32)
+		self.dep_time = df["departure_time"].to_numpy(np.int32)
+		self.arr_time = df["arrival_time"].to_numpy(np.int32)
+		trip_codes, _ = pd.factorize(df["trip_id"])
+		self.trip = trip_codes.astype(np.int32)
+		self.n_trips = int(self.trip.max()) + 1 if len(df) else 0
+		mode_codes, self.modes = pd.factorize(df["mode"])
+		self.mode = mode_codes.astype(np.int16)
+		line_codes, line_index = pd.MultiIndex.from_arrays(
+			[df["line_id"], df["public_code"]]).factorize()
+		self.line = line_codes.astype(np.int32)
+		self.lines = list(line_index)
+
+		# Distance travelled along the trip up to the end of each connection
+		distance = df["distance"].to_numpy(np.float64)
+		self.distance_along = (pd.Series(distance)
+                         	   .groupby(self.trip).cumsum().to_numpy())
+		self.distance = distance
+
+		# The scan reads one element at a time, which is faster from lists
+		self._scan = (self.dep_stop.tolist(), self.arr_stop.tolist(),
+                	  self.dep_time.tolist(), self.arr_time.tolist(),
+                	  self.trip.tolist())
+
+	def __len__(self) -> int:
+		return len(self.dep_time)
+
+	def earliest_arrival(self,
+                      	 source: str,
+                      	 target: str,
+                      	 departure: int
+                      ) -> list[tuple[int, int]] | None:
+		"""
+		Connection scan for the earliest arrival at `target` when leaving
+		`source` at or after `departure` seconds after midnight.
+
+		Returns:
+			list[tuple[int, int]] | None: the legs of the journey as
+				(boarding connection, alighting connection), or None if
+				`target` can't be reached the same day
+		"""
+		if source not in self._stop_code or target not in self._stop_code:
+			return None
+		source, target = self._stop_code[source], self._stop_code[target]
+		dep_stop, arr_stop, dep_time, arr_time, trip = self._scan
+
+		earliest = [_INF] * len(self.stop_ids)
+		earliest[source] = departure
+		boarded = [-1] * self.n_trips    # First connection used on each trip
+		reached_by = {}                  # stop -> (boarding, alighting)
+
+		first = int(np.searchsorted(self.dep_time, departure, side="left"))
+		for c in range(first, len(dep_time)):
+			if dep_time[c] >= earliest[target]:
+				break
+			t = trip[c]
+			if boarded[t] == -1:
+				stop = dep_stop[c]
+				transfer = 0 if stop == source else self.min_transfer
+				if earliest[stop] == _INF or earliest[stop] + transfer > dep_time[c]:
+					continue
+				boarded[t] = c
+			if arr_time[c] < earliest[arr_stop[c]]:
+				earliest[arr_stop[c]] = arr_time[c]
+				reached_by[arr_stop[c]] = (boarded[t], c)
+
+		if earliest[target] == _INF or source == target:
+			return None
+
+		legs = []
+		stop = target
+		while stop != source:
+			board, alight = reached_by[stop]
+			legs.append((board, alight))
+			stop = dep_stop[board]
+
+		return legs[::-1]
+
+	def _get_trip_pattern(self,
+                       	  legs: list[tuple[int, int]],
+                       	  midnight: datetime
+                       ) -> dict:
+		""" A trip pattern in the same shape as the journey planner response. """
+		start = int(self.dep_time[legs[0][0]])
+		end = int(self.arr_time[legs[-1][1]])
+		pattern_legs = []
+		for board, alight in legs:
+			line_id, public_code = self.lines[self.line[board]]
+			pattern_legs.append({
+				"mode": self.modes[self.mode[board]],
+				"distance": float(self.distance_along[alight]
+                      			  - self.distance_along[board]
+                      			  + self.distance[board]),
+				"line": {"id": line_id, "publicCode": public_code},
+			})
+
+		return {
+			"expectedStartTime": (midnight + timedelta(seconds=start)).isoformat(),
+			"duration": end - start,
+			"walkDistance": 0.0,
+			"legs": pattern_legs,
+		}
+
+	def get_trip(self,
+              	 start: str,
+              	 end: str,
+              	 stops,
+              	 n: int = 3,
+              	 time: datetime = None
+              ) -> Trip:
+		"""
+		Plans up to `n` journeys, leaving one after the other, from `start`
+		to `end` like the `trip` query of the journey planner.
+
+		Arguments:
+			start, end (str): informal stop names
+			stops (pd.DataFrame | StopIndex): all known stops
+			n (int): the number of trip patterns
+			time (datetime | Optional): earliest departure, defaults to now
+		"""
+		if time is None: time = datetime.now().astimezone()
+		midnight = time.replace(hour=0, minute=0, second=0, microsecond=0)
+		departure = int((time - midnight).total_seconds())
+		source, target = get_stop_id(stops, start), get_stop_id(stops, end)
+
+		trip_patterns = []
+		while len(trip_patterns) < n:
+			legs = self.earliest_arrival(source, target, departure)
+			if legs is None:
+				break
+			trip_patterns.append(self._get_trip_pattern(legs, midnight))
+			departure = int(self.dep_time[legs[0][0]]) + 1
+
+		return Trip({"trip": {"tripPatterns": trip_patterns}})
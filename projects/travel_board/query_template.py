@@ -0,0 +1,89 @@
+"""
+Compiled GraphQL query templates.
+
+The templates in `query_templates/` use `{placeholder}` markers, but can't be
+filled in with `str.format` because GraphQL itself is full of braces. A
+`QueryTemplate` splits the template into literal segments and placeholder
+names once, so rendering is a single join. Only braces around a bare
+identifier, like `{start_id}`, are placeholders.
+
+Usage:
+	template = load_template(Path("query_templates/trip.txt"))
+	template.placeholders    # {"start_id", "start_name", ...}
+	query = template.render(start_id="NSR:StopPlace:59872", ...)
+"""
+import os
+import re
+
+from functools import lru_cache
+from pathlib import Path
+
+_PLACEHOLDER = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
+
+class QueryTemplate:
+	"""
+	Arguments:
+		source (str): the template text
+
+	Attributes:
+		placeholders (frozenset[str]): names of all placeholders
+	"""
+	def __init__(self, source: str) -> None:
+		self.source = source
+
+		# Splitting on a pattern with a group alternates literals and names
+		parts = _PLACEHOLDER.split(source)
+		self._parts = parts
+		self._names = parts[1::2]
+		self.placeholders = frozenset(self._names)
+
+	def render(self, **values) -> str:
+		"""
+		Fills in every placeholder with `str(values[name])`.
+
+		Raises:
+			ValueError: if a placeholder is missing from `values`
+		"""
+		parts = self._parts.copy()
+		try:
+			parts[1::2] = map(str, map(values.__getitem__, self._names))
+		except KeyError:
+			missing = sorted(self.placeholders.difference(values))
+			raise ValueError(f"Missing template values: {missing}") from None
+
+		return "".join(parts)
+
+	def __str__(self) -> str:
+		return self.source
+
+	def __repr__(self) -> str:
+		return f"QueryTemplate(placeholders={sorted(self.placeholders)})"
+
+
+@lru_cache(maxsize=32)
+def compile_template(source: str) -> QueryTemplate:
+	""" Compiles a template string, reusing earlier compilations. """
+	return QueryTemplate(source)
+
+
+# path -> (modification time, compiled template)
+_loaded: dict[Path, tuple[int, QueryTemplate]] = {}
+
+
+def load_template(path: str | Path) -> QueryTemplate:
+	"""
+	Reads and compiles a template file. The file is only read again when its
+	modification time changes.
+	"""
+	path = Path(path).resolve()
+	mtime = os.stat(path).st_mtime_ns
+	cached = _loaded.get(path)
+	if cached is not None and cached[0] == mtime:
+		return cached[1]
+
+	with open(path, "r", encoding="utf-8") as f:
+		template = QueryTemplate(f.read())
+	_loaded[path] = (mtime, template)
+
+	return template
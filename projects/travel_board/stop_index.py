@@ -0,0 +1,177 @@
+"""
+Hashed index over the stop dataframe for constant time stop lookups.
+
+`get_stop_dataframe` gives one row per stop, and filtering the dataframe for
+every lookup is a scan over all stops. `StopIndex` precomputes dicts from
+normalized keys, full names, ids and aliases to stops once at load time, and
+supports prefix search (bisect over sorted keys) and typo-tolerant search
+(trigram candidates ranked by similarity) for user input.
+
+Usage:
+	stops = StopIndex(get_stop_dataframe(dir), aliases={"lsd": "NSR:StopPlace:62339"})
+	stops.get("Lillestrøm stasjon")    # Stop(name=..., id=..., key=...)
+	stops.prefix("lille")
+	stops.search("lilestrom stasjn")
+"""
+import bisect
+import pandas as pd
+
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from typing import NamedTuple
+
+# Letters NFKD does not decompose, so they are folded by hand
+_FOLD = str.maketrans({"æ": "ae", "ø": "o", "å": "a", "ä": "a", "ö": "o"})
+
+
+class Stop(NamedTuple):
+	name: str
+	id: str
+	key: str
+
+
+def _normalize(s: str) -> str:
+	""" Lowercase with collapsed whitespace, e.g. " Oslo  S" -> "oslo s" """
+	return " ".join(s.casefold().split())
+
+
+def _fold(s: str) -> str:
+	""" Drops Norwegian/Swedish special letters, e.g. "åråsen" -> "arasen" """
+	return s if s.isascii() else s.translate(_FOLD)
+
+
+def _trigrams(s: str) -> set[str]:
+	s = f"  {s} "
+	return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class StopIndex:
+	"""
+	Arguments:
+		stops (pd.DataFrame): columns = ["name", "id", "key"], as returned by
+			`get_stop_dataframe`
+		aliases (dict[str, str] | Optional): extra names mapped to stop ids
+	"""
+	def __init__(self,
+              	 stops: pd.DataFrame,
+              	 aliases: dict[str, str] = None
+              ) -> None:
+		self.stops = [Stop(*row) for row in zip(stops["name"].tolist(),
+                                         		stops["id"].tolist(),
+                                         		stops["key"].tolist())]
+
+		# Normalized name/key/alias -> positions in `self.stops`
+		self._lookup: dict[str, list[int]] = defaultdict(list)
+		self._ids: dict[str, int] = {}
+		for i, stop in enumerate(self.stops):
+			self._ids[stop.id] = i
+			self._add(stop.key, i)
+			self._add(stop.name, i)
+
+		for alias, stop_id in (aliases or {}).items():
+			assert stop_id in self._ids, f"Unknown stop id for alias '{alias}'"
+			self._add(alias, self._ids[stop_id])
+
+		self._lookup = dict(self._lookup)
+		self._sorted_keys = sorted(self._lookup)
+		self._trigram_index = None    # Built on the first fuzzy search
+
+	def _add(self, name: str, i: int) -> None:
+		name = _normalize(name)
+		folded = _fold(name)
+		positions = self._lookup[name]
+		if not positions or positions[-1] != i:
+			positions.append(i)
+		if folded != name:
+			positions = self._lookup[folded]
+			if not positions or positions[-1] != i:
+				positions.append(i)
+
+	def lookup(self, key: str) -> list[Stop]:
+		""" All stops with the given informal name, full name, alias or id. """
+		if key in self._ids:
+			return [self.stops[self._ids[key]]]
+		return [self.stops[i] for i in self._lookup.get(_normalize(key), [])]
+
+	def get(self, key: str) -> Stop:
+		""" The single stop identified by `key`, like `_get_stops_with_checks`. """
+		_stop = self.lookup(key)
+		assert len(_stop) != 0, f"Stop key, '{key}', not found in stop index"
+		assert len(_stop) == 1, f"Stop key, '{key}', matches {len(_stop)} stops"
+
+		return _stop[0]
+
+	def prefix(self, prefix: str, limit: int = 10) -> list[Stop]:
+		""" Stops with a name starting with `prefix`, in alphabetical order. """
+		prefix = _normalize(prefix)
+		res = []
+		i = bisect.bisect_left(self._sorted_keys, prefix)
+		while i < len(self._sorted_keys) and len(res) < limit:
+			key = self._sorted_keys[i]
+			if not key.startswith(prefix):
+				break
+			res += [self.stops[j] for j in self._lookup[key]
+           			if self.stops[j] not in res]
+			i += 1
+
+		return res[:limit]
+
+	def search(self,
+            	query: str,
+            	limit: int = 5,
+            	cutoff: float = 0.6,
+            	n_candidates: int = 50
+            ) -> list[Stop]:
+		"""
+		Typo-tolerant search. Exact matches come first, then prefix matches,
+		then the names sharing the most trigrams with `query` ranked by
+		their similarity ratio.
+
+		Arguments:
+			query (str): the (possibly misspelled) stop name
+			limit (int): max number of stops returned
+			cutoff (float): minimum similarity ratio in [0, 1]
+			n_candidates (int): number of trigram candidates to rank
+		"""
+		res = self.lookup(query) + self.prefix(query, limit)
+		if len(res) >= limit:
+			return list(dict.fromkeys(res))[:limit]
+
+		if self._trigram_index is None:
+			self._trigram_index = defaultdict(list)
+			for key in self._sorted_keys:
+				for trigram in _trigrams(key):
+					self._trigram_index[trigram].append(key)
+
+		# Trigrams shared by a large part of the names (e.g. " st" from
+		# "stasjon") say little about the match and are expensive to count, so
+		# only the rarer ones are used
+		query = _fold(_normalize(query))
+		postings = sorted((self._trigram_index.get(trigram, []) 
+                     	   for trigram in _trigrams(query)), key=len)
+		max_posting = max(1000, len(self._sorted_keys) // 50)
+		overlap = Counter(postings[0] if postings else [])
+		for posting in postings[1:]:
+			if len(posting) > max_posting:
+				break
+			overlap.update(posting)
+
+		scored = []
+		for key, _ in overlap.most_common(n_candidates):
+			ratio = SequenceMatcher(None, query, key).ratio()
+			if ratio >= cutoff:
+				scored.append((ratio, key))
+
+		for _, key in sorted(scored, reverse=True):
+			res += [self.stops[i] for i in self._lookup[key]]
+
+		return list(dict.fromkeys(res))[:limit]
+
+	def __contains__(self, key: str) -> bool:
+		return len(self.lookup(key)) != 0
+
+	def __len__(self) -> int:
+		return len(self.stops)
+
+	def __repr__(self) -> str:
+		return f"StopIndex({len(self)} stops, {len(self._lookup)} keys)"
@@ -0,0 +1,123 @@
+"""
+Streaming parser for journey planner responses.
+
+Instead of buffering the whole response before building a `Trip`,
+`iter_trip_patterns` decodes and scans the body chunk by chunk as it arrives,
+and parses each element of a `tripPatterns` array as soon as it is complete.
+Only the unparsed tail of the body is kept in memory, so peak memory does not
+grow with the number of trip patterns.
+
+Usage:
+	response = client.post_stream(query_body)
+	for alias, trip_pattern in iter_trip_patterns(response.iter_content(2**16)):
+		...
+"""
+import codecs
+import json
+import re
+
+from typing import Iterable, Iterator
+
+from trip import TripPattern
+
+# Characters that change the structure outside of strings
+_STRUCTURE = re.compile(r'[{}\[\]":,]')
+_STRING_END = re.compile(r'(?<!\\)(?:\\\\)*"')
+_WHITESPACE = re.compile(r'[\s,]*')
+
+_decoder = json.JSONDecoder()
+
+
+class _Frame:
+	""" An open object or array, and the key it belongs to in its parent. """
+	__slots__ = ("is_object", "key", "last_key", "expect_key")
+
+	def __init__(self, is_object: bool, key: str | None) -> None:
+		self.is_object = is_object
+		self.key = key
+		self.last_key = None
+		self.expect_key = is_object
+
+
+def iter_trip_patterns(chunks: Iterable[bytes],
+                       key: str = "tripPatterns"
+    ) -> Iterator[tuple[str | None, TripPattern]]:
+	"""
+	Yields the trip patterns of a (possibly batched) trip response while it is
+	being received.
+
+	Arguments:
+		chunks (Iterable[bytes]): the response body in pieces of any size,
+			e.g. `response.iter_content(chunk_size)`
+		key (str): the key of the arrays whose elements are yielded
+
+	Yields:
+		tuple[str | None, TripPattern]: the alias of the trip field (`trip`
+			for unbatched queries) and the parsed trip pattern
+
+	Raises:
+		ValueError: if the body ends in the middle of a trip pattern
+	"""
+	# Multi-byte characters may be split between chunks
+	decoder = codecs.getincrementaldecoder("utf-8")()
+	buf = ""
+	pos = 0                  # Next character of `buf` to scan
+	stack: list[_Frame] = []
+	in_array = False         # Reading the elements of a `key` array
+
+	for chunk in chunks:
+		buf = buf[pos:] + decoder.decode(chunk)
+		pos = 0
+		while True:
+			if in_array:
+				# Elements are parsed whole by the C decoder, only the
+				# separators between them are scanned here
+				pos = _WHITESPACE.match(buf, pos).end()
+				if pos == len(buf):
+					break
+				if buf[pos] == "]":
+					stack.pop()
+					in_array = False
+					pos += 1
+					continue
+				try:
+					element, end = _decoder.raw_decode(buf, pos)
+				except json.JSONDecodeError:
+					break    # The element has not fully arrived yet
+				pos = end
+				yield stack[-2].key if len(stack) >= 2 else None, \
+					TripPattern(element)
+				continue
+
+			match = _STRUCTURE.search(buf, pos)
+			if match is None:
+				pos = len(buf)
+				break
+			char = match.group()
+
+			if char == '"':
+				string_end = _STRING_END.search(buf, match.end())
+				if string_end is None:
+					pos = match.start()    # Scan the whole string again later
+					break
+				pos = string_end.end()
+				frame = stack[-1] if stack else None
+				if frame is not None and frame.is_object and frame.expect_key:
+					frame.last_key = json.loads(buf[match.start():pos])
+				continue
+
+			pos = match.end()
+			if char == ":":
+				stack[-1].expect_key = False
+			elif char == ",":
+				stack[-1].expect_key = stack[-1].is_object
+			elif char in "{[":
+				parent = stack[-1] if stack else None
+				frame_key = parent.last_key if parent and parent.is_object else None
+				stack.append(_Frame(char == "{", frame_key))
+				in_array = char == "[" and frame_key == key
+			else:
+				stack.pop()
+
+	if in_array:
+		raise ValueError("Response ended in the middle of the trip patterns")
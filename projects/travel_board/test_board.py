@@ -0,0 +1,88 @@
+"""
+Deterministic tests of the departure board, on a `FakeClock` against the mock
+journey planner.
+
+Usage:
+	python -m pytest test_board.py
+"""
+from pathlib import Path
+
+import pytest
+
+from board import Board, FakeClock
+from client import JourneyPlannerClient
+from mock_server import MockJourneyPlanner
+from utils import get_query_templates, get_stop_index
+
+DIR = Path(__file__).parent
+ROUTES = [("Lillestrøm stasjon", "Forskningsparken"), ("Oslo S", "Forskningsparken")]
+START = 1_800_000_000.0    # A whole multiple of every headway below
+
+
+@pytest.fixture(scope="module")
+def stops():
+	return get_stop_index(DIR)
+
+
+@pytest.fixture(scope="module")
+def template():
+	return get_query_templates(DIR / "query_templates")["trip"]
+
+
+@pytest.mark.parametrize("offset, headway, delay", [
+	(60, 600, 270),      # Half of the 540 s until the next departure
+	(590, 600, 15),      # Departure in 10 s, clamped to min_refresh
+	(60, 3600, 300),     # Nothing within idle_after, max_refresh
+])
+def test_refresh_delay(stops, template, offset, headway, delay):
+	clock = FakeClock(START + offset)
+	with MockJourneyPlanner(clock=clock, headway=headway) as server, \
+		 JourneyPlannerClient(server.url) as client:
+		board = Board(ROUTES, stops, template, client,
+                	  min_refresh=15, max_refresh=300, idle_after=1800,
+                	  clock=clock, sleep=clock.sleep, render=lambda *_: None)
+		assert board.step() == ROUTES
+		assert board.next_due() - clock() == pytest.approx(delay, abs=1)
+		assert board.n_requests == 1
+		assert set(board.rows) == set(ROUTES)
+
+
+def test_refresh_error_keeps_rows_and_backs_off(stops, template):
+	clock = FakeClock(START + 60)
+	renders = []
+	# First refresh works, the next two fail, then the planner is back
+	with MockJourneyPlanner(clock=clock, statuses=[200, 503, 503],
+                         	headway=600) as server, \
+		 JourneyPlannerClient(server.url, retries=0) as client:
+		board = Board(ROUTES, stops, template, client,
+                	  min_refresh=15, max_refresh=300, clock=clock,
+                	  sleep=clock.sleep,
+                	  render=lambda route, row: renders.append(route))
+		board.step()
+		rows = dict(board.rows)
+
+		clock.sleep(board.next_due() - clock())
+		assert board.step() == []
+		assert board.rows == rows
+		assert board.next_due() - clock() == 15
+
+		clock.sleep(board.next_due() - clock())
+		assert board.step() == []
+		assert board.next_due() - clock() == 30
+
+		clock.sleep(board.next_due() - clock())
+		assert board.step() == ROUTES
+		assert board.n_errors == 2
+		assert board.n_requests == 4
+		assert len(renders) == len(ROUTES)    # The rows did not change
+
+
+def test_run_survives_errors(stops, template):
+	clock = FakeClock(START + 60)
+	with MockJourneyPlanner(clock=clock, statuses=[503] * 5) as server, \
+		 JourneyPlannerClient(server.url, retries=0) as client:
+		board = Board(ROUTES, stops, template, client, clock=clock,
+                	  sleep=clock.sleep, render=lambda *_: None)
+		board.run(duration=3600)
+		assert board.n_errors == 5
+		assert set(board.rows) == set(ROUTES)
@@ -0,0 +1,131 @@
+"""
+Tests of `dashboard.get_trips` against the mock journey planner: repeated
+pairs, the offline fallback and the order of the trips.
+
+Usage:
+	python -m pytest test_dashboard.py
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+
+from board import FakeClock
+from cache import TripCache
+from client import JourneyPlannerClient
+from dashboard import get_trips
+from mock_server import MockJourneyPlanner
+from offline import TIMETABLE_COLUMNS, OfflinePlanner
+from utils import get_query_templates, get_stop_id, get_stop_index
+
+DIR = Path(__file__).parent
+A = ("Lillestrøm stasjon", "Forskningsparken")
+B = ("Oslo S", "Forskningsparken")
+C = ("Forskningsparken", "Oslo S")
+START = 1_800_000_000.0
+
+
+@pytest.fixture(scope="module")
+def stops():
+	return get_stop_index(DIR)
+
+
+@pytest.fixture(scope="module")
+def template():
+	return get_query_templates(DIR / "query_templates")["trip"]
+
+
+def _get_response(duration: int) -> dict:
+	# A cached `trip` response, told apart from the mock ones by its duration
+	return {"tripPatterns": [{
+		"expectedStartTime": "2027-01-15T08:00:00+01:00",
+		"duration": duration,
+		"walkDistance": 0.0,
+		"legs": [],
+	}]}
+
+
+@pytest.mark.parametrize("batch_size", [1, 20])
+def test_repeated_pairs_are_queried_once(stops, template, batch_size):
+	pairs = [A, B, A, A, B]
+	with MockJourneyPlanner() as server, \
+		 JourneyPlannerClient(server.url) as client:
+		trips = get_trips(pairs, stops, template, client, batch_size=batch_size)
+		assert server.n_requests == (2 if batch_size == 1 else 1)
+	assert len(trips) == len(pairs)
+	assert trips[0] is trips[2] is trips[3]
+	assert trips[1] is trips[4]
+
+
+def test_repeated_pairs_are_cached_once(stops, template):
+	clock = FakeClock(START)
+	cache = TripCache(ttl=60, clock=clock)
+	pairs = [A, B, A, B, A]
+	with MockJourneyPlanner() as server, \
+		 JourneyPlannerClient(server.url) as client:
+		get_trips(pairs, stops, template, client, batch_size=1, cache=cache)
+		assert server.n_requests == 2
+		assert cache.stats()["misses"] == 2
+		assert len(cache) == 2
+
+		get_trips(pairs, stops, template, client, batch_size=1, cache=cache)
+		assert server.n_requests == 2
+		assert cache.stats() == {"entries": 2, "hits": len(pairs), "misses": 2,
+                         		 "evictions": 0}
+
+
+def test_trips_keep_the_order_of_the_pairs(stops, template):
+	clock = FakeClock(START)
+	cache = TripCache(ttl=60, clock=clock)
+	for (start, end), duration in [(B, 1), (C, 2)]:
+		key = cache.get_key(get_stop_id(stops, start), get_stop_id(stops, end), 3)
+		cache.put(key, _get_response(duration))
+
+	# Cached and queried pairs mixed, over several batches
+	pairs = [A, B, A, C, B, A, C]
+	with MockJourneyPlanner() as server, \
+		 JourneyPlannerClient(server.url) as client:
+		trips = get_trips(pairs, stops, template, client, batch_size=1, cache=cache)
+		assert server.n_requests == 1
+	durations = [trip.trip_patterns[0].duration for trip in trips]
+	assert durations == [1710, 1, 1710, 2, 1, 1710, 2]
+
+
+@pytest.fixture(scope="module")
+def fallback(stops):
+	# A direct connection every second of the day, so there is always a trip
+	times = np.arange(24 * 3600)
+	frames = []
+	for (start, end), duration in [(A, 1500), (B, 900)]:
+		frames.append(pd.DataFrame({
+			"trip_id": [f"{start}:{t}" for t in times],
+			"departure_stop": get_stop_id(stops, start),
+			"arrival_stop": get_stop_id(stops, end),
+			"departure_time": times,
+			"arrival_time": times + duration,
+			"mode": "rail",
+			"line_id": "SYN:Line:0",
+			"public_code": "0",
+			"distance": 1000.0,
+		}, columns=TIMETABLE_COLUMNS))
+	return OfflinePlanner(pd.concat(frames, ignore_index=True))
+
+
+def test_fallback_when_the_api_fails(stops, template, fallback):
+	pairs = [A, B, A, B]
+	with MockJourneyPlanner(statuses=[503]) as server, \
+		 JourneyPlannerClient(server.url, retries=0) as client:
+		trips = get_trips(pairs, stops, template, client, n=1, fallback=fallback)
+		assert server.n_requests == 1
+	durations = [trip.trip_patterns[0].duration for trip in trips]
+	assert durations == [1500, 900, 1500, 900]
+	assert trips[0] is trips[2]
+
+
+def test_api_errors_are_raised_without_fallback(stops, template):
+	with MockJourneyPlanner(statuses=[503]) as server, \
+		 JourneyPlannerClient(server.url, retries=0) as client:
+		with pytest.raises(requests.RequestException):
+			get_trips([A, B], stops, template, client)
@@ -0,0 +1,102 @@
+"""
+Tests of the offline Connection Scan planner on a small hand-made timetable.
+
+Usage:
+	python -m pytest test_offline.py
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from offline import TIMETABLE_COLUMNS, OfflinePlanner
+from utils import get_stop_id, get_stop_index
+
+DIR = Path(__file__).parent
+X, Y, Z, W = "Lillestrøm stasjon", "Oslo S", "Forskningsparken", "Åråsen"
+
+# (trip, from, to, departure, arrival), seconds after midnight
+CONNECTIONS = [
+	("slow", X, Y, 1000, 1600),
+	("slow", Y, Z, 1630, 2500),    # Stays on: Z at 2500
+	("short", Y, Z, 1650, 1900),   # Only 50 s after arriving at Y, too short to change
+	("fast", Y, Z, 1800, 2100),    # Changing at Y: Z at 2100
+	("direct", X, Z, 3000, 4000),
+	("early", W, Y, 500, 900),     # Nothing leaves for W
+]
+
+
+@pytest.fixture(scope="module")
+def stops():
+	return get_stop_index(DIR)
+
+
+@pytest.fixture(scope="module")
+def planner(stops):
+	df = pd.DataFrame(CONNECTIONS, columns=["trip_id", "departure_stop",
+                                        	"arrival_stop", "departure_time",
+                                        	"arrival_time"])
+	for column in ["departure_stop", "arrival_stop"]:
+		df[column] = [get_stop_id(stops, name) for name in df[column]]
+	df["mode"] = df["trip_id"].map({"direct": "bus"}).fillna("rail")
+	df["line_id"] = "SYN:Line:" + df["trip_id"]
+	df["public_code"] = df["trip_id"]
+	df["distance"] = 1000.0
+	return OfflinePlanner(df[TIMETABLE_COLUMNS], min_transfer=120)
+
+
+def _get_legs(planner, stops, source, target, departure):
+	# The legs as (trip, departure time, arrival time)
+	legs = planner.earliest_arrival(get_stop_id(stops, source),
+                                 	get_stop_id(stops, target), departure)
+	if legs is None:
+		return None
+	return [(planner.lines[planner.line[board]][1],
+          	 int(planner.dep_time[board]), int(planner.arr_time[alight]))
+         	for board, alight in legs]
+
+
+def test_earliest_arrival_changes_trips(planner, stops):
+	assert _get_legs(planner, stops, X, Z, 0) == [("slow", 1000, 1600),
+                                              	  ("fast", 1800, 2100)]
+
+
+def test_earliest_arrival_with_one_leg(planner, stops):
+	assert _get_legs(planner, stops, X, Y, 0) == [("slow", 1000, 1600)]
+	assert _get_legs(planner, stops, Y, Z, 1660) == [("fast", 1800, 2100)]
+
+
+def test_transfer_time_is_not_needed_at_the_start(planner, stops):
+	assert _get_legs(planner, stops, Y, Z, 1650) == [("short", 1650, 1900)]
+
+
+def test_departures_before_the_query_time_are_skipped(planner, stops):
+	assert _get_legs(planner, stops, X, Z, 1001) == [("direct", 3000, 4000)]
+	assert _get_legs(planner, stops, X, Z, 3001) is None
+
+
+def test_no_route(planner, stops):
+	assert _get_legs(planner, stops, X, W, 0) is None
+	assert _get_legs(planner, stops, Z, X, 0) is None
+	assert _get_legs(planner, stops, X, X, 0) is None
+	assert planner.earliest_arrival("NSR:StopPlace:0", get_stop_id(stops, Z), 0) is None
+
+
+def test_get_trip_plans_journeys_one_after_the_other(planner, stops):
+	midnight = datetime(2027, 1, 15).astimezone()
+	trip = planner.get_trip(X, Z, stops, n=3, time=midnight + timedelta(seconds=900))
+
+	first, second = trip.trip_patterns
+	assert first.expected_start_time == midnight + timedelta(seconds=1000)
+	assert first.duration == 1100
+	assert [(leg.mode, leg.public_code) for leg in first.legs] == [("rail", "slow"),
+                                                               	   ("rail", "fast")]
+	assert second.expected_start_time == midnight + timedelta(seconds=3000)
+	assert [(leg.mode, leg.public_code) for leg in second.legs] == [("bus", "direct")]
+	assert second.legs[0].distance == 1000.0
+
+
+def test_get_trip_without_route_is_empty(planner, stops):
+	midnight = datetime(2027, 1, 15).astimezone()
+	assert planner.get_trip(X, W, stops, time=midnight).trip_patterns == []
@@ -1,21 +1,44 @@
-from datetime import datetime
+import numpy as np
+import sys
+
+from datetime import datetime, timedelta, timezone
+
+from metrics import METRICS
 
 class Leg:
+    # Modes and line codes repeat across legs, so they are interned and the
+    # raw `line` dict is not kept
+    __slots__ = ("mode", "distance", "line_id", "public_code")
+
     def __init__(self, args: dict) -> None:
-        self.mode = args["mode"]
+        self.mode = sys.intern(args["mode"])
         self.distance = args["distance"]
-        self.line = args["line"]
+        line = args["line"]
+        if line is None:
+            self.line_id = self.public_code = None
+        else:
+            self.line_id = sys.intern(line["id"])
+            self.public_code = sys.intern(line["publicCode"])
+
+    @property
+    def line(self) -> dict | None:
+        if self.line_id is None:
+            return None
+        return {"id": self.line_id, "publicCode": self.public_code}
         
     def __repr__(self) -> str:
         s = f"\n\tMode: {self.mode}"
-        if self.line is not None:
-            s += f", Line: {self.line['publicCode']}"
+        if self.line_id is not None:
+            s += f", Line: {self.public_code}"
         return s 
         
 class TripPattern:
+    __slots__ = ("expected_start_time", "duration", "walk_distance", "legs")
+
     def __init__(self, args: dict) -> None:
-        self.expected_start_time = datetime.strptime(args["expectedStartTime"],
-                                                     '%Y-%m-%dT%H:%M:%S%z')
+        # fromisoformat parses both +02:00 and +0200 offsets, and is much
+        # faster than strptime
+        self.expected_start_time = datetime.fromisoformat(args["expectedStartTime"])
         self.duration = args["duration"]
         self.walk_distance = args["walkDistance"]
         self.legs = [Leg(l) for l in args["legs"]]
@@ -25,6 +48,9 @@ class TripPattern:
             	f"Walking: {self.walk_distance}\nLegs: {self.legs}\n\n"
     
 class Trip:
+	__slots__ = ("trip_patterns",)
+
+	@METRICS.timed("trip_build")
 	def __init__(self, res: dict) -> None:
 		if not isinstance(res, dict):
 			raise TypeError("Res must be of type `dict`")
@@ -39,6 +65,12 @@ class Trip:
 		
 		
 		self.trip_patterns = [TripPattern(tp) for tp in temp]
+
+	@classmethod
+	def from_patterns(cls, trip_patterns: list[TripPattern]) -> "Trip":
+		trip = cls.__new__(cls)
+		trip.trip_patterns = trip_patterns
+		return trip
 		
 	def __repr__(self) -> str:
 		s = ""
@@ -46,7 +78,146 @@ class Trip:
 			s += f"Trip {i+1}:\n"
 			s += str(self.trip_patterns[i])
 		return s
+
+
+class TripTable:
+	"""
+	Columnar version of `Trip` for large responses. Every trip pattern is a 
+	row in NumPy arrays, and the legs of pattern `i` are the rows
+	`leg_offsets[i]:leg_offsets[i + 1]` of the leg arrays. Modes and lines are
+	stored as codes into `modes` and `lines`.
+
+	Attributes:
+		start (np.ndarray[int64]): expected start time, seconds since epoch
+		utc_offset (np.ndarray[int32]): UTC offset of the start time in seconds
+		duration (np.ndarray[int32]): duration in seconds
+		walk_distance (np.ndarray[float64]): walking distance in meters
+		leg_offsets (np.ndarray[int32]): index of the first leg of each pattern
+		leg_mode (np.ndarray[int16]): code into `modes`
+		leg_distance (np.ndarray[float64]): distance in meters
+		leg_line (np.ndarray[int32]): code into `lines`, -1 for no line
+		modes (list[str]): e.g. ["rail", "foot", "metro"]
+		lines (list[tuple[str, str]]): (id, publicCode) of the lines
+	"""
+	__slots__ = ("start", "utc_offset", "duration", "walk_distance",
+              	 "leg_offsets", "leg_mode", "leg_distance", "leg_line",
+              	 "modes", "lines")
+
+	def __init__(self, res: dict) -> None:
+		if not isinstance(res, dict):
+			raise TypeError("Res must be of type `dict`")
+
+		temp = res.get("trip", None)
+		if temp is None:
+			raise ValueError("Trip response does not include a 'trip' key.")
+		
+		temp = temp.get("tripPatterns", None)
+		if temp is None:
+			raise ValueError("No trip patterns were found")
+
+		n = len(temp)
+		starts = [datetime.fromisoformat(tp["expectedStartTime"]) for tp in temp]
+		self.start = np.fromiter((int(t.timestamp()) for t in starts), 
+                           		 dtype=np.int64, count=n)
+		self.utc_offset = np.fromiter(
+			(int(t.utcoffset().total_seconds()) for t in starts),
+			dtype=np.int32, count=n
+		)
+		self.duration = np.fromiter((tp["duration"] for tp in temp),
+                              		dtype=np.int32, count=n)
+		self.walk_distance = np.fromiter((tp["walkDistance"] for tp in temp),
+                                   		 dtype=np.float64, count=n)
+
+		legs = [leg for tp in temp for leg in tp["legs"]]
+		self.leg_offsets = np.zeros(n + 1, dtype=np.int32)
+		np.cumsum([len(tp["legs"]) for tp in temp], out=self.leg_offsets[1:])
+		self.leg_distance = np.fromiter((leg["distance"] for leg in legs),
+                                  		dtype=np.float64, count=len(legs))
+
+		# Codes are given in order of first appearance
+		mode_codes, line_codes = {}, {}
+		self.leg_mode = np.fromiter(
+			(mode_codes.setdefault(leg["mode"], len(mode_codes)) for leg in legs),
+			dtype=np.int16, count=len(legs)
+		)
+		self.leg_line = np.fromiter(
+			(-1 if leg["line"] is None else line_codes.setdefault(
+				(leg["line"]["id"], leg["line"]["publicCode"]), len(line_codes))
+    		 for leg in legs),
+			dtype=np.int32, count=len(legs)
+		)
+		self.modes = list(mode_codes)
+		self.lines = list(line_codes)
+
+	def to_trip(self) -> Trip:
+		"""
+		Converts the table back to the object API. Legs with the same mode,
+		line and distance share one `Leg`, so only the distinct legs are
+		built, from the columns in bulk.
+		"""
+		modes = [sys.intern(mode) for mode in self.modes]
+
+		# One code per distinct (mode, line, distance) leg
+		distances, distance_codes = np.unique(self.leg_distance, return_inverse=True)
+		n_lines = len(self.lines) + 1    # And no line
+		codes = ((self.leg_mode.astype(np.int64) * n_lines + self.leg_line + 1)
+           		 * len(distances) + distance_codes)
+		codes, inverse = np.unique(codes, return_inverse=True)
+		codes, distance_codes = np.divmod(codes, max(len(distances), 1))
+		mode_codes, line_codes = np.divmod(codes, n_lines)
+
+		distinct = []
+		for mode, line, distance in zip(mode_codes.tolist(),
+                                  		(line_codes - 1).tolist(),
+                                  		distances[distance_codes].tolist()):
+			leg = Leg.__new__(Leg)
+			leg.mode = modes[mode]
+			leg.distance = distance
+			if line == -1:
+				leg.line_id = leg.public_code = None
+			else:
+				leg.line_id, leg.public_code = self.lines[line]
+			distinct.append(leg)
+		legs = np.array(distinct, dtype=object)[inverse].tolist()
+
+		# Python lists are much faster to index one element at a time
+		start, utc_offset = self.start.tolist(), self.utc_offset.tolist()
+		duration, walk_distance = self.duration.tolist(), self.walk_distance.tolist()
+		leg_offsets = self.leg_offsets.tolist()
+		timezones = {offset: timezone(timedelta(seconds=offset))
+               		 for offset in set(utc_offset)}
+
+		trip_patterns = []
+		for i in range(len(self)):
+			tp = TripPattern.__new__(TripPattern)
+			tp.expected_start_time = datetime.fromtimestamp(
+				start[i], timezones[utc_offset[i]])
+			tp.duration = duration[i]
+			tp.walk_distance = walk_distance[i]
+			tp.legs = legs[leg_offsets[i]:leg_offsets[i + 1]]
+			trip_patterns.append(tp)
+
+		return Trip.from_patterns(trip_patterns)
+
+	def __len__(self) -> int:
+		return len(self.start)
+
+	def __repr__(self) -> str:
+		return f"TripTable({len(self)} patterns, {len(self.leg_mode)} legs)"
+
+
+def split_batch_response(res: dict) -> dict[str, Trip]:
+	"""
+	Splits the data of a batched (aliased) trip query into one `Trip` per 
+	alias, keeping the order of the response.
+	"""
+	if not isinstance(res, dict):
+		raise TypeError("Res must be of type `dict`")
+
+	return {alias: Trip({"trip": trip}) for alias, trip in res.items()}
+
     
 if __name__ == "__main__":
     test = {'trip': {'tripPatterns': [{'expectedStartTime': '2024-08-27T14:06:00+02:00', 'duration': 1710, 'walkDistance': 352.84, 'legs': [{'mode': 'rail', 'distance': 17476.26, 'line': {'id': 'NSB:Line:L13', 'publicCode': 'R13'}}, {'mode': 'foot', 'distance': 352.84, 'line': None}, {'mode': 'metro', 'distance': 4946.58, 'line': {'id': 'RUT:Line:5', 'publicCode': '5'}}]}, {'expectedStartTime': '2024-08-27T14:16:36+02:00', 'duration': 1644, 'walkDistance': 352.84, 'legs': [{'mode': 'rail', 'distance': 17466.75, 'line': {'id': 'NSB:Line:R10', 'publicCode': 'RE10'}}, {'mode': 'foot', 'distance': 352.84, 'line': None}, {'mode': 'metro', 'distance': 4946.58, 'line': {'id': 'RUT:Line:5', 'publicCode': '5'}}]}, {'expectedStartTime': '2024-08-27T14:26:00+02:00', 'duration': 1680, 'walkDistance': 352.84, 'legs': [{'mode': 'rail', 'distance': 17466.75, 'line': {'id': 'NSB:Line:R11', 'publicCode': 'RE11'}}, {'mode': 'foot', 'distance': 352.84, 'line': None}, {'mode': 'metro', 'distance': 4946.58, 'line': {'id': 'RUT:Line:4', 'publicCode': '4'}}]}]}}
-    print(Trip(test))
\ No newline at end of file
+    print(Trip(test))
+    print(TripTable(test).to_trip())
\ No newline at end of file
@@ -3,7 +3,12 @@ import pandas as pd
 from datetime import datetime
 from pathlib import Path
 
+from metrics import METRICS
+from query_template import QueryTemplate, compile_template, load_template
+from stop_index import Stop, StopIndex
 
+
+@METRICS.timed("stop_load")
 def get_stop_dataframe(dir: str) -> pd.DataFrame:
 	"""
 	Reads stop information from `{dir}/data/stops.csv`, adds simple keys for 
@@ -31,40 +36,56 @@ def get_stop_dataframe(dir: str) -> pd.DataFrame:
 	return df
 	
 
-def get_query_templates(template_dir: Path) -> dict[str, str]:
+@METRICS.timed("template_load")
+def get_query_templates(template_dir: Path) -> dict[str, QueryTemplate]:
 	"""
  	Traverses query template directory and maps the name of the query to the 
- 	template.
+ 	compiled template. Files are only re-read when they have changed.
 	"""
 	res = {}
 	for template in template_dir.glob("*"):
-		with open(template, "r", encoding="utf-8") as f:
-			res[template.stem] = f.read()
+		res[template.stem] = load_template(template)
  
 	return res	
  
 
-def _get_stops_with_checks(stops: pd.DataFrame, key: str) -> pd.DataFrame:
+@METRICS.timed("stop_index")
+def get_stop_index(dir: str, aliases: dict[str, str] = None) -> StopIndex:
+	"""
+	Same as `get_stop_dataframe`, but returns a `StopIndex` for constant time
+	stop lookups.
+	"""
+	return StopIndex(get_stop_dataframe(dir), aliases)
+
+
+def _get_stops_with_checks(stops: pd.DataFrame | StopIndex, key: str) -> Stop:
 	""" Validates stop keys and results from given Dataframe.
 		- Converts string to lowercase
 		- Check that the result is not empty or more than 1
 	
 	Arguments:
-		stops (pd.DataFrame): all known stops 
+		stops (pd.DataFrame | StopIndex): all known stops. A `StopIndex` is a
+  			dict lookup, while a pd.DataFrame is scanned for every key.
 		key (str): informal stop name for identifying the correct stop
   
 	Returns:
-		_stop (pd.DataFrame): the row of the dataframe containing stop 
-  			information about the given key.
-		TODO: maybe change this to a Series to make it more lightweight? Not a 
-  			problem yet, though
+		_stop (Stop): the name, id and key of the stop
 	"""
+	if isinstance(stops, StopIndex):
+		return stops.get(key)
+
 	key = key.lower()
 	_stop = stops[stops["key"] == key]
 	assert len(_stop) != 0, f"Stop key, '{key}', not found in stop dataframe"
 	assert len(_stop) == 1, f"Something went wrong with getting '{key}'stop."
 	
-	return _stop
+	_stop = _stop.iloc[0]
+	return Stop(_stop["name"], _stop["id"], _stop["key"])
+
+
+def get_stop_id(stops: pd.DataFrame | StopIndex, key: str) -> str:
+	""" Returns the NSR id of the stop with the informal name `key`. """
+	return _get_stops_with_checks(stops, key).id
 
 
 def _format_date_time(gmt: str = "+02:00") -> str:
@@ -93,29 +114,68 @@ def _format_date_time(gmt: str = "+02:00") -> str:
 	return res
 
 
+@METRICS.timed("query_build")
 def get_trip_query_body(start: str,
                         end: str,
-                        stops: pd.DataFrame, 
-                        template:str,
+                        stops: pd.DataFrame | StopIndex, 
+                        template: str | QueryTemplate,
                         n: int = 3
     ) -> str:
 	start = _get_stops_with_checks(stops, start)
 	end = _get_stops_with_checks(stops, end)
 	time = _format_date_time()
+ 
+	# The {} in the query make it so we can't use format, so the template is 
+	# compiled into segments once and joined here
+	if not isinstance(template, QueryTemplate):
+		template = compile_template(template)
+  
+	return template.render(
+		start_id=start.id,
+		start_name=start.name,
+		end_id=end.id,
+		end_name=end.name,
+		n=n,
+		datetime=time,
+	)
+
+
+def get_trip_alias(i: int) -> str:
+	""" The GraphQL alias of the i-th `trip` field in a batched query. """
+	return f"trip_{i}"
+
+
+def get_batch_trip_query_body(pairs: list[tuple[str, str]],
+                              stops: pd.DataFrame | StopIndex,
+                              template: str | QueryTemplate,
+                              n: int = 3
+    ) -> str:
+	"""
+	Combines the trip queries for several (start, end) pairs into a single 
+	GraphQL document, so they can be sent in one request. Every sub-query is 
+	aliased with `get_trip_alias`, in the same order as `pairs`.
+ 
+	Arguments:
+		pairs (list[tuple[str, str]]): informal (start, end) stop names
+		stops (pd.DataFrame | StopIndex): all known stops
+		template (str | QueryTemplate): the `trip` query template
+		n (int): the number of trip patterns per pair
+  
+	Returns:
+		str: the batched query, i.e.
+			{
+			trip_0: trip(...) {...}
+			trip_1: trip(...) {...}
+			}
+	"""
+	sub_queries = []
+	for i, (start, end) in enumerate(pairs):
+		body = get_trip_query_body(start, end, stops, template, n).strip()
+		assert body.startswith("{") and body.endswith("}"), \
+			"Trip template must be wrapped in a single pair of braces"
+  
+		# Drop the outer braces and alias the trip field
+		body = body[1:-1].strip()
+		sub_queries.append(f"{get_trip_alias(i)}: {body}")
   
-	# TODO: There is probably a better way of doing this, but 
-	# 	the {} in the query make it so I can't use format
-	return template.replace(
-     			"{start_id}", start["id"].values[0]
-			).replace(
-				"{start_name}", start["name"].values[0]
-			).replace(
-				"{end_id}", end["id"].values[0]
-			).replace(
-				"{end_name}", end["name"].values[0]
-			).replace(
-				"{n}", str(n)
-    		).replace(
-				"{datetime}", time
-			)		
-	
\ No newline at end of file
+	return "{\n" + "\n".join(sub_queries) + "\n}"
@@ -0,0 +1,272 @@
+"""
+Benchmarks of getting the results, against a local server instead of the website.
+
+The server serves fixture pages rendered like the results table of the website,
+from the results saved in `results/`, with `--latency` seconds of delay per page
+to stand in for the network.
+
+Usage:
+	python bench.py crawl --pages 48 --latency 0.2
+	python bench.py cache --pages 48 --latency 0.2
+	python bench.py parse --rows 500 5000 50000
+	python bench.py store --years 20
+"""
+
+import hashlib
+import html
+import tempfile
+import threading
+import time
+import pandas as pd
+import requests
+
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from crawl import CATEGORIES, crawl, get_pages
+from bs4 import BeautifulSoup
+from get_results import _parse_row, parse_page
+from page_cache import PageCache
+from store import ResultsStore, parse_times
+
+RESULTS = Path(__file__).parent/'results'/'wjpc_2024_individual_final.csv'
+
+
+def make_fixture_page(df: pd.DataFrame) -> str:
+	"""
+	Renders results as the table on the website, where the country and name share a cell.
+	"""
+	headers = ['', '#', '', 'Name', 'Origin', 'Country', 'Time', '', '']
+	rows = []
+	for _, row in df.iterrows():
+		cells = ['', row['#'], '', f"{row['Country']} {row['Name']}\n{row['Origin']}",
+				 row['Origin'], row['Country'], row['Time'], '+00:00:00', '+00:00:00']
+		rows.append('<tr>' + ''.join(f'<td>{html.escape(str(c))}</td>' for c in cells) + '</tr>')
+
+	return ('<html><body><table id="participantes"><tr>'
+			+ ''.join(f'<th>{h}</th>' for h in headers) + '</tr>'
+			+ '\n'.join(rows) + '</table></body></html>')
+
+
+class FixtureServer(ThreadingHTTPServer):
+	"""
+	Serves the same fixture page for every url under /wjpc/, after `latency` seconds,
+	with an ETag so it can be revalidated.
+	"""
+	daemon_threads = True
+
+	def __init__(self, page: str, latency: float = 0.0) -> None:
+		self.page = page.encode('utf-8')
+		self.etag = '"' + hashlib.sha256(self.page).hexdigest()[:16] + '"'
+		self.latency = latency
+		self.n_requests = 0
+		self.n_not_modified = 0
+		super().__init__(('127.0.0.1', 0), FixtureHandler)
+		self.url = f'http://127.0.0.1:{self.server_address[1]}/wjpc'
+		threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'  # Keeps the connections alive
+
+	def do_GET(self) -> None:
+		self.server.n_requests += 1
+		time.sleep(self.server.latency)
+		if not self.path.startswith('/wjpc/'):
+			self.send_error(404)
+			return
+		if self.headers.get('If-None-Match') == self.server.etag:
+			self.server.n_not_modified += 1
+			self.send_response(304)
+			self.send_header('ETag', self.server.etag)
+			self.end_headers()
+			return
+		self.send_response(200)
+		self.send_header('ETag', self.server.etag)
+		self.send_header('Content-Type', 'text/html; charset=utf-8')
+		self.send_header('Content-Length', str(len(self.server.page)))
+		self.end_headers()
+		self.wfile.write(self.server.page)
+
+	def log_message(self, *args) -> None:
+		pass
+
+
+def bench_crawl(n_pages: int, latency: float, workers: list[int], parse_workers: int) -> None:
+	server = FixtureServer(make_fixture_page(pd.read_csv(RESULTS, index_col=0)), latency)
+	years = [str(2000 + i) for i in range(-(-n_pages // len(CATEGORIES)))]
+	pages = get_pages(server.url, years, CATEGORIES, ['final'])[:n_pages]
+
+	# One blocking request and parse at a time, like running get_results.py per page
+	start = time.perf_counter()
+	for _, url in pages:
+		parse_page(requests.get(url).text)
+	elapsed = time.perf_counter() - start
+	print(f'{"sequential":<24} {len(pages) / elapsed:8.1f} pages/s')
+
+	for n in workers:
+		start = time.perf_counter()
+		results = crawl(pages, n, parse_workers, rate=0)
+		elapsed = time.perf_counter() - start
+		assert len(results) == len(pages), 'Every page must be parsed'
+		print(f'{f"crawl, {n} threads":<24} {len(pages) / elapsed:8.1f} pages/s')
+
+	server.shutdown()
+
+
+def bench_cache(n_pages: int, latency: float, workers: int, parse_workers: int) -> None:
+	server = FixtureServer(make_fixture_page(pd.read_csv(RESULTS, index_col=0)), latency)
+	years = [str(2000 + i) for i in range(-(-n_pages // len(CATEGORIES)))]
+	pages = get_pages(server.url, years, CATEGORIES, ['final'])[:n_pages]
+
+	with tempfile.TemporaryDirectory() as directory:
+		cache = PageCache(directory)
+		for run in ['first run', 're-run']:
+			n_not_modified = server.n_not_modified
+			start = time.perf_counter()
+			results = crawl(pages, workers, parse_workers, rate=0, cache=cache)
+			elapsed = time.perf_counter() - start
+			for key, url in pages:
+				if key in results:
+					cache.mark_ingested(url)
+			print(f'{run:<12} {len(pages) / elapsed:8.1f} pages/s, {len(results)} parsed, '
+				  f'{server.n_not_modified - n_not_modified} not modified')
+
+	server.shutdown()
+
+
+# The parsing of get_results.py before parse_table, with BeautifulSoup and one
+# df.loc append per row, kept to compare against
+def parse_data(df: pd.DataFrame, table):
+	column_data = table.find_all('tr')
+	for row in column_data[1:]:
+		row_data = row.find_all('td')
+		this_row_data = [data.text.strip() for data in row_data]
+		d = _parse_row(this_row_data)
+		df.loc[len(df)] = d
+	return df 
+
+
+def get_table_columns(table):
+	titles = table.find_all('th')
+	table_columns = [title.text for title in titles if title.text]
+	# Manual clean up because some columns are not labeled 
+	table_columns.append("From Previous")
+	table_columns.append("From First")
+
+	return table_columns
+
+
+def _parse_page_soup(html: str) -> pd.DataFrame:
+	soup = BeautifulSoup(html, features='lxml')
+	table = soup.find_all('table', id='participantes')[0]
+	df = pd.DataFrame(columns=get_table_columns(table))
+	df = parse_data(df, table)
+	return df.drop(columns=['From Previous', 'From First'])
+
+
+def bench_parse(n_rows: list[int], max_seconds: float) -> None:
+	results = pd.read_csv(RESULTS, index_col=0)
+	print(f'{"rows":>8} {"parse_data (s)":>16} {"parse_table (s)":>16} {"speedup":>8}')
+
+	slow, prev = 0.0, 1
+	for n in n_rows:
+		df = pd.concat([results] * -(-n // len(results)), ignore_index=True)[:n]
+		df['#'] = range(1, n + 1)
+		page = make_fixture_page(df)
+
+		start = time.perf_counter()
+		new = parse_page(page)
+		fast = time.perf_counter() - start
+		assert len(new) == n, 'Every row must be parsed'
+
+		# The row appends are quadratic, so they are skipped once they would take too long
+		if slow * (n / prev) ** 2 < max_seconds:
+			start = time.perf_counter()
+			old = _parse_page_soup(page)
+			slow = time.perf_counter() - start
+			assert old.astype(str).equals(new.astype(str)), 'The parsers must agree'
+			print(f'{n:>8} {slow:>16.3f} {fast:>16.3f} {slow / fast:>7.0f}x')
+		else:
+			print(f'{n:>8} {"skipped":>16} {fast:>16.3f}')
+		prev = n
+
+
+def bench_store(n_years: int, country: str) -> None:
+	results = pd.read_csv(RESULTS, index_col=0)
+	years = [str(2000 + i) for i in range(n_years)]
+
+	with tempfile.TemporaryDirectory() as directory:
+		directory = Path(directory)
+		for year in years:
+			results.to_csv(directory/f'wjpc_{year}_individual_final.csv')
+
+		start = time.perf_counter()
+		with ResultsStore(directory/'wjpc.db') as store:
+			for year in years:
+				store.ingest(results, year, 'individual', 'final')
+		elapsed = time.perf_counter() - start
+		print(f'{"ingest":<24} {len(results) * n_years / elapsed:10.0f} rows/s')
+
+		# The finishers of a country in under an hour, every year
+		start = time.perf_counter()
+		dfs = []
+		for path in sorted(directory.glob('wjpc_*.csv')):
+			df = pd.read_csv(path, index_col=0)
+			seconds, _ = parse_times(df['Time'])
+			dfs.append(df[(df['Country'] == country) & (seconds < 3600)])
+		from_csv = pd.concat(dfs)
+		csv_elapsed = time.perf_counter() - start
+
+		start = time.perf_counter()
+		with ResultsStore(directory/'wjpc.db') as store:
+			from_store = store.query(
+				'SELECT * FROM results_view WHERE country = ? AND seconds < 3600', (country,)
+			)
+		store_elapsed = time.perf_counter() - start
+		assert len(from_csv) == len(from_store), 'The queries must agree'
+
+		print(f'{"query, csvs":<24} {csv_elapsed * 1000:10.1f} ms')
+		print(f'{"query, store":<24} {store_elapsed * 1000:10.1f} ms')
+
+
+if __name__ == "__main__":
+	parser = ArgumentParser()
+	subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+	crawl_parser = subparsers.add_parser('crawl', help='Sequential fetching against crawl.py.')
+	crawl_parser.add_argument('--pages', type=int, default=48)
+	crawl_parser.add_argument('--latency', type=float, default=0.2,
+							  help='Seconds of delay per page.')
+	crawl_parser.add_argument('--workers', type=int, nargs='+', default=[4, 16])
+	crawl_parser.add_argument('--parse_workers', type=int, default=None,
+							  help='Processes parsing pages, one per CPU by default.')
+
+	cache_parser = subparsers.add_parser('cache', help='crawl.py with the page cache, cold and again.')
+	cache_parser.add_argument('--pages', type=int, default=48)
+	cache_parser.add_argument('--latency', type=float, default=0.2,
+							  help='Seconds of delay per page.')
+	cache_parser.add_argument('--workers', type=int, default=16)
+	cache_parser.add_argument('--parse_workers', type=int, default=None,
+							  help='Processes parsing pages, one per CPU by default.')
+
+	parse_parser = subparsers.add_parser('parse', help='parse_data against parse_table.')
+	parse_parser.add_argument('--rows', type=int, nargs='+', default=[500, 5000, 50000])
+	parse_parser.add_argument('--max_seconds', type=float, default=600.0,
+							  help='Skip parse_data when it is expected to take longer.')
+
+	store_parser = subparsers.add_parser('store', help='Querying the database against the csvs.')
+	store_parser.add_argument('--years', type=int, default=20)
+	store_parser.add_argument('--country', type=str, default='Norway')
+
+	args = parser.parse_args()
+
+	if args.benchmark == 'crawl':
+		bench_crawl(args.pages, args.latency, args.workers, args.parse_workers)
+	elif args.benchmark == 'cache':
+		bench_cache(args.pages, args.latency, args.workers, args.parse_workers)
+	elif args.benchmark == 'parse':
+		bench_parse(args.rows, args.max_seconds)
+	elif args.benchmark == 'store':
+		bench_store(args.years, args.country)
@@ -0,0 +1,257 @@
+"""
+This script crawls the results of the World Jigsaw Puzzle Championships in bulk.
+It fetches every combination of the given years, categories and rounds, instead of
+one page per run like `get_results.py`, and saves each page as a csv.
+
+The pages are fetched by a pool of threads sharing one keep-alive session, with
+the requests to every host spaced out by a rate limit. The fetched pages are parsed
+in a pool of processes as they arrive, so the CPU-bound parsing does not hold up
+the fetching, and are saved to the database, see `store.py`, and as csvs. Pages
+which do not exist, e.g. rounds not held in a year, are skipped, as are pages
+which have not changed since they were last saved, see `page_cache.py`.
+
+Usage:
+	python crawl.py --years 2022 2023 2024 --categories individual pairs teams --rounds final
+"""
+
+import logging
+import threading
+import time
+import pandas as pd
+import requests
+
+from argparse import ArgumentParser
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import product
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from urllib3.util.retry import Retry
+
+from get_results import parse_page
+from page_cache import CachedPage, PageCache
+from store import ResultsStore
+
+CATEGORIES = ['individual', 'pairs', 'teams']
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+	"""
+	Spaces out the requests to every host by at least 1 / `rate` seconds, across all threads.
+	"""
+	def __init__(self, rate: float) -> None:
+		self.interval = 1 / rate if rate else 0.0
+		self._lock = threading.Lock()
+		self._next = {}
+
+	def wait(self, host: str) -> None:
+		with self._lock:
+			now = time.monotonic()
+			start = max(now, self._next.get(host, now))
+			self._next[host] = start + self.interval
+		if start > now:
+			time.sleep(start - now)
+
+
+def get_session(pool_size: int = 8, retries: int = 3) -> requests.Session:
+	"""
+	Returns a session which keeps up to `pool_size` connections per host alive,
+	and retries failed requests with a backoff.
+	"""
+	retry = Retry(total=retries,
+				  backoff_factor=0.5,
+				  status_forcelist=[429, 500, 502, 503, 504])
+	adapter = HTTPAdapter(pool_connections=pool_size,
+						  pool_maxsize=pool_size,
+						  max_retries=retry)
+	session = requests.Session()
+	session.mount('http://', adapter)
+	session.mount('https://', adapter)
+	return session
+
+
+def get_pages(url: str,
+			  years: list[str],
+			  categories: list[str],
+			  rounds: list[str]
+			 ) -> list[tuple[tuple[str, str, str], str]]:
+	# WJPC URL structure: COMPETITION/YEAR/CATEGORY/ROUND
+	return [((year, category, round), f'{url}/{year}/{category}/{round}')
+			for year, category, round in product(years, categories, rounds)]
+
+
+def fetch_page(session: requests.Session,
+			   limiter: RateLimiter,
+			   url: str,
+			   timeout: float = 30.0
+			  ) -> str | None:
+	"""
+	Returns the html of a page, or None if it does not exist.
+	"""
+	limiter.wait(urlparse(url).netloc)
+	response = session.get(url, timeout=timeout)
+	if response.status_code == 404:
+		return None
+	response.raise_for_status()
+	return response.text
+
+
+def fetch_cached_page(cache: PageCache,
+					  session: requests.Session,
+					  limiter: RateLimiter,
+					  url: str,
+					  timeout: float = 30.0
+					 ) -> CachedPage | None:
+	limiter.wait(urlparse(url).netloc)
+	return cache.fetch(url, session, timeout)
+
+
+def _parse_now(html: str) -> Future:
+	# A finished future, which is collected like the ones of the process pool
+	future = Future()
+	try:
+		future.set_result(parse_page(html))
+	except Exception as e:
+		future.set_exception(e)
+	return future
+
+
+def crawl(pages: list[tuple[tuple[str, str, str], str]],
+		  workers: int = 8,
+		  parse_workers: int = None,
+		  rate: float = 4.0,
+		  timeout: float = 30.0,
+		  cache: PageCache = None
+		 ) -> dict[tuple[str, str, str], pd.DataFrame]:
+	"""
+	Fetches and parses the pages concurrently.
+
+	Arguments:
+		pages (list): The (year, category, round) and url of every page, see `get_pages`.
+		workers (int): The number of threads fetching pages.
+		parse_workers (int): The number of processes parsing pages, one per CPU if None.
+			With 0 the pages are parsed in this process as they arrive.
+		rate (float): The largest number of requests per second to a host, unlimited if 0.
+		timeout (float): The number of seconds to wait for a page.
+		cache (PageCache): Revalidates the pages, which are skipped if they have been ingested.
+			The caller marks them as ingested once they are saved.
+	Returns:
+		dict: The results of every new or changed page found, by (year, category, round).
+	"""
+	session = get_session(workers)
+	limiter = RateLimiter(rate)
+	parsers = ProcessPoolExecutor(parse_workers) if parse_workers != 0 else None
+
+	results = {}
+	parsing = {}
+	with ThreadPoolExecutor(workers) as fetchers:
+		if cache is None:
+			fetching = {fetchers.submit(fetch_page, session, limiter, url, timeout): key
+						for key, url in pages}
+		else:
+			fetching = {fetchers.submit(fetch_cached_page, cache, session, limiter, url, timeout): key
+						for key, url in pages}
+
+		# Every page is handed to the parsers as soon as it is fetched
+		for future in as_completed(fetching):
+			key = fetching[future]
+			try:
+				page = future.result()
+			except requests.RequestException as e:
+				logger.warning(f'Could not fetch {"/".join(key)}: {e}')
+				continue
+			if page is None:
+				logger.info(f'No results for {"/".join(key)}')
+				continue
+			if cache is None:
+				html = page
+			elif page.changed:
+				html = page.text
+			else:
+				logger.info(f'{"/".join(key)} has not changed')
+				continue
+
+			if parsers is None:
+				parsing[_parse_now(html)] = key
+			else:
+				parsing[parsers.submit(parse_page, html)] = key
+
+	for future in as_completed(parsing):
+		key = parsing[future]
+		try:
+			results[key] = future.result()
+		except Exception as e:
+			# NOTE: names of pairs and teams are not parsed yet, see `get_results.py`
+			logger.warning(f'Could not parse {"/".join(key)}: {e!r}')
+
+	if parsers is not None:
+		parsers.shutdown()
+	session.close()
+
+	return results
+
+
+def save_pages(results: dict[tuple[str, str, str], pd.DataFrame],
+			   output: str | Path,
+			   database: str | Path = None
+			  ) -> None:
+	output = Path(output)
+	if not output.exists(): output.mkdir()
+	store = ResultsStore(database) if database is not None else None
+	for (year, category, round), df in results.items():
+		df.to_csv(output/f'wjpc_{year}_{category}_{round}.csv')
+		if store is not None:
+			store.ingest(df, year, category, round)
+	if store is not None:
+		store.close()
+
+
+if __name__ == "__main__":
+	logging.basicConfig(level=logging.INFO,
+						format='%(asctime)s - %(levelname)s: %(message)s')
+
+	parser = ArgumentParser()
+	parser.add_argument('--years', type=str, nargs='+',
+						default=['2019', '2022', '2023', '2024'],
+						help='The years of the World Jigsaw Puzzle Championships.')
+	parser.add_argument('--categories', type=str, nargs='+',
+						choices=CATEGORIES, default=CATEGORIES,
+						help='The categories of results to get.')
+	parser.add_argument('--rounds', type=str, nargs='+', default=['final'],
+						help='The rounds of results to get.')
+	parser.add_argument('--url', type=str,
+						default='https://www.worldjigsawpuzzle.org/wjpc',
+						help='The url to the competition results.')
+	parser.add_argument('--output', '-o', type=str, default='./results',
+						help='The path to the directory to save the results.')
+	parser.add_argument('--workers', type=int, default=8,
+						help='The number of pages fetched at a time.')
+	parser.add_argument('--parse_workers', type=int, default=None,
+						help='The number of processes parsing pages, one per CPU by default.')
+	parser.add_argument('--rate', type=float, default=4.0,
+						help='The largest number of requests per second, 0 for no limit.')
+	parser.add_argument('--no_cache', action='store_true',
+						help='Download every page without the page cache in OUTPUT/.cache.')
+	parser.add_argument('--database', type=str, default='wjpc.db',
+						help='The name of the sqlite3 database in OUTPUT to save the results to.')
+
+	args = parser.parse_args()
+
+	pages = get_pages(args.url, args.years, args.categories, args.rounds)
+	logger.info(f'Crawling {len(pages)} pages')
+
+	cache = None if args.no_cache else PageCache(Path(args.output)/'.cache')
+
+	start = time.perf_counter()
+	results = crawl(pages, args.workers, args.parse_workers, args.rate, cache=cache)
+	elapsed = time.perf_counter() - start
+
+	save_pages(results, args.output, Path(args.output)/args.database)
+	if cache is not None:
+		urls = dict(pages)
+		for key in results:
+			cache.mark_ingested(urls[key])
+	logger.info(f'Saved {len(results)} new or changed of {len(pages)} pages to {args.output} '
+				f'in {elapsed:.1f}s ({len(pages) / elapsed:.1f} pages/s)')
@@ -6,43 +6,69 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
+from functools import cached_property
+
 class ResultStats:
+	"""
+	The stats are computed the first time they are used, and then cached,
+	so the results should not be changed afterwards.
+	"""
 	def __init__(self, 
               	 results: pd.DataFrame,
                  gradient: tuple[str] = ('#0096C7', '#FFA500')
               ) -> None:
 		self.df = results
-		self.n_countries = len(self.df["Country"].unique())
-		self.dnf = len(self.df[self.df['Time'].str.contains('Pieces')])
-		self.finishers = self.df[self.df['Time'].str.contains('Pieces') == False]
 		self.gradient = gradient
-		self.avg_time = self.get_average_time()
-  
-  
-	def get_average_time(self) -> str:
-		times = [datetime.datetime.strptime(t.strip(), "%H:%M:%S").time() 
-                             					for t in self.finishers['Time']]
 
-		hour = [x.hour for x in times]
-		min = [x.minute for x in times]
-		sec = [x.second for x in times]
-  
-		self.finishers = self.finishers.assign(_time=times,
-												hour=hour,
-												min=min,
-												second=sec
-                                        	)
-		
+
+	@cached_property
+	def times(self) -> np.ndarray:
+		# Converted from python strings once, so the string ops below are vectorized
+		return np.strings.strip(self.df['Time'].to_numpy(dtype=str))
+
+
+	@cached_property
+	def is_dnf(self) -> np.ndarray:
+		# Participants who did not finish have the number of pieces instead of a time
+		return np.strings.endswith(self.times, 'Pieces')
+
+
+	@cached_property
+	def finishers(self) -> pd.DataFrame:
+		return self.df[~self.is_dnf].assign(seconds=parse_seconds(self.times[~self.is_dnf]))
+
+
+	@cached_property
+	def n_countries(self) -> int:
+		return self.df["Country"].nunique()
+
+
+	@cached_property
+	def dnf(self) -> int:
+		return int(self.is_dnf.sum())
+
+
+	@cached_property
+	def avg_time(self) -> str:
 		# Calculate the average number of seconds 
-		avg_sec = int((sum(hour)* 3600 +  sum(min) * 60 + sum(sec)) / len(times))
+		avg_sec = int(self.finishers['seconds'].mean())
 		
 		# Convert the seconds back to hours:minutes:seconds
 		return "0" + str(datetime.timedelta(seconds = avg_sec))
 
 
-	def get_faster_than_1_hr(self):
+	@cached_property
+	def faster_than_1_hr(self) -> int:
 		limit = 3600
-		return len(self.finishers[self.finishers["hour"] == 0])
+		return int((self.finishers['seconds'] < limit).sum())
+  
+  
+	def get_average_time(self) -> str:
+		return self.avg_time
+
+
+	def get_faster_than_1_hr(self) -> int:
+		return self.faster_than_1_hr
 
 
 
@@ -66,6 +92,27 @@ class ResultStats:
 
 
 
+def parse_seconds(times: np.ndarray) -> np.ndarray:
+	"""
+	Converts an array of stripped "HH:MM:SS" times to an int32 number of seconds.
+	"""
+	times = np.asarray(times, dtype=str)
+	# Fixed width, with the colons at 2 and 5
+	fixed_width = ((np.strings.str_len(times) == 8)
+				   & (np.strings.slice(times, 2, 3) == ':')
+				   & (np.strings.slice(times, 5, 6) == ':'))
+	if times.size and fixed_width.all():
+		# "HH:MM:SS" -> HHMMSS, parsed in one go and split with divmod
+		hhmmss = np.strings.replace(times, ':', '')
+		if np.strings.isdigit(hhmmss).all():
+			hours, mmss = np.divmod(hhmmss.astype(np.int32), 10_000)
+			minutes, seconds = np.divmod(mmss, 100)
+			return hours * 3600 + minutes * 60 + seconds
+
+	return pd.to_timedelta(times).total_seconds().to_numpy().astype(np.int32)
+
+
+
 if __name__ == "__main__":
 	df = pd.read_csv("data/wjpc_2024_individual_final.csv", 
 				index_col=0
@@ -1,21 +1,25 @@
 """
 This script retrieves and parses data from the World Jigsaw Puzzle Championships website.
 It allows users to specify the category, year, and round of results to analyze.
-The script fetches the competition results from the specified URL and saves them in an sqlite3 database.
+The script fetches the competition results from the specified URL and saves them in an sqlite3 database,
+see `store.py`, and a csv.
+Pages are revalidated against an on-disk cache, see `page_cache.py`, and skipped if they have not changed.
 
 NOTE:
 - Parsing of names for pairs and teams is not implemented yet 
 """
 
 import logging
+import lxml.html
 import pandas as pd
 import requests
-import sqlite3
 
-from bs4 import BeautifulSoup
 from argparse import ArgumentParser
 from pathlib import Path
 
+from page_cache import PageCache
+from store import ResultsStore
+
 def _get_country_and_name(row: list) -> tuple:
     # The setup of the table on the website combines country and name
 	data, *_ = row[3].split("\n") 
@@ -45,41 +49,58 @@ def _parse_row(row: list) -> list:
 	return parsed
 
 
-def parse_data(df: pd.DataFrame, table):
-	column_data = table.find_all('tr')
-	for row in column_data[1:]:
-		row_data = row.find_all('td')
-		this_row_data = [data.text.strip() for data in row_data]
-		d = _parse_row(this_row_data)
-		df.loc[len(df)] = d
-	return df 
+def parse_table(html: str) -> pd.DataFrame:
+	"""
+	Parses the results table into a DataFrame in linear time: the table is walked
+	with lxml and the rows are collected in one list per column, from which the
+	DataFrame is made once.
+	"""
+	# Spanish/English mix because of Spanish website
+	table = lxml.html.fromstring(html).get_element_by_id('participantes')
+
+	rows = table.iter('tr')
+	next(rows, None)  # The first row has the titles
+	titles = [th.text_content() for th in table.iter('th')]
+	cols = [title for title in titles if title]
+	# Manual clean up because some columns are not labeled
+	cols += ["From Previous", "From First"]
+
+	columns = [[] for _ in cols]
+	for row in rows:
+		d = _parse_row([td.text_content().strip() for td in row.iter('td')])
+		if len(d) != len(cols):
+			raise ValueError(f'Row {len(columns[0])} has {len(d)} values for {len(cols)} columns')
+		for column, value in zip(columns, d):
+			column.append(value)
 
+	# By position, since the titles are not necessarily unique
+	df = pd.DataFrame(dict(enumerate(columns)))
+	df.columns = cols
+	return df
 
-def get_table_columns(table):
-	titles = table.find_all('th')
-	table_columns = [title.text for title in titles if title.text]
-	# Manual clean up because some columns are not labeled 
-	table_columns.append("From Previous")
-	table_columns.append("From First")
 
-	return table_columns
+def parse_page(html: str) -> pd.DataFrame:
+	df = parse_table(html)
+
+	# Dropping unneeded columns
+	df = df.drop(columns=['From Previous', 'From First'])
+
+	return df
 
 
 def save_results(df: pd.DataFrame,
     			 database: str,
+				 year: str,
 				 category: str, 
+				 round: str,
 				 logger: logging.Logger,
 				 output: str
                 ) -> None:
-	connection = sqlite3.connect(database)
-	cursor = connection.cursor()
-	res = cursor.execute(f"SELECT name FROM sqlite_master WHERE name='{category}'").fetchone()
-	if res is None:
-		logger.info("Saving to the database")
-		df.to_sql(name=category, con=connection)
-	else:
-		logger.info("The table already exists in the database. Saving to csv.")
-		df.to_csv(output)
+	# Saving the round again replaces its results in the database
+	with ResultsStore(database) as store:
+		n = store.ingest(df, year, category, round)
+	if logger is not None: logger.info(f"Saved {n} results to {database} and {output}")
+	df.to_csv(output)
 
 
 def main(url: str,
@@ -90,7 +111,9 @@ def main(url: str,
          logger: logging.Logger = None,
          output: str | Path = None,
          filename: str = None,
-         database: str = 'wjpc2024.db'
+         database: str = 'wjpc.db',
+         cache: str | Path = None,
+         force: bool = False
         ) -> None:
     # Initiates default logger if logger not given
 	if verbose and logger is None:
@@ -104,19 +127,25 @@ def main(url: str,
 		if filename is None:
 			filename = f'wjpc_{year}_{category}_{round}.csv'
 
-	page = requests.get(url)
-	soup = BeautifulSoup(page.text, features='lxml')
-
-	# Spanish/English mix because of Spanish website
-	table = soup.find_all('table', id='participantes')[0]
-	cols = get_table_columns(table)
-
-	# Dropping unneeded columns
-	df = pd.DataFrame(columns=cols)
-	df = parse_data(df, table)
-	df = df.drop(columns=['From Previous', 'From First'])
+	if cache is None:
+		html = requests.get(url).text
+	else:
+		# Revalidates the cached page, and skips it if it has been saved before
+		page_cache = PageCache(cache)
+		page = page_cache.fetch(url)
+		if page is None:
+			if logger is not None: logger.warning(f'No results at {url}')
+			return
+		if not page.changed and not force:
+			if logger is not None: logger.info('The results have not changed since they were saved.')
+			return
+		html = page.text
+
+	df = parse_page(html)
  
-	save_results(df, output/database, category, logger, output/filename)
+	save_results(df, output/database, year, category, round, logger, output/filename)
+	if cache is not None:
+		page_cache.mark_ingested(url)
 
 
 if __name__ == "__main__":
@@ -143,6 +172,10 @@ if __name__ == "__main__":
 						help='The url to the competition results.')
 	parser.add_argument('--output', '-o', type=str, default='./results',
                      	help='The path to the directory to save the results.')
+	parser.add_argument('--no_cache', action='store_true',
+						help='Download the page without the page cache in OUTPUT/.cache.')
+	parser.add_argument('--force', action='store_true',
+						help='Parse and save the page even if it has not changed.')
 	
 	args = parser.parse_args()
 
@@ -168,5 +201,7 @@ if __name__ == "__main__":
          verbose=args.verbose,
          logger=logger,
          output=args.output,
-         filename=args.filename
+         filename=args.filename,
+         cache=None if args.no_cache else args.output/'.cache',
+         force=args.force
       )
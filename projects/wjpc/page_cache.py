@@ -0,0 +1,147 @@
+"""
+An on-disk cache of the raw results pages, to not download and parse unchanged pages again.
+
+The pages are stored by the sha256 of their content in `objects/`, and every url
+has a small json file in `meta/` with the ETag and Last-Modified headers of the
+page, the hash of its content, and the hash of the version last ingested. A page
+in the cache is revalidated with a conditional GET, so an unchanged page costs one
+304 response. Pages downloaded again, e.g. from servers without those headers,
+are compared by their hash.
+
+Usage:
+	cache = PageCache('results/.cache')
+	page = cache.fetch(url)
+	if page.changed:
+		df = parse_page(page.text)
+		...
+		cache.mark_ingested(url)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+
+from pathlib import Path
+
+
+class CachedPage:
+	"""
+	A page fetched through the `PageCache`.
+
+	Instance Variables:
+		path (Path): The cached content of the page.
+		url (str): The url of the page.
+		hash (str): The sha256 of the content of the page.
+		encoding (str): The encoding of the content.
+		status (int): 200 if the page was downloaded, 304 if the cached page was still valid.
+		changed (bool): Whether the content differs from the version last ingested.
+	"""
+	def __init__(self,
+				 path: Path,
+				 url: str,
+				 hash: str,
+				 encoding: str,
+				 status: int,
+				 changed: bool
+				) -> None:
+		self.path = path
+		self.url = url
+		self.hash = hash
+		self.encoding = encoding
+		self.status = status
+		self.changed = changed
+
+	@property
+	def content(self) -> bytes:
+		# Only read from disk when it is needed, i.e. not for unchanged pages
+		return self.path.read_bytes()
+
+	@property
+	def text(self) -> str:
+		return self.content.decode(self.encoding, errors='replace')
+
+
+class PageCache:
+	"""
+	Content-addressed on-disk cache of pages by url, see the module docstring.
+	"""
+	def __init__(self, directory: str | Path = 'results/.cache') -> None:
+		self.directory = Path(directory)
+		(self.directory/'objects').mkdir(parents=True, exist_ok=True)
+		(self.directory/'meta').mkdir(parents=True, exist_ok=True)
+
+	def get_object_path(self, hash: str) -> Path:
+		return self.directory/'objects'/f'{hash}.html'
+
+	def get_meta_path(self, url: str) -> Path:
+		name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+		return self.directory/'meta'/f'{name}.json'
+
+	def read_meta(self, url: str) -> dict:
+		try:
+			with open(self.get_meta_path(url)) as f:
+				return json.load(f)
+		except (OSError, ValueError):
+			return {}
+
+	def _write(self, path: Path, data: bytes) -> None:
+		# Written to a temporary file first, unique per thread, so a crash or
+		# another thread never leaves a torn file
+		tmp = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+		tmp.write_bytes(data)
+		os.replace(tmp, path)
+
+	def fetch(self,
+			  url: str,
+			  session: requests.Session = None,
+			  timeout: float = 30.0
+			 ) -> CachedPage | None:
+		"""
+		Returns the page at the url, from the cache if it has not changed,
+		or None if it does not exist.
+		"""
+		meta = self.read_meta(url)
+		headers = {}
+		if meta.get('hash') and self.get_object_path(meta['hash']).exists():
+			if meta.get('etag'):
+				headers['If-None-Match'] = meta['etag']
+			if meta.get('last_modified'):
+				headers['If-Modified-Since'] = meta['last_modified']
+
+		response = (session or requests).get(url, headers=headers, timeout=timeout)
+		if response.status_code == 404:
+			return None
+
+		if response.status_code != 304:
+			response.raise_for_status()
+			content = response.content
+			hash = hashlib.sha256(content).hexdigest()
+			if not self.get_object_path(hash).exists():
+				self._write(self.get_object_path(hash), content)
+			meta.update(etag=response.headers.get('ETag'),
+						last_modified=response.headers.get('Last-Modified'),
+						hash=hash,
+						encoding=response.encoding or response.apparent_encoding or 'utf-8')
+
+		meta['url'] = url
+		meta['fetched_at'] = time.time()
+		self._write(self.get_meta_path(url), json.dumps(meta).encode('utf-8'))
+
+		return CachedPage(self.get_object_path(meta['hash']),
+						  url,
+						  meta['hash'],
+						  meta['encoding'],
+						  response.status_code,
+						  meta['hash'] != meta.get('ingested'))
+
+	def mark_ingested(self, url: str) -> None:
+		"""
+		Records the last fetched version of the page as ingested, so it is skipped until it changes.
+		"""
+		meta = self.read_meta(url)
+		if 'hash' in meta:
+			meta['ingested'] = meta['hash']
+			self._write(self.get_meta_path(url), json.dumps(meta).encode('utf-8'))
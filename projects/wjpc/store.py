@@ -0,0 +1,250 @@
+"""
+A normalized sqlite3 store of the World Jigsaw Puzzle Championships results.
+
+The results of every round are split into countries, competitions (a year and
+category), rounds, participants and results, with indexes on the country, time
+and place, so queries over many years do not need to load every csv. A result is
+identified by its row in the results of the round, since the participants of
+pairs and teams, whose names are not parsed yet, can not be told apart. A round
+is ingested in one transaction with bulk upserts, and ingesting the same round
+again replaces its results and drops the participants no result refers to any
+more, so re-runs do not duplicate anything. The database is in WAL mode, so e.g.
+the dashboard can read while results are ingested.
+
+Usage:
+	with ResultsStore('results/wjpc.db') as store:
+		store.ingest(df, '2024', 'individual', 'final')
+		store.get_results(country='Norway')
+"""
+
+import logging
+import sqlite3
+import pandas as pd
+
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS countries (
+	id INTEGER PRIMARY KEY,
+	name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS competitions (
+	id INTEGER PRIMARY KEY,
+	year TEXT NOT NULL,
+	category TEXT NOT NULL,
+	UNIQUE (year, category)
+);
+CREATE TABLE IF NOT EXISTS rounds (
+	id INTEGER PRIMARY KEY,
+	competition_id INTEGER NOT NULL REFERENCES competitions (id),
+	name TEXT NOT NULL,
+	UNIQUE (competition_id, name)
+);
+CREATE TABLE IF NOT EXISTS participants (
+	id INTEGER PRIMARY KEY,
+	name TEXT NOT NULL,
+	origin TEXT NOT NULL,
+	country_id INTEGER NOT NULL REFERENCES countries (id),
+	UNIQUE (country_id, name, origin)
+);
+CREATE TABLE IF NOT EXISTS results (
+	round_id INTEGER NOT NULL REFERENCES rounds (id),
+	position INTEGER NOT NULL,
+	participant_id INTEGER NOT NULL REFERENCES participants (id),
+	place INTEGER,
+	time TEXT,
+	seconds INTEGER,
+	pieces INTEGER,
+	PRIMARY KEY (round_id, position)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS results_place ON results (round_id, place);
+CREATE INDEX IF NOT EXISTS results_seconds ON results (seconds);
+CREATE INDEX IF NOT EXISTS results_participant ON results (participant_id);
+
+CREATE VIEW IF NOT EXISTS results_view AS
+SELECT competitions.year,
+	   competitions.category,
+	   rounds.name AS round,
+	   results.place,
+	   participants.name,
+	   participants.origin,
+	   countries.name AS country,
+	   results.time,
+	   results.seconds,
+	   results.pieces
+FROM results
+JOIN rounds ON rounds.id = results.round_id
+JOIN competitions ON competitions.id = rounds.competition_id
+JOIN participants ON participants.id = results.participant_id
+JOIN countries ON countries.id = participants.country_id;
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def parse_times(times: pd.Series) -> tuple[pd.Series, pd.Series]:
+	"""
+	Parses the times of the results, "HH:MM:SS" for finishers and e.g. "480 Pieces"
+	for the ones who did not finish.
+
+	Returns:
+		tuple[pd.Series, pd.Series]: The seconds of the finishers, and the pieces of the others.
+	"""
+	times = times.astype(str).str.strip()
+	hms = times.str.extract(r'^(\d+):(\d{2}):(\d{2})$').astype(float)
+	seconds = hms[0] * 3600 + hms[1] * 60 + hms[2]
+	pieces = times.str.extract(r'(\d+)\s*Pieces', expand=False).astype(float)
+	return seconds.astype('Int64'), pieces.astype('Int64')
+
+
+def _to_params(values: pd.Series) -> list:
+	# sqlite3 takes None for missing values, not pandas' NA
+	return [None if pd.isna(v) else int(v) for v in values]
+
+
+class ResultsStore:
+	"""
+	Ingests results into the normalized sqlite3 database and queries them.
+
+	Instance Variables:
+		database (Path): The path to the database.
+		connection (sqlite3.Connection): The connection to the database.
+	"""
+	def __init__(self, database: str | Path = 'results/wjpc.db') -> None:
+		self.database = Path(database)
+		self.connection = sqlite3.connect(self.database)
+		self.connection.execute('PRAGMA journal_mode = WAL')
+		self.connection.execute('PRAGMA synchronous = NORMAL')
+		self.connection.execute('PRAGMA foreign_keys = ON')
+		self.connection.executescript(SCHEMA)
+
+	def _get_ids(self, table: str, column: str, values: list[str]) -> dict[str, int]:
+		# Upserts the names, and returns the ids of all of them
+		self.connection.executemany(
+			f'INSERT INTO {table} ({column}) VALUES (?) ON CONFLICT DO NOTHING',
+			[(value,) for value in values]
+		)
+		placeholders = ', '.join('?' * len(values))
+		rows = self.connection.execute(
+			f'SELECT {column}, id FROM {table} WHERE {column} IN ({placeholders})', values
+		)
+		return dict(rows.fetchall())
+
+	def get_round_id(self, year: str, category: str, round: str) -> int:
+		self.connection.execute(
+			'INSERT INTO competitions (year, category) VALUES (?, ?) ON CONFLICT DO NOTHING',
+			(year, category)
+		)
+		competition_id, = self.connection.execute(
+			'SELECT id FROM competitions WHERE year = ? AND category = ?', (year, category)
+		).fetchone()
+		self.connection.execute(
+			'INSERT INTO rounds (competition_id, name) VALUES (?, ?) ON CONFLICT DO NOTHING',
+			(competition_id, round)
+		)
+		round_id, = self.connection.execute(
+			'SELECT id FROM rounds WHERE competition_id = ? AND name = ?', (competition_id, round)
+		).fetchone()
+		return round_id
+
+	def ingest(self, df: pd.DataFrame, year: str, category: str, round: str) -> int:
+		"""
+		Saves the results of a round, replacing any results of the round saved before.
+
+		Arguments:
+			df (pd.DataFrame): The results, with the columns of `get_results.parse_page`.
+			year (str): The year of the championship.
+			category (str): individual, pairs or teams.
+			round (str): The round, e.g. final.
+		Returns:
+			int: The number of results of the round in the database.
+		"""
+		names = df['Name'].fillna('').astype(str).str.strip()
+		origins = df['Origin'].fillna('').astype(str).str.strip()
+		countries = df['Country'].fillna('').astype(str).str.strip()
+		places = pd.to_numeric(df['#'], errors='coerce')
+		seconds, pieces = parse_times(df['Time'])
+
+		# One transaction, which is rolled back if anything fails
+		with self.connection:
+			round_id = self.get_round_id(year, category, round)
+			country_ids = self._get_ids('countries', 'name', sorted(set(countries)))
+
+			participants = list(zip(countries.map(country_ids).tolist(), names, origins))
+			self.connection.executemany(
+				'INSERT INTO participants (country_id, name, origin) VALUES (?, ?, ?) '
+				'ON CONFLICT DO NOTHING',
+				participants
+			)
+			placeholders = ', '.join('?' * len(country_ids))
+			participant_ids = {
+				(country_id, name, origin): id
+				for id, country_id, name, origin in self.connection.execute(
+					'SELECT id, country_id, name, origin FROM participants '
+					f'WHERE country_id IN ({placeholders})', list(country_ids.values())
+				)
+			}
+			ids = [participant_ids[p] for p in participants]
+			n_shared = len(ids) - len(set(ids))
+			if n_shared:
+				logger.warning(f'{n_shared} results of {year}/{category}/{round} have the same '
+							   'name, origin and country as another, e.g. names which are not parsed')
+
+			self.connection.executemany(
+				'INSERT INTO results '
+				'(round_id, position, participant_id, place, time, seconds, pieces) '
+				'VALUES (?, ?, ?, ?, ?, ?, ?) '
+				'ON CONFLICT (round_id, position) DO UPDATE SET '
+				'participant_id = excluded.participant_id, place = excluded.place, '
+				'time = excluded.time, seconds = excluded.seconds, pieces = excluded.pieces',
+				zip([round_id] * len(ids),
+					range(len(ids)),
+					ids,
+					_to_params(places),
+					df['Time'].astype(str).str.strip(),
+					_to_params(seconds),
+					_to_params(pieces))
+			)
+			# Results of an earlier, longer version of the page
+			self.connection.execute(
+				'DELETE FROM results WHERE round_id = ? AND position >= ?', (round_id, len(ids))
+			)
+			# Participants whose results were all replaced, e.g. after a name was corrected
+			self.connection.execute(
+				'DELETE FROM participants WHERE id NOT IN (SELECT participant_id FROM results)'
+			)
+			n, = self.connection.execute(
+				'SELECT COUNT(*) FROM results WHERE round_id = ?', (round_id,)
+			).fetchone()
+
+		return n
+
+	def query(self, sql: str, params: tuple = ()) -> pd.DataFrame:
+		return pd.read_sql_query(sql, self.connection, params=params)
+
+	def get_results(self,
+					year: str = None,
+					category: str = None,
+					round: str = None,
+					country: str = None
+				   ) -> pd.DataFrame:
+		"""
+		Returns the results, optionally of one year, category, round and country, by place.
+		"""
+		filters = {'year': year, 'category': category, 'round': round, 'country': country}
+		filters = {column: value for column, value in filters.items() if value is not None}
+		where = ' AND '.join(f'{column} = ?' for column in filters) or '1'
+		return self.query(
+			f'SELECT * FROM results_view WHERE {where} ORDER BY year, category, round, place',
+			tuple(filters.values())
+		)
+
+	def close(self) -> None:
+		self.connection.close()
+
+	def __enter__(self) -> 'ResultsStore':
+		return self
+
+	def __exit__(self, *args) -> None:
+		self.close()